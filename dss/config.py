@@ -19,27 +19,64 @@ def _section_getattr_replacement(self, attr):
 configparser.SectionProxy.__getattr__ = _section_getattr_replacement
 
 
+_duration_units = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value):
+    """ Seconds from a value like "30", "30s", "5m", "1h" or "1d".
+    """
+    match = re.match(r'^\s*(\d+)\s*([smhd]?)\s*$', str(value), re.I)
+    if match is None:
+        raise ValueError('Invalid duration: {0!r}'.format(value))
+    number, unit = match.groups()
+    return int(number) * _duration_units[unit.lower()]
+
+
 class Parser(configparser.ConfigParser):
 
     def __init__(self, *args, **kw):
         kw.setdefault('interpolation', configparser.ExtendedInterpolation())
         super(Parser, self).__init__(*args, **kw)
 
-    def get_split_basic(self, section, option, char=None):
-        return self.get(section, option).split(char)
+    def get_split_basic(self, section, option, char=None, **kw):
+        return self.get(section, option, **kw).split(char)
 
-    def get_split(self, section, option, chars=string.whitespace, extra=','):
-        value = self.get(section, option)
+    def get_split(self, section, option, chars=string.whitespace, extra=',',
+                  **kw):
+        value = self.get(section, option, **kw)
         if extra:
             chars += extra
         return re.split('[%s]' % re.escape(chars), value)
 
-    def get_list(self, section, option):
-        value = self.get(section, option)
+    def get_list(self, section, option, **kw):
+        value = self.get(section, option, **kw)
         return pseudo_list.load(value)
 
-    def get_multiline_list(self, section, option):
-        value = self.get(section, option)
+    _size_units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+    def get_size(self, section, option, **kw):
+        """ Integer amount of bytes from a value like "512", "64K" or "1M".
+        """
+        value = self.get(section, option, **kw)
+        match = re.match(r'^\s*(\d+)\s*([KMG]?)B?\s*$', str(value), re.I)
+        if match is None:
+            raise ValueError('Invalid size for {0}.{1}: {2!r}'.format(
+                section, option, value))
+        number, unit = match.groups()
+        return int(number) * self._size_units[unit.upper()]
+
+    def get_duration(self, section, option, **kw):
+        """ Seconds from a value like "30", "30s", "5m", "1h" or "1d".
+        """
+        value = self.get(section, option, **kw)
+        try:
+            return parse_duration(value)
+        except ValueError:
+            raise ValueError('Invalid duration for {0}.{1}: {2!r}'.format(
+                section, option, value))
+
+    def get_multiline_list(self, section, option, **kw):
+        value = self.get(section, option, **kw)
         return [pseudo_list.load(x) for x in value.splitlines() if x.strip()]
 
     def read(self, filenames, encoding=None):
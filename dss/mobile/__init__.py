@@ -12,6 +12,7 @@ from dss.tools.show import Show
 from dss.config import config
 from dss.storage import db
 from .handler import MediaHandler
+from .async_handler import IOLoopTCPServer
 
 show = Show('Mobile')
 
@@ -30,10 +31,20 @@ class TCPServer(object):
     def __init__(self):
         self.host = config.get('local', 'addr')
         self.port = config.getint('local', 'tcp_port')
+        self.mode = config.get('mobile', 'server')
         self.cond = thread.Condition()
         self._server = None
 
     def start(self, create_thread=True):
+        if self.mode == 'ioloop':
+            # Served by the IOLoop of the HTTP server unless asked to
+            # run by itself.
+            self._server = IOLoopTCPServer((self.host, self.port))
+            show('Listening at {0.host}:{0.port} (tcp, ioloop)'.format(self))
+            if not create_thread:
+                self._server.serve_forever()
+            return self
+
         if not create_thread:
             self.run_server()
             return
@@ -53,5 +64,6 @@ class TCPServer(object):
 
     def stop(self):
         self._server.is_running = False
-        MediaHandler.wait_handlers()
+        if self.mode != 'ioloop':
+            MediaHandler.wait_handlers()
         self._server.shutdown()
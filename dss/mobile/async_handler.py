@@ -0,0 +1,283 @@
+""" Mobile stream handling on the Tornado IOLoop.
+
+    All connections are served by a single thread. The media is written
+    to the pipes without blocking and the socket stops being read while
+    FFmpeg is not consuming the data fast enough.
+"""
+import datetime
+import functools
+import traceback
+from concurrent import futures
+
+from tornado import gen, tcpserver
+from tornado.ioloop import IOLoop
+from tornado.iostream import PipeIOStream, StreamClosedError
+
+from dss.config import config
+from dss.tools.budget import BudgetExceeded
+from dss.tools.serial import SerialExecutor
+from dss.tools.show import Show
+
+from .enum import ContentType, DataContent
+from .const import WAIT_TIMEOUT, HEADER_SIZE
+from .handler import BaseMediaHandler
+from .processing.data import DataProc
+
+show = Show('Mobile')
+
+# Database access and file operations must not block the IOLoop.
+# The calls of each stream run in order on its `SerialExecutor`.
+executor = futures.ThreadPoolExecutor(config['mobile'].getint('workers'))
+
+wait_timeout = datetime.timedelta(seconds=WAIT_TIMEOUT)
+
+
+def log_error(future):
+    """ Done callback of the calls nobody waits for.
+    """
+    error = None if future.cancelled() else future.exception()
+    if error is not None:
+        show.error(''.join(traceback.format_exception(
+            type(error), error, getattr(error, '__traceback__', None))))
+
+
+class PipeWriter(object):
+    """ Non blocking writer for a media pipe.
+        Data is buffered by the IOStream and charged on the stream budget
+        until written. `add_data` returns a future to wait for when
+        the budget soft limit is crossed.
+    """
+    def __init__(self, pipe, name, budget):
+        self.stream = PipeIOStream(pipe)
+        self.name = name
+        self.budget = budget
+        self.queued = 0
+        self.written = 0
+        self.closed = False
+
+    def add_data(self, data):
+        self.budget.add(len(data))
+        self.queued += len(data)
+        future = self.stream.write(data)
+        future.add_done_callback(functools.partial(self._written, self.queued))
+        if self.budget.over_soft_limit:
+            return future
+        return None
+
+    def _written(self, position, future):
+        # Futures may finish together, so only count new positions.
+        # After closing, the whole budget is released by the handler.
+        if not self.closed and position > self.written:
+            self.budget.remove(position - self.written)
+            self.written = position
+
+    def stop(self):
+        self.closed = True
+        self.stream.close()
+
+
+class IOLoopMediaHandler(BaseMediaHandler):
+    """ Mobile stream handler for `IOLoopTCPServer`.
+    """
+    # User data is processed on the executor instead of a `DataProc` thread.
+    data_queue = None
+
+    def __init__(self, stream, client_address, server):
+        self.request = stream
+        self.client_address = client_address
+        self.server = server
+        self.io_loop = IOLoop.current()
+        self.executor = SerialExecutor(executor)
+        self._closed = False
+        self.setup()
+
+    @gen.coroutine
+    def handle(self):
+        self.add_handler()
+        try:
+            yield self._handle()
+        except Exception:
+            show.error(traceback.format_exc())
+        finally:
+            self.close()
+
+    @gen.coroutine
+    def _handle(self):
+        # Read the first data block.
+        try:
+            typ, payload = yield self.read_data()
+        except (StreamClosedError, gen.TimeoutError):
+            return
+        if not self.check_first_block(typ):
+            return
+
+        yield self.executor.submit(self.register, payload)
+        self.send_data(ContentType.meta, {'id': str(self._id)})
+
+        try:
+            audio_pipe, video_pipe = yield self.executor.submit(
+                self.create_pipes)
+        except OSError as e:
+            show.error('Failed to create pipe:', e)
+            return
+
+        self.audio = PipeWriter(audio_pipe, 'audio', self.budget)
+        self.video = PipeWriter(video_pipe, 'video', self.budget)
+        self.data_handler = DataProc(self)
+
+        args = self.make_cmd()
+
+        # Start the timer for alarm
+        if self._time_limit:
+            self.timer = self.io_loop.call_later(self._time_limit,
+                                                 self.timer_alarm)
+
+        self.proc = self.open_proc(args)
+
+        yield self.handle_proc_loop()
+
+    @gen.coroutine
+    def handle_proc_loop(self):
+        """ Read data from the socket until the client stops sending
+            data or the transcoding process finishes.
+        """
+        while self.server.is_running \
+                and not self._timer_alarm \
+                and not self.error \
+                and self.proc.poll() is None:
+            try:
+                type, payload = yield self.read_data()
+            except (StreamClosedError, gen.TimeoutError):
+                show.warn('Timeout')
+                break
+
+            if not self.run:
+                break
+
+            yield self.handle_content(type, payload)
+
+        if self._timer_alarm:
+            show('Stream finished due to time limit: {0} seconds'.format(self._time_limit))
+
+    @gen.coroutine
+    def handle_content(self, type, payload):
+        try:
+            type = DataContent[type]
+        except KeyError:
+            show.warn('Invalid header type "%s"' % type)
+
+        if type in (DataContent.metadata, DataContent.userdata):
+            self.submit(self.data_handler.process, type, payload)
+        elif type in (DataContent.video, DataContent.audio):
+            media = self.video if type is DataContent.video else self.audio
+            try:
+                future = media.add_data(payload)
+            except BudgetExceeded as e:
+                show.warn('Dropping stream:', e)
+                self.error = e
+                return
+            except StreamClosedError as e:
+                show('Pipe closed:', media.name)
+                self.error = e
+                return
+            if future is not None:
+                # Stop reading the socket until FFmpeg catches up.
+                try:
+                    yield gen.with_timeout(wait_timeout, future)
+                except gen.TimeoutError as e:
+                    show('Low Bandwidth:', media.name)
+                    self.error = e
+                except StreamClosedError as e:
+                    show('Pipe closed:', media.name)
+                    self.error = e
+        else:
+            show.warn('Unknown content received: ' +
+                      'Type: {0}, Payload: {1!r}'.format(type, payload))
+
+    def submit(self, fn, *args):
+        """ Run `fn(*args)` on the stream executor without waiting for it.
+            Errors are logged.
+        """
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(log_error)
+        return future
+
+    @gen.coroutine
+    def read_data(self):
+        """ Read next packet from the stream.
+            Refer to the "BaseMediaHandler" doc for the packet description.
+        """
+        header = yield self._read(HEADER_SIZE)
+        typ, size = self.process_header(header)
+        payload = yield self._read(size)
+        raise gen.Return((typ, payload))
+
+    def _read(self, size):
+        return gen.with_timeout(wait_timeout, self.request.read_bytes(size))
+
+    def write_data(self, data_type, data, as_metadata=False):
+        self.request.write(self.build_packet(data_type, data, as_metadata))
+
+    def close(self, wait=False):
+        """ Finish the connection and the transcoding process.
+            The rest of the cleanup runs on the executor unless `wait` is set.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        if self.timer is not None:
+            self.io_loop.remove_timeout(self.timer)
+            self.timer = None
+
+        # Streams must be closed on the IOLoop thread.
+        self.request.close()
+        for media in (self.audio, self.video):
+            if media is not None:
+                media.stop()
+        self.audio = self.video = None
+
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                self.proc.kill()
+                self.proc.wait()
+            except OSError:
+                pass
+
+        if wait:
+            self.finish()
+        else:
+            self.submit(self.finish)
+
+
+class IOLoopTCPServer(tcpserver.TCPServer):
+    """ Same interface of `socketserver.TCPServer` used by
+        `dss.mobile.TCPServer`, but listening on the IOLoop.
+    """
+    is_running = False
+
+    def __init__(self, server_address):
+        super(IOLoopTCPServer, self).__init__()
+        self.server_address = server_address
+        self._serving = False
+        self.listen(server_address[1], server_address[0])
+        self.is_running = True
+
+    def handle_stream(self, stream, address):
+        return IOLoopMediaHandler(stream, address, self).handle()
+
+    def serve_forever(self):
+        """ Run the IOLoop on the current thread. This is only needed
+            when it is not started elsewhere (e.g. by the HTTP server).
+        """
+        self._serving = True
+        IOLoop.current().start()
+
+    def shutdown(self):
+        self.is_running = False
+        self.stop()
+        for handler in IOLoopMediaHandler.handlers():
+            if isinstance(handler, IOLoopMediaHandler):
+                handler.close(wait=True)
+        if self._serving:
+            IOLoop.current().stop()
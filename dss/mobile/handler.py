@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from __future__ import division
 import os
+import sys
 import json
 import struct
 import tempfile
@@ -8,6 +9,7 @@ import shutil
 import datetime
 import traceback
 import time
+import warnings
 from bson.objectid import ObjectId
 
 try:
@@ -22,6 +24,7 @@ except ImportError:
 
 
 from dss.tools import buffer, thread, process, ffmpeg, Suppress
+from dss.tools.budget import ByteBudget
 from dss.tools.os import set_pipe_max_size
 from dss.tools.show import Show
 from dss.config import config
@@ -36,9 +39,17 @@ from .processing.data import DataProc
 show = Show('Mobile')
 
 rtmpconf = config['rtmp-server']
+mobileconf = config['mobile']
 
+# Media waiting to be consumed by FFmpeg on all streams.
+memory_budget = ByteBudget(
+    mobileconf.get_size('memory_soft_limit'),
+    mobileconf.get_size('memory_limit'),
+    name='mobile',
+)
 
-class MediaHandler(socketserver.BaseRequestHandler, object):
+
+class BaseMediaHandler(object):
     """  Packet header description
 
         The packet header will provide the type of payload data, and the size.
@@ -51,6 +62,9 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
 
         Currently we envision just 4 types of messages:
         Metadata, Video, Audio and User generated data.
+
+        This class has the parts of the protocol that do not depend on
+        how the connection is served.
     """
 
     provider_prefix = 'M'
@@ -58,6 +72,15 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
     _handlers_lock = thread.Lock()
     _time_limit = config.getint('mobile', 'time_limit')
 
+    # How media reaches FFmpeg:
+    #   fifo - Named pipes on a temporary directory.
+    #   pipe - Anonymous pipes inherited by the process (Python 3.2+).
+    pipeline = mobileconf['pipeline']
+    if pipeline == 'pipe' and sys.version_info < (3, 2):
+        warnings.warn('Mobile pipeline "pipe" requires Python 3.2+. '
+                      'Using "fifo" instead.', RuntimeWarning)
+        pipeline = 'fifo'
+
     def setup(self):
         self._id = None
         self.run = True
@@ -67,12 +90,16 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
         self.destination_url = None
         self.data_processing = None
         self.thumbnail_path = None
-        self.buffer = buffer.Buffer(self.request)
-        self.data_queue = queue.Queue()
-        self.tmpdir = tempfile.mkdtemp(dir=config['mobile']['dir'])
+        self.tmpdir = None
+        self._inputs = None
+        self._pass_fds = ()
+        self.budget = ByteBudget(
+            mobileconf.get_size('queue_soft_limit'),
+            mobileconf.get_size('queue_hard_limit'),
+            parent=memory_budget,
+        )
         self._timer_alarm = False
-        self.timer = thread.Timer(self._time_limit, self.timer_alarm) \
-            if self._time_limit else None
+        self.timer = None
         self._error = []
         self.__cleanup_executed = False
 
@@ -84,6 +111,11 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
         with self._handlers_lock:
             self._handlers.remove(self)
 
+    @classmethod
+    def handlers(cls):
+        with cls._handlers_lock:
+            return list(cls._handlers)
+
     @property
     def error(self):
         return self._error
@@ -123,17 +155,21 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
         if self.timer is not None:
             self.timer.cancel()
 
-        # Stop all threads
-        with s: self.audio.stop()
-        with s: self.video.stop()
-        with s: self.data_processing.stop()
+        # Stop all workers
+        for worker in (self.audio, self.video, self.data_processing):
+            if worker is not None:
+                with s: worker.stop()
+
+        # Release memory of data not consumed
+        self.budget.close()
 
         # Remove entry from database
         if self._id:
             db.mobile.update({'_id': self._id}, {'$set': {'active': False}})
 
         # Remove temp directory and thumbnail
-        with s: shutil.rmtree(self.tmpdir)
+        if self.tmpdir is not None:
+            with s: shutil.rmtree(self.tmpdir)
         with s: os.remove(self.thumbnail_path)
 
         WebsocketBroadcast.select('mobile_location').cls.broadcast_message({
@@ -154,60 +190,94 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
         finally:
             self.remove_handler()
 
-    def handle(self):
-        try:
-            self._handle()
-        except BaseException:
-            show.error(traceback.format_exc())
-            raise
+    def check_first_block(self, typ):
+        """ The first data block should have complete metadata information
+            with at least the provided id, if it is known (or falsy value
+            otherwise)
+        """
+        typ = DataContent[typ]
+        if typ is not DataContent.metadata:
+            show.error('Received first data block of type {0.name!r}({0.value}).\n'
+                       'Expected {1.name!r}({1.value})', typ, DataContent.metadata)
+            return False
+        return True
 
-    def _handle(self):
-        self.request.settimeout(WAIT_TIMEOUT)
-        self.add_handler()
+    def register(self, payload):
+        """ Save the stream on database from the first metadata block.
+            A new id is created if the one provided is not valid.
+        """
         db_data = {'start': datetime.datetime.utcnow(),
                    'active': True}
 
-        # Read the first data block.
-        # It should have complete metadata information with at least the
-        # provided id, if it is known (or falsy value otherwise)
-        typ, payload = self.read_data()
-        typ = DataContent[typ]
-        if typ is DataContent.metadata:
-            action, payload = DataProc.decode_data(payload)
-            try:
-                self._id = ObjectId(payload['id'])
-            except Exception:
-                pass
-        else:
-            show.error('Received first data block of type {0.name!r}({0.value}).\n'
-                       'Expected {1.name!r}({1.value})', typ, DataContent.metadata)
-            return
+        action, payload = DataProc.decode_data(payload)
+        try:
+            self._id = ObjectId(payload['id'])
+        except Exception:
+            pass
 
         response = db.mobile.update({'_id': self._id}, db_data, upsert=True)
         self._id = response.get('upserted', self._id)
-        self.send_data(ContentType.meta, {'id': str(self._id)})
         self.destination_url = os.path.join(
             rtmpconf['addr'], rtmpconf['app'], self.get_stream_name()
         )
         show('New mobile stream:', self.destination_url)
 
-        audio_filename = self.file('audio.ts')
-        video_filename = self.file('video.ts')
-        try:
-            os.mkfifo(audio_filename)
-            os.mkfifo(video_filename)
-        except OSError as e:
-            show.error('Failed to create FIFO:', e)
-            return
+    def create_pipes(self):
+        """ Create the audio and video pipes to feed the transcoding
+            process and return the file descriptors to write on.
+        """
+        if self.pipeline == 'pipe':
+            audio_read, audio_pipe = os.pipe()
+            video_read, video_pipe = os.pipe()
+            self._pass_fds = (audio_read, video_read)
+            self._inputs = ['pipe:{0}'.format(fd) for fd in self._pass_fds]
+        else:
+            self.tmpdir = tempfile.mkdtemp(dir=mobileconf['dir'])
+            self._inputs = [self.file('audio.ts'), self.file('video.ts')]
+            for name in self._inputs:
+                os.mkfifo(name)
+            audio_pipe = os.open(self._inputs[0], os.O_RDWR)
+            video_pipe = os.open(self._inputs[1], os.O_RDWR)
 
-        audio_pipe = os.open(audio_filename, os.O_RDWR)
-        video_pipe = os.open(video_filename, os.O_RDWR)
         set_pipe_max_size(audio_pipe, video_pipe)
+        return audio_pipe, video_pipe
 
-        self.audio = Media(audio_pipe, self, 'audio').start()
-        self.video = Media(video_pipe, self, 'video').start()
-        self.data_processing = DataProc(self).start()
+    @property
+    def pipe_readable(self):
+        """ FIFOs are opened for reading and writing, so they can be
+            drained when FFmpeg stops consuming them.
+        """
+        return self.pipeline == 'fifo'
+
+    def open_proc(self, args):
+        """ Start the transcoding process with its output logged.
+            The reading end of anonymous pipes is only kept open by it.
+        """
+        kw = {}
+        if self._pass_fds:
+            kw['pass_fds'] = self._pass_fds
 
+        if self.tmpdir is not None:
+            out_name = self.file('proc_output')
+            err_name = self.file('proc_err')
+        else:
+            out_name = os.devnull
+            err_name = process.log_file(self.get_stream_name(), 'mobile')
+
+        try:
+            with open(out_name, 'w') as out:
+                with open(err_name, 'w') as err:
+                    return process.Popen(args, stdout=out, stderr=err, **kw)
+        finally:
+            for fd in self._pass_fds:
+                os.close(fd)
+            self._pass_fds = ()
+
+    def make_cmd(self):
+        """ FFmpeg command reading from the pipes, publishing to the RTMP
+            server and updating the stream thumbnail.
+            Must be called after `create_pipes`.
+        """
         thumb = config['thumbnail']
         self.thumbnail_path = os.path.join(
             thumb['dir'], self.get_stream_name()
@@ -215,43 +285,137 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
 
         thumb_rate = str(1. / int(thumb['mobile_interval']))
 
-        args = ffmpeg.cmd_inputs_outputs(
-            '-y -re', [audio_filename, video_filename], '',
+        return ffmpeg.cmd_inputs_outputs(
+            '-y -re', self._inputs, '',
             ['-c:v copy -c:a copy -bsf:a aac_adtstoasc -f flv',
-             '-r ' + thumb_rate + ' -update 1 -an'],
+             '-r ' + thumb_rate + ' -update 1 -an ' + thumb['file_opt']],
             [self.destination_url, self.thumbnail_path]
         )
 
+    def process_header(self, data):
+        """ Strips out the header
+            Takes away the header data and returns it as a tuple of values.
+        """
+        return struct.unpack_from('!BI', data)
+
+    @classmethod
+    def build_metadata(cls, type, content):
+        data = {'type': type.name, 'content': content}
+        return json.dumps(data).encode('utf-8')
+
+    def send_data(self, type, content):
+        # Deprecated. Use write_data directly
+        self.write_data(type, content, as_metadata=True)
+
+    def build_packet(self, data_type, data, as_metadata=False):
+        if as_metadata:
+            data = self.build_metadata(data_type, data)
+            data_type = DataContent.metadata
+
+        header = struct.pack('!BI', data_type.value, len(data))
+        return header + data
+
+    def write_data(self, data_type, data, as_metadata=False):
+        raise NotImplementedError
+
+    def get_stream_name(self):
+        return self.stream_name(self._id)
+
+    def metric(self):
+        data = self.budget.metric()
+        data['id'] = self.get_stream_name()
+        return data
+
+    @classmethod
+    def global_metric(cls):
+        data = memory_budget.metric()
+        data['id'] = cls.provider_prefix
+        data['streams'] = len(cls._handlers)
+        return data
+
+    @classmethod
+    def stream_name(cls, id):
+        return cls.provider_prefix + '_' + str(id)
+
+
+class MediaHandler(BaseMediaHandler, socketserver.BaseRequestHandler):
+    """ Mobile stream handler with one thread for the connection and one
+        for each media and data processing.
+    """
+
+    def setup(self):
+        super(MediaHandler, self).setup()
+        self.buffer = buffer.Buffer(self.request)
+        self._header = bytearray(HEADER_SIZE)
+        self.data_queue = queue.Queue()
+        self.timer = thread.Timer(self._time_limit, self.timer_alarm) \
+            if self._time_limit else None
+
+    def handle(self):
+        try:
+            self._handle()
+        except BaseException:
+            show.error(traceback.format_exc())
+            raise
+
+    def _handle(self):
+        self.request.settimeout(WAIT_TIMEOUT)
+        self.add_handler()
+
+        # Read the first data block.
+        typ, payload = self.read_data()
+        if not self.check_first_block(typ):
+            return
+
+        self.register(payload)
+        self.send_data(ContentType.meta, {'id': str(self._id)})
+
+        try:
+            audio_pipe, video_pipe = self.create_pipes()
+        except OSError as e:
+            show.error('Failed to create pipe:', e)
+            return
+
+        release = self.pipe_readable
+        self.audio = Media(audio_pipe, self, 'audio', release).start()
+        self.video = Media(video_pipe, self, 'video', release).start()
+        self.data_processing = DataProc(self).start()
+
+        args = self.make_cmd()
+
         # Start the timer for alarm
         if self.timer is not None:
             self.timer.start()
 
-        with self.file('proc_output', 'w') as out:
-            with self.file('proc_err', 'w') as err:
-                self.handle_proc_loop(args, out, err)
+        with self.open_proc(args) as self.proc:
+            self.handle_proc_loop()
 
-    def handle_proc_loop(self, proc_args, stdout, stderr):
-        """ Open transcoding process and read data from buffer
-            until the client stops sending data.
+    def handle_proc_loop(self):
+        """ Read data from buffer until the client stops sending data
+            or the transcoding process finishes.
         """
-        with process.Popen(proc_args, stdout=stdout, stderr=stderr) as self.proc:
-            while self.server.is_running \
-                    and not self._timer_alarm \
-                    and not self.error \
-                    and self.proc.poll() is None:
-                try:
-                    type, payload = self.read_data()
-                except Exception:
-                    show.warn('Timeout')
-                    break
+        while self.server.is_running \
+                and not self._timer_alarm \
+                and not self.error \
+                and self.proc.poll() is None:
+            # Stop reading while too much data waits to be consumed.
+            if not self.budget.wait(WAIT_TIMEOUT):
+                show('Low Bandwidth: FFmpeg is not consuming data')
+                break
+
+            try:
+                type, payload = self.read_data()
+            except Exception:
+                show.warn('Timeout')
+                break
 
-                if not self.run or type is None:
-                    break
+            if not self.run or type is None:
+                break
 
-                self.handle_content(type, payload)
+            self.handle_content(type, payload)
 
-            if self._timer_alarm:
-                show('Stream finished due to time limit: {0} seconds'.format(self._time_limit))
+        if self._timer_alarm:
+            show('Stream finished due to time limit: {0} seconds'.format(self._time_limit))
 
     def handle_content(self, type, payload):
         try:
@@ -269,46 +433,22 @@ class MediaHandler(socketserver.BaseRequestHandler, object):
             show.warn('Unknown content received: ' +
                       'Type: {0}, Payload: {1!r}'.format(type, payload))
 
-    def process_header(self, data):
-        """ Strips out the header
-            Takes away the header data and returns it as a tuple of values.
-        """
-        size = struct.unpack('!I', data[1:])
-        return data[0], size[0]
-
     def read_data(self):
         """ Read next packet from buffer.
-            Refer to the "MediaHandler" doc for the packet description.
+            Refer to the "BaseMediaHandler" doc for the packet description.
+
+            The header is read into a reusable block and the payload is
+            received directly into its own `bytearray`, which is the only
+            copy made before it reaches `Media.add_data`.
         """
-        buff = self.buffer.read(HEADER_SIZE)
-        if not buff:
+        header = self._header
+        if self.buffer.read_into(header) < HEADER_SIZE:
             return None, None
-        typ, size = self.process_header(buff)
-        payload = self.buffer.read(size)
-        if not payload:
+        typ, size = self.process_header(header)
+        payload = bytearray(size)
+        if self.buffer.read_into(payload) < size:
             return None, None
         return typ, payload
 
-    @classmethod
-    def build_metadata(cls, type, content):
-        data = {'type': type.name, 'content': content}
-        return json.dumps(data).encode('utf-8')
-
-    def send_data(self, type, content):
-        # Deprecated. Use write_data directly
-        self.write_data(type, content, as_metadata=True)
-
     def write_data(self, data_type, data, as_metadata=False):
-        if as_metadata:
-            data = self.build_metadata(data_type, data)
-            data_type = DataContent.metadata
-
-        header = struct.pack('!BI', data_type.value, len(data))
-        self.request.sendall(header + data)
-
-    def get_stream_name(self):
-        return self.stream_name(self._id)
-
-    @classmethod
-    def stream_name(cls, id):
-        return cls.provider_prefix + '_' + str(id)
+        self.request.sendall(self.build_packet(data_type, data, as_metadata))
@@ -35,19 +35,24 @@ class DataProc(thread.Thread):
             data = self.queue.get()
             if data is None:
                 break
-            type, payload = data
-            action, content = self.decode_data(payload)
+            self.process(*data)
 
-            if type is DataContent.userdata:
-                fn = getattr(self, '_handle_' + action, None)
-                if fn is None:
-                    show('Warning: action not found for user content of type', repr(action))
-                else:
-                    fn(content)
+    def process(self, type, payload):
+        """ Handle a single data block.
+            This may also be called without starting the thread.
+        """
+        action, content = self.decode_data(payload)
 
-            elif type is DataContent.metadata:
-                # TODO Handle metadata
-                show('Metadata:', repr(data))
+        if type is DataContent.userdata:
+            fn = getattr(self, '_handle_' + action, None)
+            if fn is None:
+                show('Warning: action not found for user content of type', repr(action))
+            else:
+                fn(content)
+
+        elif type is DataContent.metadata:
+            # TODO Handle metadata
+            show('Metadata:', repr((type, payload)))
 
     def _handle_coord(self, data):
 
@@ -4,8 +4,9 @@ try:
 except ImportError:
     import queue
 
-from dss.tools.os import pipe_nonblock_read, PIPE_SIZE
+from dss.tools.os import pipe_nonblock_read, write_all, PIPE_SIZE, IOV_MAX
 from dss.tools import thread
+from dss.tools.budget import BudgetExceeded
 from dss.tools.show import Show
 from ..const import WAIT_TIMEOUT, DEFAULT_PIPE_SIZE
 
@@ -16,20 +17,24 @@ class Media(thread.Thread):
     # If it takes too long to retrieve data from queue,
     timeout = WAIT_TIMEOUT
 
-    # If the queue gets too big, there is a problem with the transcoding
-    # process consuming it. The process should end.
-    # With preliminary tests on 4K video, the queue can grow much bigger than 50.
-    # Optimally, this shold be based on video bitrate
-    queue_limit = 50000
+    # Maximum amount of packets written at once.
+    batch_size = IOV_MAX
 
-    def __init__(self, pipe, parent, name=None, queue_limit=None):
+    def __init__(self, pipe, parent, name=None, release=True):
+        """ If the pipe is not opened for reading, it cannot be drained
+            when stopping (`release` must be false). Writing on it will
+            fail instead of blocking when the transcoding process ends.
+        """
         super(Media, self).__init__(name=name)
         self.pipe = pipe
+        self.release = release
         self.parent = parent
         self._run = True
-        if queue_limit is not None:
-            self.queue_limit = queue_limit
-        self.queue = queue.Queue(self.queue_limit)
+        # The queue size is limited by the amount of bytes on the stream
+        # budget. If it gets too big, there is a problem with the
+        # transcoding process consuming it and the stream should end.
+        self.budget = parent.budget
+        self.queue = queue.Queue()
         self.lock = thread.RLock()
         self.write_lock = thread.Lock()
         self.daemon = False
@@ -49,14 +54,40 @@ class Media(thread.Thread):
             if data is None:
                 break
 
-            with self.write_lock:
-                os.write(self.pipe, data)
+            batch, finished = self.get_batch(data)
+            try:
+                with self.write_lock:
+                    write_all(self.pipe, batch)
+            except OSError as e:
+                self.set_error(e)
+                show('Pipe closed:', self.name)
+                break
+            self.budget.remove(sum(len(x) for x in batch))
+            if finished:
+                break
+
+    def get_batch(self, data):
+        """ Gather everything available on the queue after `data` to
+            be written with a single system call.
+            Return the list of data and if the end of queue was reached.
+        """
+        batch = [data]
+        while len(batch) < self.batch_size:
+            try:
+                data = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if data is None:
+                return batch, True
+            batch.append(data)
+        return batch, False
 
     def stop(self):
         with self.lock:
             self._run = False
         self.queue.empty()
-        self.release_pipe()
+        if self.release:
+            self.release_pipe()
         self.queue.put(None)
         self.join()
         os.close(self.pipe)
@@ -69,10 +100,11 @@ class Media(thread.Thread):
 
     def add_data(self, data):
         try:
-            self.queue.put_nowait(data)
-        except queue.Full as e:
+            self.budget.add(len(data))
+        except BudgetExceeded as e:
             self.set_error(e)
             raise
+        self.queue.put_nowait(data)
 
     def release_pipe(self):
         # Set the pipe non blocking for reading
@@ -87,5 +119,5 @@ class Media(thread.Thread):
                 break
         else:
             self.write_lock.release()
-        show.debug('Read {0} bytes from {1!r} pipe'.format(read_size, self.name))
+        show.debug('Read', read_size, 'bytes from', repr(self.name), 'pipe')
         return read_size
\ No newline at end of file
@@ -2,6 +2,7 @@ import glob
 import os
 import re
 import sys
+from concurrent import futures
 
 try:
     from collections import OrderedDict
@@ -10,6 +11,7 @@ except ImportError:
 
 from .config import Parser, config, dirname
 from .tools import ffmpeg
+from .tools.flight import SingleFlight
 from . import loader
 from . import recorder
 
@@ -31,17 +33,23 @@ class BaseStreamProvider(object):
     ) + '{0}'
     _stream_list = None
     _stream_data = None
+    _initialized = False  # Set after the whole lazy initialization
+    template = None  # `ffmpeg.Template` made from `conf` options
+
+    @classmethod
+    def make_template(cls):
+        return ffmpeg.Template(cls.conf['input_opt'], cls.conf['output_opt'])
 
     @classmethod
     def make_cmd(cls, id):
         """ Generate FFmpeg command to fetch video from
             remote source.
         """
+        if cls.template is None:
+            cls.template = cls.make_template()
         stream = cls.get_stream(id)
-        return ffmpeg.cmd(
-            cls.conf['input_opt'],
+        return cls.template(
             cls.in_stream.format(stream),
-            cls.conf['output_opt'],
             cls.out_stream.format(id),
         )
 
@@ -51,11 +59,16 @@ class BaseStreamProvider(object):
             cls.execute_lazy_initialization()
         return cls._stream_list
 
+    @classmethod
+    def initialized(cls):
+        return cls._initialized
+
     @classmethod
     def execute_lazy_initialization(cls):
         cls._stream_data = cls.lazy_initialization()
         cls._stream_list = list(cls._stream_data)
         cls.post_initialization()
+        cls._initialized = True
 
     @classmethod
     def lazy_initialization(cls):
@@ -166,6 +179,11 @@ class Providers(object):
     _all = {}
     _enabled = {}
 
+    # Lazy initialization may download the streams or query the database,
+    # so it runs on these threads instead of the caller's.
+    _flight = SingleFlight(futures.ThreadPoolExecutor(
+        config['providers'].getint('init_workers')))
+
     @classmethod
     def values(cls):
         return cls._enabled.values()
@@ -187,6 +205,21 @@ class Providers(object):
             id = None
         return cls._enabled[id]
 
+    @classmethod
+    def initialize(cls, provider):
+        """ Future of the lazy initialization of `provider` on the provider
+            threads, shared by concurrent callers, or None if it is already
+            initialized.
+        """
+        if provider.initialized():
+            return None
+        return cls._flight.run(provider.identifier, cls._initialize, provider)
+
+    @staticmethod
+    def _initialize(provider):
+        if not provider.initialized():
+            provider.execute_lazy_initialization()
+
     @classmethod
     def enable(cls, identifier):
         """ Enable a provider based on text identifier.
@@ -341,6 +374,7 @@ class Providers(object):
             stream_data = fetch_function()
             attr['_stream_data'] = stream_data
             attr['_stream_list'] = list(stream_data)
+            attr['_initialized'] = True
 
         confb = conf['base']
         attr.update(
@@ -361,6 +395,7 @@ class Providers(object):
             cls_name = cls_name.encode('utf-8')
 
         provider = type(cls_name, (cls_,), attr)
+        provider.template = provider.make_template()
         cls.add_recorder(provider, conf)
 
         cls._insert(provider, auto_enable)
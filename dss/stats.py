@@ -1,183 +1,850 @@
-import collections
+from __future__ import division
+import array
+import re
 import time
 import makeobj
+import pymongo
+from .config import config, parse_duration
 from .tools import thread
+from .tools.metrics import Histogram
+from .tools.show import Show
 
+show = Show('Stats')
 
-class Stats(thread.LockedObject):
 
-    def __init__(self, total=0, measure=0):
-        super(Stats, self).__init__()
-        self.total = total
-        self.measure = measure
+class StatusTiming(makeobj.Obj):
+    STOPPED, STARTED, ON, DIED = makeobj.keys(4)
+
+
+class _Locks(object):
+    """ Acquire all `locks`, in order.
+    """
+    def __init__(self, locks):
+        self.locks = locks
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+
+    def __exit__(self, *args):
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+class StatsTable(object):
+    """ Stats of all streams as a structure of arrays, with a slot (index
+        on every column) for each stream.
+
+        Updates of a slot are serialized by its lock (`slot_lock`), one
+        of `stripes` shared by every `stripes`-th slot and held only for
+        a few assignments, so writers of different streams rarely wait
+        for each other. The history has its own lock. `lock` acquires
+        all of them: `snapshot` copies the columns at once, so the stats
+        of thousands of streams are read with a single acquisition and
+        computed without locking each stream. The rows of a few slots
+        are copied alone.
+    """
+    # Column name -> array type code
+    types = {
+        'thumbnail_total': 'l',
+        'thumbnail_count': 'l',
+        'linger_total': 'l',
+        'linger_count': 'l',
+        'linger_time': 'd',
+        'status': 'b',
+        'uptime': 'd',
+        'total': 'd',
+        'last_start': 'd',
+        'last_shutdown': 'd',  # Zero is no shutdown
+        'death_count': 'l',
+        'restart_count': 'l',
+        'crash_loop_count': 'l',
+        'backoff': 'd',
+        'warmup_count': 'l',
+        'viewers': 'l',
+        'demand': 'd',
+        'demand_time': 'd',
+        'half_life': 'd',
+        'warm': 'b',
+        'history_time': 'd',  # Time the status was added to the history
+    }
+    warmup_size = 10  # Warmup times kept for the mean of each stream
+    stripes = 16
+
+    def __init__(self, history=None):
+        self.locks = [thread.Lock() for _ in range(self.stripes)]
+        self.history_lock = thread.Lock()
+        self.lock = _Locks(self.locks + [self.history_lock])
+        self.size = 0
+        self.columns = dict(
+            (name, array.array(code)) for name, code in self.types.items()
+        )
+        # The last `warmup_size` warmup times of slot N start at
+        # N * warmup_size. The `warmup_count` column is the total added.
+        self.warmups = array.array('d')
+        self.history = History(history or History.config_levels())
+        self.warmup_histogram = Histogram([1, 2, 3, 5, 10, 20, 30, 60])
+
+    def __len__(self):
+        return self.size
+
+    def slot_lock(self, slot):
+        return self.locks[slot % self.stripes]
+
+    def allocate(self, **values):
+        """ Add a slot with the given initial values (zero for the other
+            columns) and return its index.
+        """
+        with self.lock:
+            for name, column in self.columns.items():
+                column.append(values.get(name, 0))
+            self.warmups.extend([0.] * self.warmup_size)
+            self.history.allocate()
+            self.size += 1
+            return self.size - 1
+
+    def snapshot(self, window=None, now=None, slots=None):
+        """ Copy of the columns, consistent among them. With a `window`
+            (seconds until `now`), the 'history' item has the history
+            buckets covering it.
+
+            With `slots`, the 'positions' item has the index of each slot
+            on the copy. When they are few, only their rows are copied.
+        """
+        rows = slots is not None and len(slots) * 8 < self.size
+        with self.lock:
+            if rows:
+                columns = dict(
+                    (name, [column[s] for s in slots])
+                    for name, column in self.columns.items()
+                )
+                size = self.warmup_size
+                columns['warmups'] = warmups = array.array('d')
+                for s in slots:
+                    warmups.extend(self.warmups[s * size:(s + 1) * size])
+            else:
+                columns = dict(
+                    (name, column[:]) for name, column in self.columns.items()
+                )
+                columns['warmups'] = self.warmups[:]
+            if window is not None:
+                columns['history'] = self.history.window(
+                    now - window, now, slots if rows else None)
+        if slots is not None:
+            columns['positions'] = range(len(slots)) if rows else slots
+        return columns
+
+    def record(self, slot, field, value, now=None):
+        """ Add `value` to a field of the history. The slot lock must be
+            held.
+        """
+        if now is None:
+            now = time.time()
+        with self.history_lock:
+            self.history.add(slot, field, now, now, value)
+
+    def set_status(self, slot, status, now=None):
+        """ Change the status of a slot, adding the time on the previous
+            status to the history. The slot lock must be held.
+        """
+        if now is None:
+            now = time.time()
+        field = History.status_fields.get(self.columns['status'][slot])
+        if field is not None:
+            with self.history_lock:
+                self.history.add(slot, field,
+                                 self.columns['history_time'][slot], now)
+        self.columns['history_time'][slot] = now
+        self.columns['status'][slot] = status
+
+    def metrics(self, slots, percent=True, now=None, window=None):
+        """ `StreamStats.metric` of many slots from a single snapshot.
+            With a `window` in seconds, uptime, crashes, warmup and
+            thumbnail are the ones of the last `window` seconds.
+        """
+        if now is None:
+            now = time.time()
+        col = self.snapshot(window, now, slots)
+        positions = col['positions']
+        mult = 100 if percent else 1
+        on = StatusTiming.ON.value
+        died = StatusTiming.DIED.value
+        size = self.warmup_size
+
+        # Local names of the columns used on the loop
+        thumbnail_total = col['thumbnail_total']
+        thumbnail_count = col['thumbnail_count']
+        linger_total = col['linger_total']
+        linger_count = col['linger_count']
+        linger_time = col['linger_time']
+        status = col['status']
+        uptime = col['uptime']
+        total = col['total']
+        last_start = col['last_start']
+        last_shutdown = col['last_shutdown']
+        death_count = col['death_count']
+        restart_count = col['restart_count']
+        crash_loop_count = col['crash_loop_count']
+        backoff = col['backoff']
+        warmup_count = col['warmup_count']
+        warmups = col['warmups']
+        viewers = col['viewers']
+        demand = col['demand']
+        demand_time = col['demand_time']
+        half_life = col['half_life']
+        warm = col['warm']
+
+        data = []
+        for s in positions:
+            running = now - last_start[s] if status[s] == on else 0
+            down = now - last_shutdown[s] if status[s] == died else 0
+            measure = uptime[s] + running
+            timed = total[s] + running + down
+            warmup_n = min(warmup_count[s], size)
+            data.append({
+                'thumbnail': round(_ratio(
+                    thumbnail_total[s] - thumbnail_count[s],
+                    thumbnail_total[s]) * mult, 3),
+                'uptime': round(_ratio(measure, timed) * mult, 3),
+                'crash': death_count[s],
+                'restart': restart_count[s],
+                'crash_loop': crash_loop_count[s],
+                'backoff': round(backoff[s], 3),
+                'warmup': round(_ratio(
+                    sum(warmups[s * size:s * size + warmup_n]),
+                    warmup_n), 3),
+                'viewers': viewers[s],
+                'demand': round(_decay(
+                    demand[s], now - demand_time[s], half_life[s]), 3),
+                'warm': bool(warm[s]),
+                'linger': round(linger_time[s], 3),
+                'linger_hit': round(_ratio(
+                    linger_total[s] - linger_count[s],
+                    linger_total[s]) * mult, 3),
+            })
+
+        if window is not None:
+            self._window_metrics(positions, data, col, now - window, now,
+                                 mult)
+        return data
+
+    # Columns saved as they are by `export`
+    saved_columns = ('thumbnail_total', 'thumbnail_count', 'linger_total',
+                     'linger_count', 'linger_time', 'death_count',
+                     'restart_count', 'crash_loop_count', 'viewers',
+                     'demand', 'demand_time')
+
+    def counters(self, slots, now=None):
+        """ Lifetime stats of the slots from a single snapshot, as a list
+            of values (in the order of `slots`) by name.
+        """
+        if now is None:
+            now = time.time()
+        col = self.snapshot()
+        on = StatusTiming.ON.value
+        died = StatusTiming.DIED.value
+        size = self.warmup_size
+
+        values = dict(
+            (name, [col[name][s] for s in slots]) for name in self.saved_columns
+        )
+        uptime = values['uptime'] = []
+        total = values['total'] = []
+        warmups = values['warmups'] = []
+        for s in slots:
+            running = now - col['last_start'][s] if col['status'][s] == on else 0
+            down = now - col['last_shutdown'][s] \
+                if col['status'][s] == died else 0
+            uptime.append(col['uptime'][s] + running)
+            total.append(col['total'][s] + running + down)
+
+            # Oldest to newest
+            count = col['warmup_count'][s]
+            warmups.append([
+                col['warmups'][s * size + ix % size]
+                for ix in range(max(count - size, 0), count)
+            ])
+        return values
+
+    def export(self, slots, now=None):
+        """ `counters` as a dictionary for each slot, to be saved and
+            given back to `restore`.
+        """
+        values = self.counters(slots, now)
+        names = list(values)
+        return [dict(zip(names, row))
+                for row in zip(*[values[name] for name in names])]
+
+    def restore(self, slot, item):
+        """ Replace the lifetime stats of a slot by the ones `export`ed.
+        """
+        with self.slot_lock(slot):
+            for name in self.saved_columns + ('uptime', 'total'):
+                if name in item:
+                    self.columns[name][slot] = item[name]
+            warmups = item.get('warmups', [])[-self.warmup_size:]
+            for ix, value in enumerate(warmups):
+                self.warmups[slot * self.warmup_size + ix] = value
+            self.columns['warmup_count'][slot] = len(warmups)
+
+    def _window_metrics(self, positions, data, col, start, end, mult):
+        """ Replace the lifetime metrics of `data` by the ones between
+            `start` and `end`. `positions` are the indexes of the slots on
+            the snapshot `col`.
+        """
+        sums = History.sums(col['history'])
+        fields = len(History.fields)
+        up, down, deaths, warmup_sum, warmup_count, thumbnail_total, \
+            thumbnail_count = range(fields)
+        status_fields = History.status_fields
+
+        for s, metric in zip(positions, data):
+            h = sums[s * fields:(s + 1) * fields] or [0.] * fields
+            # Time on the current status is not on the history yet.
+            field = status_fields.get(col['status'][s])
+            if field is not None:
+                since = max(col['history_time'][s], start)
+                h[History.index[field]] += max(end - since, 0)
+
+            metric.update({
+                'thumbnail': round(_ratio(
+                    h[thumbnail_total] - h[thumbnail_count],
+                    h[thumbnail_total]) * mult, 3),
+                'uptime': round(_ratio(h[up], h[up] + h[down]) * mult, 3),
+                'crash': int(h[deaths]),
+                'warmup': round(_ratio(h[warmup_sum], h[warmup_count]), 3),
+            })
+
+
+class History(object):
+    """ Stats of all slots over time, on ring buffers of a few
+        resolutions (by default, one bucket per minute for the last hour
+        and one per 10 minutes for the last day). Memory does not grow
+        with uptime.
+
+        Each bucket is a single array with the `fields` of all slots, so
+        the window of thousands of streams is the sum of a few arrays.
+        Windows are rounded to whole buckets. It is used under the
+        `StatsTable` lock.
+    """
+    fields = ('up', 'down', 'death_count', 'warmup_sum', 'warmup_count',
+              'thumbnail_total', 'thumbnail_count')
+    index = dict((name, ix) for ix, name in enumerate(fields))
+
+    # Field with the time spent on each status
+    status_fields = {
+        StatusTiming.STARTED.value: 'down',
+        StatusTiming.ON.value: 'up',
+        StatusTiming.DIED.value: 'down',
+    }
+
+    def __init__(self, levels):
+        """ `levels` is a list of (resolution in seconds, bucket count).
+        """
+        self.rings = [Ring(res, size) for res, size in sorted(levels)]
+        self.span = max(ring.span for ring in self.rings)
+
+    @staticmethod
+    def config_levels():
+        """ Levels from a value like "1m:60 10m:144".
+        """
+        value = config['stats']['history']
+        return [
+            (parse_duration(res), int(size))
+            for res, size in re.findall(r'(\w+):(\d+)', value)
+        ]
+
+    def allocate(self):
+        for ring in self.rings:
+            ring.allocate(len(self.fields))
+
+    def add(self, slot, field, start, end, value=None):
+        """ Add `value` at `end` or, without a value, the time from
+            `start` to `end` split among the buckets.
+        """
+        position = slot * len(self.fields) + self.index[field]
+        for ring in self.rings:
+            ring.add(position, start, end, value)
+
+    def window(self, start, end, slots=None):
+        """ Copy of the buckets between `start` and `end` of the ring
+            with the finest resolution covering it. With `slots`, the
+            buckets only have their fields, in that order.
+        """
+        if end - start > self.span:
+            raise ValueError('Window longer than the history '
+                             '({0} seconds)'.format(self.span))
+        ring = next(r for r in self.rings if r.span >= end - start)
+        buckets = ring.window(start, end)
+        if slots is None:
+            return buckets
+        width = len(self.fields)
+        rows = []
+        for bucket in buckets:
+            row = array.array(bucket.typecode)
+            for s in slots:
+                row.extend(bucket[s * width:(s + 1) * width])
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def sums(buckets):
+        """ Sum of each item of the buckets returned by `window`.
+        """
+        if not buckets:
+            return []
+        return [sum(items) for items in zip(*buckets)]
+
+
+class Ring(object):
+    """ `size` buckets of `resolution` seconds. Bucket number N (the
+        time divided by the resolution) is kept at index N % size until
+        it is replaced by N + size.
+    """
+    def __init__(self, resolution, size):
+        self.resolution = resolution
+        self.size = size
+        self.span = resolution * size
+        self.width = 0
+        self.buckets = [array.array('d') for _ in range(size)]
+        self.numbers = [None] * size
+
+    def allocate(self, width):
+        # Buckets are extended when written or copied.
+        self.width += width
+
+    def _extend(self, bucket):
+        if len(bucket) < self.width:
+            bucket.extend([0.] * (self.width - len(bucket)))
+        return bucket
+
+    def _bucket(self, number):
+        """ Bucket to write `number`, cleared when reused. None if it
+            was already replaced by a newer one.
+        """
+        index = number % self.size
+        current = self.numbers[index]
+        if current != number:
+            if current is not None and current > number:
+                return None
+            self.buckets[index] = array.array('d', [0.]) * self.width
+            self.numbers[index] = number
+        return self._extend(self.buckets[index])
+
+    def add(self, position, start, end, value=None):
+        if value is not None:
+            bucket = self._bucket(int(end // self.resolution))
+            if bucket is not None:
+                bucket[position] += value
+            return
+
+        last = int(end // self.resolution)
+        first = max(int(start // self.resolution), last - self.size + 1)
+        start = max(start, first * self.resolution)
+        for number in range(first, last + 1):
+            bucket_end = min((number + 1) * self.resolution, end)
+            bucket = self._bucket(number)
+            if bucket is not None:
+                bucket[position] += bucket_end - start
+            start = bucket_end
+
+    def window(self, start, end):
+        first = int(start // self.resolution)
+        last = int(end // self.resolution)
+        return [
+            self._extend(bucket[:])
+            for bucket, number in zip(self.buckets, self.numbers)
+            if number is not None and first <= number <= last
+        ]
+
+
+def _ratio(measure, total):
+    try:
+        return measure / total
+    except ZeroDivisionError:
+        return 0.
+
+
+def _decay(value, elapsed, half_life):
+    return value * 2 ** (-elapsed / half_life)
+
+
+class Stats(object):
+    """ View of the columns of a stream slot on a `StatsTable`.
+    """
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+        self.lock = table.slot_lock(slot)
+
+    def _get(self, name):
+        return self.table.columns[name][self.slot]
+
+    def _add(self, name, value):
+        # The slot lock must be held.
+        self.table.columns[name][self.slot] += value
 
-    @thread.lock_method
     def result(self):
         """ The element being measured divided by the total of occurrences.
             This should always be a value between 0 and 1 (inclusive).
         """
-        try:
-            return self.measure / self.total
-        except ZeroDivisionError:
-            return 0.
+        with self.lock:
+            return _ratio(self.measure, self.total)
 
 
 class CountStats(Stats):
+    """ Occurrences and errors on the `{name}_total` and `{name}_count`
+        columns.
+    """
+    def __init__(self, table, slot, name):
+        super(CountStats, self).__init__(table, slot)
+        self._total = name + '_total'
+        self._count = name + '_count'
 
-    def __init__(self, total=0, error_count=0):
-        super(CountStats, self).__init__(total)
-        self.count = error_count
+    @property
+    def count(self):
+        return self._get(self._count)
 
     @property
-    @thread.lock_method
     def measure(self):
         return self.total - self.count
 
-    @measure.setter
-    @thread.lock_method
-    def measure(self, value):
-        return  # XXX FIXME
+    @property
+    def total(self):
+        return self._get(self._total)
 
-    @thread.lock_method
     def inc(self, error):
-        self.total += 1
-        if error:
-            self.count += 1
-
-
-class StatusTiming(makeobj.Obj):
-    STOPPED, STARTED, ON, DIED = makeobj.keys(4)
+        with self.lock:
+            self._add(self._total, 1)
+            if error:
+                self._add(self._count, 1)
+            if self._total in History.index:
+                self.table.record(self.slot, self._total, 1)
+                if error:
+                    self.table.record(self.slot, self._count, 1)
 
 
 class TimedStats(Stats):
-    MAX_WARMUP_COUNT = 10
+    MAX_WARMUP_COUNT = StatsTable.warmup_size
 
-    def __init__(self, total=0, uptime=0, warmup_count=10):
-        self._measure = None
-        self._total = None
-        super(TimedStats, self).__init__(total, uptime)
-
-        self.death_count = 0
-        self._warmup = collections.deque(maxlen=warmup_count)
-        self._last_start = None
-        self._last_shutdown = None
-        self._status = StatusTiming.STOPPED
+    @property
+    def _status(self):
+        return self._get('status')
 
-    @thread.lock_method
     def started(self, value=None):
-        if self._status is StatusTiming.STOPPED:
-            self._status = StatusTiming.STARTED
-
         if value is None:
             value = time.time()
-        self._last_start = value
+        with self.lock:
+            if self._status == StatusTiming.STOPPED.value:
+                self.table.set_status(self.slot, StatusTiming.STARTED.value,
+                                      value)
+            self.table.columns['last_start'][self.slot] = value
 
-    @thread.lock_method
     def warmup(self, value=None):
         if value is None:
             value = time.time()
 
-        elapsed = value - self._last_start
+        columns = self.table.columns
+        slot = self.slot
+        with self.lock:
+            elapsed = value - columns['last_start'][slot]
 
-        # Now _last_start will record the time from
-        # publication start instead of process start
-        self._last_start = value
+            # Now last_start will record the time from
+            # publication start instead of process start
+            columns['last_start'][slot] = value
 
-        self._warmup.append(elapsed)
-        self._total += elapsed  # Warmup time does count as downtime
+            size = self.table.warmup_size
+            index = slot * size + columns['warmup_count'][slot] % size
+            self.table.warmups[index] = elapsed
+            self.table.warmup_histogram.observe(elapsed)
+            self.table.record(slot, 'warmup_sum', elapsed, value)
+            self.table.record(slot, 'warmup_count', 1, value)
+            self._add('warmup_count', 1)
+            self._add('total', elapsed)  # Warmup time does count as downtime
+            columns['backoff'][slot] = 0
 
-        if self._status is StatusTiming.DIED:
-            self.downtime()
+            if self._status == StatusTiming.DIED.value:
+                self._downtime()
 
-        self._status = StatusTiming.ON
+            self.table.set_status(slot, StatusTiming.ON.value, value)
 
-    @thread.lock_method
     def uptime(self, value=None):
-        if value is None:
-            value = time.time() - self._last_start
+        columns = self.table.columns
+        with self.lock:
+            if value is None:
+                value = time.time() - columns['last_start'][self.slot]
 
-        if self._status is StatusTiming.ON:
-            self._measure += value
-        self._total += value
-        self._status = StatusTiming.STOPPED
+            if self._status == StatusTiming.ON.value:
+                self._add('uptime', value)
+            self._add('total', value)
+            self.table.set_status(self.slot, StatusTiming.STOPPED.value)
 
-    @thread.lock_method
     def downtime(self, value=None):
+        with self.lock:
+            self._downtime(value)
+
+    def _downtime(self, value=None):
         if value is None:
-            value = time.time() - self._last_shutdown
-            self._last_shutdown = None
-        self._total += value
+            value = time.time() - self._get('last_shutdown')
+            self.table.columns['last_shutdown'][self.slot] = 0
+        self._add('total', value)
 
-    @thread.lock_method
     def died(self):
-        self.death_count += 1
-        if self._last_shutdown is None:
-            # Otherwise, the stream is crashing non-stop
-            # So it should keep the original time for correct
-            # uptime calculation.
-            self._last_shutdown = time.time()
-        self._status = StatusTiming.DIED
-
-    @thread.lock_method
+        columns = self.table.columns
+        with self.lock:
+            self._add('death_count', 1)
+            self.table.record(self.slot, 'death_count', 1)
+            if not columns['last_shutdown'][self.slot]:
+                # Otherwise, the stream is crashing non-stop
+                # So it should keep the original time for correct
+                # uptime calculation.
+                columns['last_shutdown'][self.slot] = time.time()
+            self.table.set_status(self.slot, StatusTiming.DIED.value)
+
+    def restart_scheduled(self, delay, crash_loop=False):
+        with self.lock:
+            self.table.columns['backoff'][self.slot] = delay
+            if crash_loop:
+                self._add('crash_loop_count', 1)
+
+    def restarted(self):
+        with self.lock:
+            self._add('restart_count', 1)
+
+    @property
+    def death_count(self):
+        return self._get('death_count')
+
+    @property
+    def restart_count(self):
+        return self._get('restart_count')
+
+    @property
+    def crash_loop_count(self):
+        return self._get('crash_loop_count')
+
+    @property
+    def backoff(self):
+        return self._get('backoff')
+
     def warmup_mean(self):
-        if self._warmup:
-            return sum(self._warmup) / len(self._warmup)
-        return 0
+        size = self.table.warmup_size
+        start = self.slot * size
+        with self.lock:
+            count = min(self._get('warmup_count'), size)
+            return _ratio(sum(self.table.warmups[start:start + count]), count)
 
-    @thread.lock_method
     def current_uptime(self):
-        if self._status is StatusTiming.ON:
-            return time.time() - self._last_start
+        if self._status == StatusTiming.ON.value:
+            return time.time() - self._get('last_start')
         return 0
 
-    @thread.lock_method
     def current_downtime(self):
-        if self._status is StatusTiming.DIED:
-            return time.time() - self._last_shutdown
+        if self._status == StatusTiming.DIED.value:
+            return time.time() - self._get('last_shutdown')
         return 0
 
     @property
-    @thread.lock_method
     def measure(self):
-        return self._measure + self.current_uptime()
-
-    @measure.setter
-    @thread.lock_method
-    def measure(self, value):
-        self._measure = value
+        return self._get('uptime') + self.current_uptime()
 
     @property
-    @thread.lock_method
     def total(self):
-        return self._total + self.current_uptime() + self.current_downtime()
+        return self._get('total') + self.current_uptime() + \
+            self.current_downtime()
+
 
-    @total.setter
-    @thread.lock_method
-    def total(self, value):
-        self._total = value
+class ViewerStats(Stats):
+    """ Viewer arrivals with exponential decay, so the demand of a stream
+        halves every `half_life` seconds without new viewers.
+    """
+    @property
+    def count(self):
+        return self._get('viewers')
+
+    @property
+    def half_life(self):
+        return self._get('half_life')
+
+    def arrival(self, now=None):
+        if now is None:
+            now = time.time()
+        columns = self.table.columns
+        with self.lock:
+            columns['demand'][self.slot] = self._demand(now) + 1
+            columns['demand_time'][self.slot] = now
+            self._add('viewers', 1)
+
+    def demand(self, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            return self._demand(now)
+
+    def _demand(self, now):
+        return _decay(self._get('demand'), now - self._get('demand_time'),
+                      self._get('half_life'))
 
 
 class StreamStats(object):
-    def __init__(self):
-        self.thumbnail = CountStats()
-        self.timed = TimedStats()
+    """ Stats of a stream, stored on a slot of `table`.
+    """
+    table = StatsTable()
+
+    def __init__(self, half_life=3600, table=None):
+        if table is not None:
+            self.table = table
+        self.slot = self.table.allocate(half_life=half_life,
+                                        demand_time=time.time())
+        self.thumbnail = CountStats(self.table, self.slot, 'thumbnail')
+        self.timed = TimedStats(self.table, self.slot)
+        self.viewers = ViewerStats(self.table, self.slot)
+        # Viewers finding the process still running (the count is misses)
+        self.linger = CountStats(self.table, self.slot, 'linger')
 
-    def metric(self, percent=True):
-        mult = 100 if percent else 1
-        return {
-            'thumbnail': round(self.thumbnail.result() * mult, 3),
-            'uptime': round(self.timed.result() * mult, 3),
-            'crash': self.timed.death_count,
-            'warmup': round(self.timed.warmup_mean(), 3),
-            #'__degub__': {
-            #    'measure': self.timed.measure,
-            #    '_measure': self.timed._measure,
-            #    'total': self.timed.total,
-            #    '_total': self.timed._total,
-            #    'current_uptime': self.timed.current_uptime(),
-            #    'current_downtime': self.timed.current_downtime(),
-            #    '_warmup': list(self.timed._warmup),
-            #    'last_start': self.timed._last_start,
-            #    'last_shutdown': self.timed._last_shutdown,
-            #}
-        }
+    @property
+    def warm(self):
+        return bool(self.table.columns['warm'][self.slot])
+
+    @warm.setter
+    def warm(self, value):
+        with self.table.slot_lock(self.slot):
+            self.table.columns['warm'][self.slot] = bool(value)
+
+    @property
+    def linger_time(self):
+        return self.table.columns['linger_time'][self.slot]
+
+    @linger_time.setter
+    def linger_time(self, value):
+        with self.table.slot_lock(self.slot):
+            self.table.columns['linger_time'][self.slot] = value
+
+    def export(self):
+        return self.table.export([self.slot])[0]
+
+    def restore(self, item):
+        self.table.restore(self.slot, item)
+
+    def metric(self, percent=True, window=None):
+        return self.table.metrics([self.slot], percent, window=window)[0]
+
+    @classmethod
+    def metrics(cls, stats, percent=True, window=None):
+        """ Metrics of many streams computed together. All of them must
+            be on the same table. With a `window` in seconds, see
+            `StatsTable.metrics`.
+        """
+        if not stats:
+            return []
+        return stats[0].table.metrics([s.slot for s in stats], percent,
+                                      window=window)
+
+
+class StatsStore(object):
+    """ Periodic snapshots of the stats of the streams on a MongoDB
+        collection, so they are kept across restarts.
+
+        Every `interval` seconds, the streams whose stats changed are
+        written with a single bulk upsert of at most `batch` documents,
+        the least recently saved first. The saved stats are loaded at
+        once by `load` and restored when each stream is created.
+    """
+    _stats = config['stats']
+    interval = _stats.getint('save_interval')
+    batch = _stats.getint('save_batch')
+    stop_timeout = 30  # Seconds to wait for a save already running
+
+    def __init__(self, collection, streams):
+        """ `streams` returns a list of (id, `StreamStats`) to be saved.
+        """
+        self.collection = collection
+        self.streams = streams
+        self.lock = thread.Lock()
+        self.saved = {}  # id -> (time, document) last saved
+        self.loaded = {}  # id -> document not restored yet
+        self.timer = None
+
+    def load(self):
+        loaded = {}
+        for document in self.collection.find():
+            id = document.pop('_id')
+            loaded[id] = document
+        with self.lock:
+            self.loaded = loaded
+            self.saved = dict((id, (0, doc)) for id, doc in loaded.items())
+        return len(loaded)
+
+    def restore(self, id, stats):
+        with self.lock:
+            document = self.loaded.pop(id, None)
+        if document is not None:
+            stats.restore(document)
+
+    def changed(self):
+        """ (id, document) of the changed stats, least recently saved
+            first.
+        """
+        streams = self.streams()
+        if not streams:
+            return []
+        table = streams[0][1].table
+        documents = table.export([stats.slot for _, stats in streams])
+        with self.lock:
+            saved = self.saved
+            changed = [
+                (saved.get(id, (0, None))[0], id, document)
+                for (id, _), document in zip(streams, documents)
+                if saved.get(id, (0, None))[1] != document
+            ]
+        changed.sort(key=lambda x: x[:2])
+        return [x[1:] for x in changed]
+
+    def save(self, limit=None):
+        """ Write up to `limit` changed documents in a single request.
+            Return the amount written.
+        """
+        changed = self.changed()[:limit]
+        self._write(changed)
+        return len(changed)
+
+    def _write(self, changed):
+        if not changed:
+            return
+        self.collection.bulk_write([
+            pymongo.ReplaceOne({'_id': id}, document, upsert=True)
+            for id, document in changed
+        ], ordered=False)
+
+        now = time.time()
+        with self.lock:
+            for id, document in changed:
+                self.saved[id] = (now, document)
+
+    def _save(self):
+        try:
+            self.save(self.batch)
+        except pymongo.errors.PyMongoError as e:
+            show.error('Could not save stream stats:', repr(e))
+
+    def start(self):
+        self.timer = thread.IntervalTimer(self.interval, self._save)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def stop(self):
+        """ Stop the snapshots and save all changed stats.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            # A save already running must not write after the last one.
+            self.timer.join(self.stop_timeout)
+            if self.timer.is_alive():
+                show.warn('Stream stats still being saved')
+        changed = self.changed()
+        for ix in range(0, len(changed), self.batch):
+            # A failed batch doesn't keep the others from being written.
+            try:
+                self._write(changed[ix:ix + self.batch])
+            except pymongo.errors.PyMongoError as e:
+                show.error('Could not save stream stats:', repr(e))
@@ -40,6 +40,7 @@ class DB:
     providers = _db.providers
     static = _db.static_streams
     mobile = _db.mobile_streams
+    stats = _db.stream_stats
 
 db = DB
 
@@ -1,21 +1,124 @@
+from __future__ import division
+import functools
+import heapq
 import re
 import time
 import os
 from concurrent import futures
 
 from .config import config
-from .tools import thread, process, ffmpeg
+from .tools import thread, process, ffmpeg, image
+from .tools.cache import FileCache
+from .tools.metrics import Histogram
+from .tools.os import DirectoryCleaner
 from .tools.show import Show
 from .providers import Providers
-from .video import Video
+from .video import Video, Stream
 
 show = Show('Thumbnail')
 
 
+class Schedule(object):
+    """ Heap of the next time each stream thumbnail is due.
+
+        The first fetches are spread evenly over `interval`. Afterwards,
+        each stream keeps its own period:
+            - Live streams and the ones with viewer demand are refreshed
+              more often, down to `min_interval`;
+            - Failing streams are retried after `min_interval` up to
+              `retries` times, then backed off exponentially up to
+              `max_interval`.
+    """
+    _thumb = config['thumbnail']
+    interval = _thumb.getint('interval')
+    min_interval = _thumb.getint('min_interval')
+    max_interval = _thumb.getint('max_interval')
+    retries = _thumb.getint('retries')
+
+    def __init__(self, ids, start):
+        """ `start` is a `thread.monotonic` time, like the due times.
+        """
+        self.heap = [
+            (start + self.interval * ix / len(ids), id)
+            for ix, id in enumerate(ids)
+        ]
+        heapq.heapify(self.heap)
+        self.failures = {}
+        self.lag = 0
+
+    def timeout(self, free):
+        """ Time to wait for the next stream due or None if there's no
+            `free` worker for it.
+        """
+        if not free or not self.heap:
+            return None
+        return max(self.heap[0][0] - thread.monotonic(), 0)
+
+    def pop_due(self):
+        if not self.heap or self.heap[0][0] > thread.monotonic():
+            return None
+        due, id = heapq.heappop(self.heap)
+        self.lag = thread.monotonic() - due
+        return id
+
+    def period(self, id, error):
+        if error:
+            failures = self.failures[id] = self.failures.get(id, 0) + 1
+            if failures <= self.retries:
+                return self.min_interval
+            return min(self.interval * 2 ** (failures - self.retries),
+                       self.max_interval)
+        self.failures.pop(id, None)
+
+        stream = Video.get_stream(id)
+        period = self.interval / (1 + stream.stats.viewers.demand())
+        if stream.alive:
+            period /= 2
+        return max(period, self.min_interval)
+
+    def reschedule(self, id, error):
+        due = thread.monotonic() + self.period(id, error)
+        heapq.heappush(self.heap, (due, id))
+
+
+class Summary(object):
+    """ Show the fetching results every `interval` seconds.
+    """
+    interval = Schedule.interval
+
+    def __init__(self, total):
+        self.total = total
+        self.start = thread.monotonic()
+        self.fetched = 0
+        self.error = set()
+
+    def add(self, id, error):
+        self.fetched += 1
+        if error:
+            self.error.add(id)
+        else:
+            self.error.discard(id)
+
+    def show(self, lag):
+        if thread.monotonic() - self.start < self.interval:
+            return
+        show('Fetched {0} thumbnails of {1} streams in {2:.0f} seconds'.format(
+            self.fetched, self.total, thread.monotonic() - self.start))
+        if self.error:
+            show.warn('Could not fetch:')
+            show.warn(', '.join(sorted(self.error)))
+        if lag > self.interval:
+            show.warn('Thumbnails delayed by {0:.2f} seconds'.format(lag))
+        self.start = thread.monotonic()
+        self.fetched = 0
+
+
 class Thumbnail(object):
     run = True
     clean = True
     lock = thread.Condition()
+    # Finished fetches, apart from `lock` so the fetch waiters don't wake up.
+    results = thread.Condition.from_condition(lock)
 
     stream_list = None
     _thumb = config['thumbnail']
@@ -23,6 +126,34 @@ class Thumbnail(object):
     workers = _thumb.getint('workers')
     timeout = _thumb.getint('timeout')
     delete_after = _thumb.getint('delete_after')
+    cleanup_interval = _thumb.getint('cleanup_interval')
+    cleanup_batch = _thumb.getint('cleanup_batch')
+    cleaner = None
+    cleanup_timer = None
+    cleanup_start = 0
+    live_snapshot = _thumb.getboolean('live_snapshot')
+    live_interval = _thumb.getint('live_interval')
+    resize = _thumb['resize']
+    resize_workers = _thumb.getint('resize_workers')
+    pool = None
+
+    # Parsed once: the same names and options are used on every fetch.
+    sizes = re.findall(r'(\w+):(\w+)', _thumb['sizes'])
+    suffixes = [''] + ['-' + s[0] for s in sizes]
+    resize_options = [''] + list(map(_thumb['resize_opt'].format,
+                                     [s[1] for s in sizes]))
+    templates = {}  # (seek, pipe) -> ffmpeg.Template
+    snapshot_template = None
+
+    # Latest thumbnails served by `ThumbnailHandler`
+    cache = FileCache(_thumb.get_size('cache_size'),
+                      _thumb.getfloat('cache_revalidate'),
+                      futures.ThreadPoolExecutor(
+                          _thumb.getint('cache_workers')))
+
+    # Seconds each fetch took and how late it started
+    fetch_time = Histogram([0.5, 1, 2, 5, 10, 20, 30, 45, 60])
+    lag_time = Histogram([0.1, 1, 5, 10, 30, 60, 300])
 
     class Worker(object):
         def __init__(self, id, timeout):
@@ -30,6 +161,8 @@ class Thumbnail(object):
             self.timeout = timeout
             self.proc = None
             self.lock = None
+            self.file_id = None
+            self.finished = False
 
         def _open_proc(self):
             """ Select stream and open process
@@ -50,6 +183,7 @@ class Thumbnail(object):
                 id = provider.get_stream(self.id)
                 origin = provider
 
+            self.file_id = Thumbnail.file_id(id, origin)
             return process.run_proc(
                 self.id,
                 Thumbnail.make_cmd(id, source, seek, origin),
@@ -75,9 +209,10 @@ class Thumbnail(object):
                       the timeout).
             """
             with self.lock:
-                thread.Condition.wait_for_any(
-                    [Thumbnail.lock, self.lock], self.timeout
-                )
+                thread.Condition.wait_for_any({
+                    Thumbnail.lock: lambda: not Thumbnail.run,
+                    self.lock: lambda: self.finished,
+                }, self.timeout)
                 self._close_proc()
 
         def __call__(self):
@@ -86,20 +221,34 @@ class Thumbnail(object):
                 Waits for the end of the process (naturally or killed
                 by waiter). Awakes the waiter if process finished first.
                 Returns the process output code.
+
+                When resizing with Pillow, the process outputs a single
+                frame that is resized on the `Thumbnail.pool`.
             """
             self.lock = thread.Condition.from_condition(Thumbnail.lock)
             with self.lock:
                 if not Thumbnail.run:
                     return
 
+            if Thumbnail.snapshot_is_fresh(self.id):
+                return 0
+
             with self._open_proc() as self.proc:
                 thread.Thread(self._waiter).start()
 
-                self.proc.communicate()
+                frame, _ = self.proc.communicate()
                 with self.lock:
+                    self.finished = True
                     self.lock.notify_all()
 
-                return self.proc.poll()
+                code = self.proc.poll()
+
+            if code == 0:
+                if Thumbnail.pool is not None:
+                    return Thumbnail.save_frame(self.file_id, frame)
+                for name in Thumbnail.make_file_names(self.file_id):
+                    Thumbnail.cache.refresh(name)
+            return code
 
     @classmethod
     def main_worker(cls):
@@ -112,143 +261,219 @@ class Thumbnail(object):
             delay = 0
         with cls.lock:
             cls.lock.wait(delay)
+            if not cls.run:
+                return
+            cls.clean = False
+
+        schedule = Schedule(cls.stream_list, thread.monotonic())
+        summary = Summary(len(cls.stream_list))
+        running = {}  # id -> start time
+        finished = []
 
+        def done(id, future):
+            with cls.results:
+                finished.append((id, future))
+                cls.results.notify_all()
+
+        executor = futures.ThreadPoolExecutor(cls.workers)
         while True:
             with cls.lock:
                 if not cls.run:
                     break
-                cls.clean = False
-            t = time.time()
-            with futures.ThreadPoolExecutor(cls.workers) as executor:
-                map = dict(
-                    (executor.submit(cls.Worker(x, cls.timeout)), x)
-                    for x in cls.stream_list
-                )
-                done = {}
-                for future in futures.as_completed(map):
-                    _id = map[future]
-                    try:
-                        done[_id] = future.result()
-                    except Exception as e:
-                        show.error('Thumbnail download error ({0}):'.format(_id), repr(e))
-                        done[_id] = -1
-                error = [x for x in cls.stream_list if done[x] != 0]
-
-                if cls.run:  # Show stats
-                    cams = len(cls.stream_list)
-                    show('Finished fetching thumbnails: {0}/{1}'.format(cams - len(error), cams))
-                    if error:
-                        show.warn('Could not fetch:')
-                        show.warn(', '.join(error))
-
-                error = set(error)
-                for s in cls.stream_list:  # Record stats
-                    Video.get_stream(s).stats.thumbnail.inc(s in error)
-
-            if cls.run:
-                # Do not start delete routine if the program was requested
-                # to stop otherwise it may delete inconsistently data from
-                # other runs.
-                # It may seem as a desirable behavior to delete old data,
-                # but this should be done at the program start.
-                cls.delete_old_thumbnails(error)
+                if not finished:
+                    thread.Condition.wait_for_any(
+                        [cls.lock, cls.results],
+                        schedule.timeout(len(running) < cls.workers))
+                results = finished[:]
+                del finished[:]
+
+            for id, future in results:
+                cls.fetch_time.observe(thread.monotonic() - running.pop(id))
+                cls.fetched(id, future, schedule, summary)
+
+            while len(running) < cls.workers:
+                id = schedule.pop_due()
+                if id is None:
+                    break
+                running[id] = thread.monotonic()
+                cls.lag_time.observe(schedule.lag)
+                future = executor.submit(cls.Worker(id, cls.timeout))
+                future.add_done_callback(functools.partial(done, id))
 
-            with cls.lock:
-                t = time.time() - t
-                interval = cls.interval - t
+            summary.show(schedule.lag)
 
-                cls.clean = True
-                cls.lock.notify_all()
+        executor.shutdown(wait=True)
+        with cls.lock:
+            cls.clean = True
+            cls.lock.notify_all()
 
-                if interval >= 0:
-                    cls.lock.wait(interval)
-                elif cls.run:
-                    show.warn('Thumbnail round delayed by {0:.2f} seconds'.format(-interval))
+    @classmethod
+    def fetched(cls, id, future, schedule, summary):
+        try:
+            error = future.result() != 0
+        except Exception as e:
+            show.error('Thumbnail download error ({0}):'.format(id), repr(e))
+            error = True
+
+        if not cls.run:
+            # Killed while stopping, it is not an error of the stream.
+            return
+
+        Video.get_stream(id).stats.thumbnail.inc(error)
+        schedule.reschedule(id, error)
+        summary.add(id, error)
 
     @classmethod
     def make_file_names(cls, id, resize_information=False):
-        sizes = re.findall(r'(\w+):(\w+)', cls._thumb['sizes'])
-        names = [''] + ['-' + s[0] for s in sizes]
-
-        outputs = [
-            os.path.join(
-                cls._thumb['dir'],
-                '{0}{1}.{2}'.format(id, _name, cls._thumb['format'])
-            )
-            for _name in names
-        ]
+        base = os.path.join(cls._thumb['dir'], id)
+        extension = '.' + cls._thumb['format']
+        outputs = [base + suffix + extension for suffix in cls.suffixes]
 
         if resize_information:
-            return outputs, sizes
+            return outputs, cls.sizes
         return outputs
 
     @classmethod
-    def make_cmd(cls, name, source, seek=None, origin=None):
-        """ Generate FFmpeg command for thumbnail generation.
+    def file_id(cls, name, origin=None):
+        # If fetching thumbnail from origin server, will need the stream
+        # id that is different from stream name.
+        if origin:
+            return origin.get_id(name)
+        return name
+
+    @classmethod
+    def save_frame(cls, id, frame):
+        """ Resize a frame to all thumbnail sizes on the process pool.
+        """
+        if not frame:
+            return -1
+        outputs, sizes = cls.make_file_names(id, resize_information=True)
+        future = cls.pool.submit(image.save_sizes, frame, outputs,
+                                 [s[1] for s in sizes])
+        for name, data in zip(outputs, future.result(cls.timeout)):
+            cls.cache.refresh(name, data)
+        return 0
+
+    @classmethod
+    def make_template(cls, seek=None):
+        """ FFmpeg command template used by `make_cmd`, made once for
+            each seek value and output mode.
         """
+        pipe = cls.pool is not None
+        template = cls.templates.get((seek, pipe))
+        if template is not None:
+            return template
+
         thumb = cls._thumb
         out_opt = thumb['output_opt']
         if seek is not None:
             out_opt += ' -ss ' + str(seek)
 
-        # If fetching thumbnail from origin server, will need the stream
-        # id that is different from stream name.
-        id = name
-        if origin:
-            id = origin.get_id(name)
+        if pipe:
+            template = ffmpeg.Template(
+                thumb['input_opt'],
+                out_opt + ' ' + thumb['pipe_opt'],
+            )
+        else:
+            template = ffmpeg.Template(
+                thumb['input_opt'],
+                out_opt + ' ' + thumb['file_opt'],
+                cls.resize_options,
+            )
+        cls.templates[seek, pipe] = template
+        return template
 
-        outputs, sizes = cls.make_file_names(id, resize_information=True)
+    @classmethod
+    def make_cmd(cls, name, source, seek=None, origin=None):
+        """ Generate FFmpeg command for thumbnail generation.
+        """
+        template = cls.make_template(seek)
+        if cls.pool is not None:
+            return template(source.format(name), '-')
 
-        resize_opt = cls._thumb['resize_opt']
-        resize = [''] + [resize_opt.format(s[1]) for s in sizes]
+        id = cls.file_id(name, origin)
+        return template(source.format(name), *cls.make_file_names(id))
 
-        return ffmpeg.cmd_outputs(
-            thumb['input_opt'],
-            source.format(name),
-            out_opt,
-            resize,
-            outputs
-        )
+    @classmethod
+    def snapshot_cmd(cls, id):
+        """ FFmpeg outputs to be added to the command fetching a stream to
+            update its thumbnails every `live_interval` seconds.
+        """
+        if cls.snapshot_template is None:
+            cls.snapshot_template = ffmpeg.Template(
+                None,
+                '{0} {1} -r {2}'.format(cls._thumb['live_output_opt'],
+                                        cls._thumb['file_opt'],
+                                        1. / cls.live_interval),
+                cls.resize_options,
+            )
+        return cls.snapshot_template.outputs(*cls.make_file_names(id))
+
+    @classmethod
+    def snapshot_is_fresh(cls, id):
+        """ Whether the running stream process is updating the thumbnails,
+            so there is no need to fetch them.
+        """
+        stream = Video.get_stream(id)
+        if not stream.has_snapshot or not stream.proc:
+            return False
+        try:
+            modified_time = os.path.getmtime(cls.make_file_names(id)[0])
+        except OSError:
+            return False
+        return time.time() - modified_time < 2 * cls.live_interval
 
     @classmethod
     def start_download(cls):
+        if cls.live_snapshot:
+            Stream.snapshot = cls.snapshot_cmd
+        if cls.resize == 'pillow':
+            if image.Image is None:
+                show.warn('Pillow is not installed. Resizing with FFmpeg.')
+            else:
+                cls.pool = futures.ProcessPoolExecutor(cls.resize_workers)
+        if cls.delete_after:
+            # Old thumbnails get a chance to be updated before removed.
+            cls.cleanup_start = thread.monotonic() + cls.interval + \
+                cls._thumb.getint('start_after', fallback=0)
+            cls.cleaner = cls.make_cleaner()
+            cls.cleanup_timer = thread.IntervalTimer(cls.cleanup_interval,
+                                                     cls.cleanup)
+            cls.cleanup_timer.daemon = True
+            cls.cleanup_timer.start()
         thread.Thread(cls.main_worker).start()
 
     @classmethod
     def stop_download(cls):
+        if cls.cleanup_timer is not None:
+            cls.cleanup_timer.cancel()
         with cls.lock:
             cls.run = False
             cls.lock.notify_all()
             while not cls.clean:
                 cls.lock.wait()
+        if cls.pool is not None:
+            cls.pool.shutdown()
 
     @classmethod
-    def delete_old_thumbnails(cls, thumbs):
-        """ From a list of thumbnails ids, check which files are older than
-            delete_after and remove them.
-            If delete_after is zero, skip the check.
+    def make_cleaner(cls):
+        """ Cleaner of the thumbnails not updated for `delete_after`
+            seconds, with the names made by `make_file_names`.
         """
-        if not cls.delete_after:
-            return
-
-        deleted = []
-
-        for id in thumbs:
-            names = cls.make_file_names(id)
-            try:
-                modified_time = os.path.getmtime(names[0])
-            except OSError:
-                continue
-            if time.time() - modified_time > cls.delete_after:
-                for name in names:
-                    try:
-                        os.remove(name)
-                    except OSError:
-                        pass
-                deleted.append(id)
+        return DirectoryCleaner(
+            cls._thumb['dir'],
+            '.' + cls._thumb['format'],
+            cls.suffixes[1:],
+            cls.delete_after,
+            cls.cleanup_batch,
+            lambda id, path: cls.cache.pop(path)
+        )
 
+    @classmethod
+    def cleanup(cls):
+        if not cls.run or thread.monotonic() < cls.cleanup_start:
+            return
+        deleted = cls.cleaner.step()
         if deleted:
             show('Old thumbnails removed:')
-            show(', '.join(deleted))
-
-        return deleted
+            show(', '.join(sorted(deleted)))
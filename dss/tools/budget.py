@@ -0,0 +1,122 @@
+"""
+    Memory accounting for data waiting to be consumed.
+
+    Usage:
+
+    total = ByteBudget(soft_limit=100, hard_limit=200)
+    stream = ByteBudget(10, 20, parent=total)
+
+    stream.add(15)    # Charged on both budgets
+    stream.wait(5)    # Blocks until below the soft limit (or timeout)
+    stream.remove(15)
+
+"""
+from __future__ import absolute_import
+from . import thread
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class ByteBudget(object):
+    """ Count bytes held in memory against a soft and a hard limit.
+
+        Crossing the soft limit means producers should slow down (see
+        `wait`) and crossing the hard limit is an error. A budget with
+        a parent also charges it, so many budgets can share a global
+        ceiling. All budgets of a tree share the same lock.
+    """
+    def __init__(self, soft_limit, hard_limit, parent=None, name=None):
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.parent = parent
+        self.name = name
+        if parent is None:
+            self.cond = thread.Condition()
+            self._waiting = [0]
+        else:
+            self.cond = parent.cond
+            self._waiting = parent._waiting
+
+        self.used = 0
+        self.peak = 0
+        self.total = 0
+        self.throttled = 0
+        self.dropped = 0
+
+    def _chain(self):
+        budget = self
+        while budget is not None:
+            yield budget
+            budget = budget.parent
+
+    def add(self, amount):
+        """ Charge `amount` bytes. If any hard limit would be crossed,
+            nothing is charged and `BudgetExceeded` is raised.
+        """
+        with self.cond:
+            for budget in self._chain():
+                if budget.used + amount > budget.hard_limit:
+                    for b in self._chain():
+                        b.dropped += 1
+                    raise BudgetExceeded(
+                        '{0} bytes over the {1!r} limit of {2} bytes'.format(
+                            budget.used + amount - budget.hard_limit,
+                            budget.name, budget.hard_limit
+                        ))
+            for budget in self._chain():
+                budget.used += amount
+                budget.total += amount
+                if budget.used > budget.peak:
+                    budget.peak = budget.used
+
+    def remove(self, amount):
+        with self.cond:
+            self._remove(amount)
+
+    def _remove(self, amount):
+        for budget in self._chain():
+            budget.used -= amount
+        if self._waiting[0]:
+            self.cond.notify_all()
+
+    def close(self):
+        """ Release everything still charged.
+        """
+        with self.cond:
+            self._remove(self.used)
+
+    @property
+    def over_soft_limit(self):
+        return any(b.used > b.soft_limit for b in self._chain())
+
+    def wait(self, timeout=None):
+        """ Block while any soft limit is crossed.
+            Return False if it did not get below the limits on time.
+        """
+        with self.cond:
+            if not self.over_soft_limit:
+                return True
+
+            for budget in self._chain():
+                budget.throttled += 1
+            self._waiting[0] += 1
+            try:
+                return self.cond.wait_for(
+                    lambda: not self.over_soft_limit, timeout
+                )
+            finally:
+                self._waiting[0] -= 1
+
+    def metric(self):
+        with self.cond:
+            return {
+                'queued': self.used,
+                'peak': self.peak,
+                'ingested': self.total,
+                'throttled': self.throttled,
+                'dropped': self.dropped,
+                'soft_limit': self.soft_limit,
+                'hard_limit': self.hard_limit,
+            }
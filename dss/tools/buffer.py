@@ -5,6 +5,9 @@
     buff = Buffer(socket_object)
     buff.read(10)
 
+    payload = bytearray(1024)
+    buff.read_into(payload)
+
 """
 from __future__ import absolute_import
 from . import thread
@@ -17,7 +20,7 @@ class SocketClosedError(Exception):
 class _BaseBuffer(object):
 
     def __init__(self, size):
-        self._data = bytearray(size)
+        self._set_data(bytearray(size))
         self._pos = 0
         self._max = 0
         self._require_resize = False
@@ -36,6 +39,12 @@ class _BaseBuffer(object):
 
         return self._data[pos:self._pos]
 
+    def _set_data(self, data):
+        self._data = data
+        # Keep a single view for copying without slicing the bytearray.
+        # While it exists, `_data` cannot be resized in place.
+        self._memory = memoryview(data)
+
     def set_size(self, value):
         self._require_resize = value
 
@@ -54,13 +63,13 @@ class _BaseBuffer(object):
             raise BufferError('Rewriting non empty buffer.')
 
         if self._require_resize:
-            self._data = bytearray(self._require_resize)
+            self._set_data(bytearray(self._require_resize))
             self._require_resize = False
 
         if fill_later:
             self._inconsistent_state = True
         else:
-            self._data[:] = data
+            self._set_data(bytearray(data))
             self._pos = 0
             self._max = len(data)
 
@@ -80,6 +89,21 @@ class _BaseBuffer(object):
         read_size = amount if amount <= len(self) else 0
         return self._extract(read_size)
 
+    def get_into(self, view):
+        """ Copy as much buffered content as fits in the writable `view`
+            without creating intermediate objects.
+            Returns the amount of bytes copied.
+        """
+        if self._inconsistent_state:
+            raise BufferError('Buffer is inconsistent.')
+
+        pos = self._pos
+        amount = min(len(view), self._max - pos)
+        if amount:
+            self._pos = pos + amount
+            view[:amount] = self._memory[pos:self._pos]
+        return amount
+
     def view(self):
         return self._data
 
@@ -103,23 +127,49 @@ class Buffer(thread.LockedObject):
 
     @thread.lock_method
     def read(self, amount, raise_error=False):
-        data = bytearray()
-        while True:
-            new_data = self.buffer.get(amount)
-            data.extend(new_data)
-            amount -= len(new_data)
-            if not amount:
-                break
+        data = bytearray(amount)
+        read = self.read_into(data, raise_error)
+        if read < amount:
+            data = data[:read]
+        return data
+
+    @thread.lock_method
+    def read_into(self, data, raise_error=False):
+        """ Fill the writable buffer `data` (e.g. a `bytearray`) with exactly
+            `len(data)` bytes and return the amount read. It will only be
+            smaller if the socket is closed.
+
+            Buffered content is copied straight into `data` and, if the
+            missing part is bigger than `read_size`, the socket writes
+            directly into it, so the payload is never copied twice.
+        """
+        view = memoryview(data)
+        amount = len(view)
+        pos = self.buffer.get_into(view)
+        while pos < amount:
+            missing = amount - pos
+            if missing >= self.read_size:
+                read = self.socket.recv_into(view[pos:], missing)
+                if not read:
+                    self._closed(missing, raise_error)
+                    break
+                pos += read
+                continue
 
             self.buffer.set(None, fill_later=True)
             read = 0
             try:
                 read = self.socket.recv_into(self.buffer.view(), self.read_size)
                 if not read:
-                    if raise_error:
-                        raise SocketClosedError('Missing %d bytes' % amount)
+                    self._closed(missing, raise_error)
                     break
             finally:
                 self.buffer.set_fill(read)
+            pos += self.buffer.get_into(view[pos:])
 
-        return data
+        return pos
+
+    @staticmethod
+    def _closed(missing, raise_error):
+        if raise_error:
+            raise SocketClosedError('Missing %d bytes' % missing)
@@ -0,0 +1,201 @@
+"""
+    Memory bounded caches.
+
+    Usage:
+
+    cache = LRUCache(max_bytes=1024)
+    cache.put('key', b'value', size=5)
+    cache.get('key')  # b'value'
+
+    files = FileCache(max_bytes=2 ** 20, revalidate=1, executor=executor)
+    entry = files.get('/some/file')  # Entry(data, mtime, etag) or None
+    future = files.prepare('/some/file')  # None if `get` won't read the disk
+"""
+from __future__ import absolute_import
+import collections
+import os
+import time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+from . import thread
+from .flight import SingleFlight
+
+Entry = collections.namedtuple('Entry', 'data mtime etag')
+
+
+class LRUCache(object):
+    """ Least recently used items are removed when the sum of the item
+        sizes crosses `max_bytes`. Items bigger than that are not stored.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = thread.Lock()
+        self.data = OrderedDict()  # key -> (value, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            self.data[key] = item
+            self.hits += 1
+            return item[0]
+
+    def peek(self, key, default=None):
+        """ Like `get`, without counting it or making it recent.
+        """
+        with self.lock:
+            item = self.data.get(key)
+            return default if item is None else item[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self.data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.data.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        item = self.data.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+    def metric(self):
+        with self.lock:
+            return {
+                'items': len(self.data),
+                'size': self.size,
+                'max_size': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class FileCache(object):
+    """ Content of files kept in a `LRUCache`. The file modification time
+        is checked at most every `revalidate` seconds, so files replaced
+        by other processes are reloaded. Files not found are remembered
+        for as long, up to `max_missing` names.
+
+        Callers that must not block (e.g. on the IOLoop) wait for the
+        future of `prepare` instead of reading the disk on `get`.
+    """
+    def __init__(self, max_bytes, revalidate=1, executor=None,
+                 max_missing=10000):
+        self.lru = LRUCache(max_bytes)
+        self.missing = LRUCache(max_missing)  # Name -> time checked
+        self.revalidate = revalidate
+        self.flight = None if executor is None else SingleFlight(executor)
+
+    def put(self, name, data, mtime=None):
+        """ Store data just written to a file.
+        """
+        if mtime is None:
+            mtime = os.path.getmtime(name)
+        entry = Entry(data, mtime, '"{0:x}-{1:x}"'.format(
+            int(mtime * 10 ** 6), len(data)))
+        self.missing.pop(name)
+        self.lru.put(name, (entry, time.time()), len(data))
+        return entry
+
+    def load(self, name):
+        """ Read a file into the cache. Return None if it doesn't exist.
+        """
+        try:
+            mtime = os.path.getmtime(name)
+            with open(name, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            self._missing(name)
+            return None
+        return self.put(name, data, mtime)
+
+    def _missing(self, name):
+        self.lru.pop(name)
+        self.missing.put(name, time.time(), 1)
+
+    def refresh(self, name, data=None):
+        """ Update a file already on the cache after it is written. Files
+            not requested yet are not loaded, so the most used ones are
+            not evicted.
+        """
+        self.missing.pop(name)
+        if name in self.lru:
+            if data is None:
+                self.load(name)
+            else:
+                self.put(name, data)
+
+    def fresh(self, name):
+        """ True if `get` returns without reading the disk.
+        """
+        item = self.lru.peek(name)
+        if item is not None:
+            checked = item[1]
+        else:
+            checked = self.missing.peek(name)
+        return checked is not None \
+            and time.time() - checked < self.revalidate
+
+    def prepare(self, name):
+        """ Future of `get(name)` on the executor, shared by concurrent
+            callers, or None if `get` doesn't need to read the disk.
+        """
+        if self.fresh(name):
+            return None
+        return self.flight.run(name, self.get, name)
+
+    def get(self, name, check=True):
+        """ Entry of the file `name`, or None if it doesn't exist. Without
+            `check`, the disk is not read and files not cached are None.
+        """
+        item = self.lru.get(name)
+        if item is None:
+            if not check:
+                return None
+            checked = self.missing.get(name)
+            if checked is not None and \
+                    time.time() - checked < self.revalidate:
+                return None
+            return self.load(name)
+
+        entry, checked = item
+        if not check or time.time() - checked < self.revalidate:
+            return entry
+        try:
+            mtime = os.path.getmtime(name)
+        except OSError:
+            self._missing(name)
+            return None
+        if mtime != entry.mtime:
+            return self.load(name)
+        self.lru.put(name, (entry, time.time()), len(entry.data))
+        return entry
+
+    def pop(self, name):
+        self.lru.pop(name)
+        self.missing.pop(name)
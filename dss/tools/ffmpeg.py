@@ -5,21 +5,47 @@ from ..config import config
 bin_default = config.get('ffmpeg', 'bin')
 probe = config.get('ffmpeg', 'probe')
 
+_split_cache = {}
+_split_cache_max = 256
 
-def _input_cmd(cmd_input, input, add_probe=True, bin=None, add_bin=True):
-    """ Base of FFmpeg command with a single input.
+
+def split(options):
+    """ `shlex.split` of option strings, cached because the same
+        configuration strings are split on every process start.
+    """
+    try:
+        return _split_cache[options]
+    except KeyError:
+        pass
+    if options is None:
+        raise ValueError('Passing `None` as options will cause '
+                         'shlex.split to hang instead of raising error.')
+    args = tuple(shlex.split(options))
+    if len(_split_cache) >= _split_cache_max:
+        _split_cache.clear()
+    _split_cache[options] = args
+    return args
+
+
+def _input_args(cmd_input, add_probe=True, bin=None, add_bin=True):
+    """ Arguments before the input of a FFmpeg command, up to the `-i`.
     """
     if add_bin:
         args = [bin_default if bin is None else bin]
     else:
         args = []
-    if cmd_input is None:
-        raise ValueError('Passing `None` on `cmd_input` will cause '
-                         'shlex.split to hang instead of raising error.')
-    args += shlex.split(cmd_input)
+    args += split(cmd_input)
     if add_probe:
         args += ['-probesize', probe]
-    args += ['-i', input]
+    args.append('-i')
+    return args
+
+
+def _input_cmd(cmd_input, input, add_probe=True, bin=None, add_bin=True):
+    """ Base of FFmpeg command with a single input.
+    """
+    args = _input_args(cmd_input, add_probe, bin, add_bin)
+    args.append(input)
     return args
 
 
@@ -27,7 +53,7 @@ def cmd(cmd_input, input, cmd_output, output, add_probe=True, bin=None):
     """ Build FFmpeg command for a single input and single output.
     """
     args = _input_cmd(cmd_input, input, add_probe, bin)
-    args += shlex.split(cmd_output)
+    args += split(cmd_output)
     args.append(output)
     return args
 
@@ -48,25 +74,32 @@ def cmd_inputs(cmd_input, inputs, cmd_output, output, add_probe=True, bin=None):
             inp = inp[1]
         args += _input_cmd(cmd_input_, inp, add_probe, bin, add_bin=not ix)
         cmd_input_ = cmd_input
-    args += shlex.split(cmd_output)
+    args += split(cmd_output)
     args.append(output)
     return args
 
 
-def cmd_outputs(cmd_input, input, base_cmd_output, cmd_output_specific, outputs, add_probe=True, bin=None):
-    """ Build FFmpeg command for multiple outputs but single input.
+def cmd_multiple_outputs(base_cmd_output, cmd_output_specific, outputs):
+    """ Build only the output part of a FFmpeg command for multiple outputs.
     """
-    args = _input_cmd(cmd_input, input, add_probe, bin)
-
-    base_cmd_output = shlex.split(base_cmd_output)
+    args = []
+    base_cmd_output = split(base_cmd_output)
 
     for out_cmd, out in zip(cmd_output_specific, outputs):
         args += base_cmd_output
-        args += shlex.split(out_cmd)
+        args += split(out_cmd)
         args.append(out)
     return args
 
 
+def cmd_outputs(cmd_input, input, base_cmd_output, cmd_output_specific, outputs, add_probe=True, bin=None):
+    """ Build FFmpeg command for multiple outputs but single input.
+    """
+    args = _input_cmd(cmd_input, input, add_probe, bin)
+    args += cmd_multiple_outputs(base_cmd_output, cmd_output_specific, outputs)
+    return args
+
+
 def cmd_inputs_outputs(cmd_input, inputs, base_cmd_output, cmd_output_specific, outputs, add_probe=True, bin=None):
     """ Build FFmpeg command for multiple input files and a multiple outputs.
         If an item on the `input` list is a 2-item tuple, it will be unpacked into
@@ -84,10 +117,49 @@ def cmd_inputs_outputs(cmd_input, inputs, base_cmd_output, cmd_output_specific,
         args += _input_cmd(cmd_input_, inp, add_probe, bin, add_bin=not ix)
         cmd_input_ = cmd_input
 
-    base_cmd_output = shlex.split(base_cmd_output)
-
-    for out_cmd, out in zip(cmd_output_specific, outputs):
-        args += base_cmd_output
-        args += shlex.split(out_cmd)
-        args.append(out)
+    args += cmd_multiple_outputs(base_cmd_output, cmd_output_specific, outputs)
     return args
+
+
+class Template(object):
+    """ FFmpeg command with a single input and one or more outputs, with
+        the options parsed once. Only the input and the outputs are given
+        to build each command:
+
+            template = Template('-re', '-c:v copy -f flv')
+            template('rtsp://camera', 'rtmp://server/app/stream')
+
+            sizes = Template('-y', '-an -frames:v 1', ['', '-s 320x240'])
+            sizes('input', 'big.jpg', 'small.jpg')
+
+        With `cmd_input` None, there is no input part and only the
+        `outputs` method is meant to be used.
+    """
+    def __init__(self, cmd_input, base_cmd_output, cmd_output_specific=('',),
+                 add_probe=True, bin=None):
+        if cmd_input is None:
+            self.head = ()
+        else:
+            self.head = tuple(_input_args(cmd_input, add_probe, bin))
+        base_cmd_output = split(base_cmd_output)
+        self.tails = tuple(
+            base_cmd_output + split(out_cmd) for out_cmd in cmd_output_specific
+        )
+
+    def outputs(self, *outputs):
+        """ Output part of the command.
+        """
+        if len(outputs) != len(self.tails):
+            raise ValueError('Expected {0} outputs, got {1}.'.format(
+                len(self.tails), len(outputs)))
+        args = []
+        for tail, out in zip(self.tails, outputs):
+            args += tail
+            args.append(out)
+        return args
+
+    def __call__(self, input, *outputs):
+        args = list(self.head)
+        args.append(input)
+        args += self.outputs(*outputs)
+        return args
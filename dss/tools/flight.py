@@ -0,0 +1,42 @@
+"""
+    Run a function once for concurrent callers.
+
+    Usage:
+
+    flight = SingleFlight(futures.ThreadPoolExecutor(4))
+    a = flight.run('key', load, 'key')
+    b = flight.run('key', load, 'key')  # Same future as "a", load runs once
+"""
+from __future__ import absolute_import
+
+from . import thread
+
+
+class SingleFlight(object):
+    """ Calls submitted to `executor` with a key. While a call is running,
+        others with the same key share its future instead of running
+        again.
+    """
+    def __init__(self, executor):
+        self.executor = executor
+        self.lock = thread.Lock()
+        self.running = {}  # Key -> future
+
+    def __len__(self):
+        return len(self.running)
+
+    def run(self, key, fn, *args, **kw):
+        with self.lock:
+            future = self.running.get(key)
+            if future is not None:
+                return future
+            future = self.executor.submit(fn, *args, **kw)
+            self.running[key] = future
+        # May run right away, so the lock must not be held.
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def _done(self, key, future):
+        with self.lock:
+            if self.running.get(key) is future:
+                del self.running[key]
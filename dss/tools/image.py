@@ -0,0 +1,52 @@
+"""
+    Thumbnail resizing with Pillow (optional dependency).
+"""
+from __future__ import absolute_import
+import io
+import os
+
+from .os import atomic_write
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def parse_size(size):
+    """ "320x240" -> (320, 240) """
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+def image_format(name):
+    """ Pillow format name for a file name, like "JPEG" for "a.jpg".
+    """
+    ext = os.path.splitext(name)[1].lower()
+    return Image.registered_extensions()[ext]
+
+
+def save_sizes(data, outputs, sizes):
+    """ Decode a single image (any format Pillow reads, e.g. PPM) and save
+        it on each file of `outputs`: the first in the original size and
+        the others resized to each "WxH" of `sizes`.
+
+        Files are replaced atomically. This is meant to run on a process
+        pool, so the arguments are simple types. The encoded images are
+        returned.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    encoded = []
+    for name, size in zip(outputs, [None] + list(sizes)):
+        resized = image
+        if size is not None:
+            resized = image.resize(parse_size(size), Image.BILINEAR)
+        buff = io.BytesIO()
+        resized.save(buff, format=image_format(name))
+        atomic_write(name, buff.getvalue())
+        encoded.append(buff.getvalue())
+    return encoded
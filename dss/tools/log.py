@@ -1,15 +1,30 @@
 """ Add logging capabilities to DSS
+
+    Messages are made on the calling thread and put on a queue, and a
+    background thread per log file writes them in batches. Producers
+    never block: when the queue is full, the message is dropped and
+    counted, and the amount is written on the log when there is room
+    again.
 """
 from __future__ import absolute_import
+import atexit
 import os
 import os.path
 import datetime
+import sys
+import time
 import makeobj
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 from ..config import config
 from . import thread
 
-logdir = config['log']['dir']
+_conf = config['log']
+logdir = _conf['dir']
 
 
 class Levels(makeobj.Obj):
@@ -20,45 +35,193 @@ class Levels(makeobj.Obj):
     max = 99
 
 
-class Writer(object):
+def message(args, sep=' '):
+    """ Text of a message, made on the calling thread so it shows the
+        state of the objects at the time of the call.
+    """
+    text = []
+    for arg in args:
+        try:
+            text.append(str(arg))
+        except Exception as e:
+            text.append('<{0} not printable: {1!r}>'.format(
+                type(arg).__name__, e))
+    return sep.join(text)
+
+
+class QueueWriter(object):
+    """ Records formatted and written in batches by a background thread,
+        started on the first record.
+    """
+    queue_size = _conf.getint('queue_size')
+    batch = _conf.getint('batch')
+    _instances = []
+
+    def __init__(self):
+        self.queue = queue.Queue(self.queue_size)
+        self.lock = thread.Lock()
+        self.thread = None
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, *record):
+        """ Queue a record. It is dropped if the queue is full.
+        """
+        if self.thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = thread.Thread(self.run)
+                self.thread.daemon = True
+                self.thread.start()
+                QueueWriter._instances.append(self)
+
+    def run(self):
+        while True:
+            # Wait for the first record, then take what is queued.
+            records = [self.queue.get()]
+            while len(records) < self.batch and records[-1] is not None:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = records[-1] is None
+            if stop:
+                records.pop()
+
+            with self.lock:
+                dropped, self.dropped = self.dropped, 0
+            try:
+                self.write(records, dropped)
+            except Exception as e:
+                sys.stderr.write('Could not write log: {0!r}\n'.format(e))
+            self.written += len(records)
+            if stop:
+                self.close()
+                return
+
+    def write(self, records, dropped):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stop(self, timeout=5):
+        """ Write what is queued and stop the thread.
+        """
+        with self.lock:
+            thread_ = self.thread
+        if thread_ is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread_.join(timeout)
+
+    @classmethod
+    def stop_all(cls):
+        for writer in cls._instances:
+            writer.stop()
+
+atexit.register(QueueWriter.stop_all)
+
+
+class Writer(QueueWriter):
+    """ Log file rotated when it gets over `max_size` bytes or older than
+        `rotate_interval` seconds (zero disables each), keeping `backups`
+        old files (name.1 is the newest).
+    """
+    max_size = _conf.get_size('max_size')
+    rotate_interval = _conf.get_duration('rotate_interval')
+    backups = _conf.getint('backups')
 
     def __init__(self, filename):
+        super(Writer, self).__init__()
         self.filename = filename
-        self._opened = False
         self.file = None
-        self.lock = thread.Lock()
+        self.opened_at = None
         self._format = '[{date}] [{owner}] {level.name}: {message}'
 
-    def format(self, owner, level, message):
-        now = datetime.datetime.now()
+    def format(self, created, owner, level, message):
         return self._format.format(
-            date=now,
+            date=datetime.datetime.fromtimestamp(created),
             message=message,
             owner=owner or '',
             level=level,
         ) + '\n'
 
-    def add(self, *args):
-        # TODO Add to queue and write on another thread.
-        with self.lock:
-            self._write(*args)
-
-    def _write(self, owner, level, message):
-        text = self.format(owner, level, message)
-        if not self._opened:
-            self.file = open(os.path.join(logdir, self.filename), 'a')
-            self._opened = True
-
-        self.file.write(text)
+    def write(self, records, dropped):
+        text = []
+        for record in records:
+            try:
+                text.append(self.format(*record))
+            except Exception as e:
+                text.append(self.format(time.time(), 'Log', Levels.error,
+                                        'Could not format a message: '
+                                        '{0!r}'.format(e)))
+        if dropped:
+            text.append(self.format(
+                time.time(), 'Log', Levels.warn,
+                '{0} messages dropped: the log queue was full'.format(dropped)
+            ))
+
+        if self.file is not None and self.should_rotate():
+            try:
+                self.rotate()
+            except (IOError, OSError) as e:
+                sys.stderr.write('Could not rotate log: {0!r}\n'.format(e))
+        if self.file is None:
+            self.open()
+        self.file.write(''.join(text))
         self.file.flush()
 
-    def __del__(self):
-        if self._opened:
+    @property
+    def path(self):
+        return os.path.join(logdir, self.filename)
+
+    def open(self):
+        self.file = open(self.path, 'a')
+        self.opened_at = time.time()
+
+    def should_rotate(self):
+        if self.max_size and self.file.tell() >= self.max_size:
+            return True
+        return bool(self.rotate_interval) and \
+            time.time() - self.opened_at >= self.rotate_interval
+
+    def rotate(self):
+        """ Close the file and rename the backups. The file is opened
+            again on the next write, even if renaming fails.
+        """
+        self.close()
+        name = self.path
+        if self.backups:
+            for ix in range(self.backups - 1, 0, -1):
+                old = '{0}.{1}'.format(name, ix)
+                if os.path.exists(old):
+                    os.rename(old, '{0}.{1}'.format(name, ix + 1))
+            os.rename(name, name + '.1')
+        else:
+            os.remove(name)
+
+    def close(self):
+        if self.file is not None:
             self.file.close()
+            self.file = None
 
 
 class Log(object):
     _writers = {}
+    level = Levels(_conf['level']).value
 
     def __init__(self, owner, filename):
         self.owner = owner
@@ -68,7 +231,18 @@ class Log(object):
             self._writers[filename] = self.writer
 
     def log(self, message, level=Levels.info):
-        self.writer.add(self.owner, level, message)
+        self.log_args((message,), level=level)
+
+    def log_args(self, args, sep=' ', level=Levels.info):
+        """ Log `args` joined by `sep`. The message is made here and
+            written on the writer thread.
+        """
+        if level.value >= self.level:
+            self.log_message(message(args, sep), level)
+
+    def log_message(self, text, level=Levels.info):
+        if level.value >= self.level:
+            self.writer.add(time.time(), self.owner, level, text)
 
     def __getattr__(self, name):
         level = Levels(name)
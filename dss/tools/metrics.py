@@ -0,0 +1,108 @@
+"""
+    Prometheus text exposition format.
+
+    Usage:
+
+    warmup = Histogram([1, 5, 10, 30])
+    warmup.observe(3.2)
+
+    out = Exposition()
+    out.add('dss_streams', 'gauge', 'Known streams', [({}, 10)])
+    out.histogram('dss_warmup_seconds', 'Warmup time', warmup)
+    out.render()  # Text for the /metrics endpoint
+"""
+from __future__ import absolute_import
+import bisect
+
+from . import thread
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """ Counts of the observed values by upper bound, updated as they are
+        observed, so exporting it doesn't depend on the amount of values.
+    """
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.lock = thread.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0.
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """ Cumulative counts of each bucket (+Inf last) and the sum.
+        """
+        with self.lock:
+            counts = self.counts[:]
+            total = self.sum
+        cumulative = []
+        count = 0
+        for value in counts:
+            count += value
+            cumulative.append(count)
+        return cumulative, total
+
+
+def _value(value):
+    if type(value) is float:
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(int(value))
+
+
+def labels(values):
+    """ Labels from a dictionary, formatted once to be used on many
+        samples.
+    """
+    if not values:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, str(value).replace('\\', r'\\')
+                           .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in sorted(values.items())
+    ) + '}'
+
+
+class Exposition(object):
+    """ Metric families written in the text format.
+    """
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name, type, help, samples):
+        """ A family with `samples` of (labels, value). The labels are a
+            dictionary or a string made by `labels`.
+        """
+        self.lines.append('# HELP {0} {1}'.format(name, help))
+        self.lines.append('# TYPE {0} {1}'.format(name, type))
+        self.lines.extend([
+            name + (labels(x) if isinstance(x, dict) else x) + ' ' + _value(v)
+            for x, v in samples
+        ])
+
+    def histogram(self, name, help, histogram, histogram_labels=None):
+        cumulative, total = histogram.snapshot()
+        base = histogram_labels or {}
+        bounds = [_value(float(x)) for x in histogram.buckets] + ['+Inf']
+
+        self.lines.append('# HELP {0} {1}'.format(name, help))
+        self.lines.append('# TYPE {0} histogram'.format(name))
+        for bound, count in zip(bounds, cumulative):
+            self.lines.append('{0}_bucket{1} {2}'.format(
+                name, labels(dict(base, le=bound)), count))
+        self.lines.append('{0}_sum{1} {2}'.format(
+            name, labels(base), _value(total)))
+        self.lines.append('{0}_count{1} {2}'.format(
+            name, labels(base), cumulative[-1]))
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
@@ -4,10 +4,11 @@
 from __future__ import absolute_import
 
 from xml.etree import ElementTree
+import io
 import itertools
 import operator
 
-__all__ = 'load', 'load_node'
+__all__ = 'load', 'load_node', 'PathParser'
 
 
 def _sorted_groupby(thing, key=None):
@@ -53,3 +54,60 @@ def load_node(root, root_tag=False, lists=()):
         return None
 
     return place
+
+
+class PathParser(object):
+    """ Incremental parser of the elements ending on some tag paths, so
+        the values needed from a big document are taken while it is
+        received, without building the whole tree.
+
+        parser = PathParser([('live', 'stream')])
+        for path, element in parser.feed(chunk):
+            ...
+        for path, element in parser.close():
+            ...
+
+        Each element is cleared when the next one is taken, so its
+        values must be read before that.
+    """
+    def __init__(self, paths):
+        self.paths = [tuple(x) for x in paths]
+        self.tags = []
+        self.previous = None
+        try:
+            self.parser = ElementTree.XMLPullParser(['start', 'end'])
+        except AttributeError:
+            # Python 2: the document is parsed when closed.
+            self.parser = None
+            self.chunks = []
+
+    def feed(self, data):
+        if self.parser is None:
+            self.chunks.append(data)
+            return []
+        self.parser.feed(data)
+        return self._elements(self.parser.read_events())
+
+    def close(self):
+        if self.parser is None:
+            events = ElementTree.iterparse(io.BytesIO(b''.join(self.chunks)),
+                                           ['start', 'end'])
+            self.chunks = []
+            return self._elements(events)
+        self.parser.close()
+        return self._elements(self.parser.read_events())
+
+    def _elements(self, events):
+        for event, element in events:
+            if event == 'start':
+                self.tags.append(element.tag)
+                continue
+            path = tuple(self.tags)
+            self.tags.pop()
+            for expected in self.paths:
+                if path[-len(expected):] == expected:
+                    if self.previous is not None:
+                        self.previous.clear()
+                    self.previous = element
+                    yield expected, element
+                    break
@@ -3,7 +3,10 @@
 """
 from __future__ import absolute_import
 
+import itertools
 import os
+import tempfile
+import time
 import warnings
 
 try:
@@ -11,6 +14,24 @@ try:
 except ImportError:
     fcntl = None
 
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+try:
+    scandir = os.scandir
+except AttributeError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Python 2: rename is atomic on POSIX, but fails on Windows if it exists.
+replace = getattr(os, 'replace', os.rename)
+
 PIPE_SIZE = None
 try:
     with open('/proc/sys/fs/pipe-max-size') as f:
@@ -39,4 +60,175 @@ def pipe_nonblock_read(pipe):
             RuntimeWarning
         )
         return
-    fcntl.fcntl(pipe, fcntl.F_SETFL, os.O_NONBLOCK)
\ No newline at end of file
+    fcntl.fcntl(pipe, fcntl.F_SETFL, os.O_NONBLOCK)
+
+
+def write_all(fd, buffers):
+    """ Write a list of buffers to a blocking file descriptor using as few
+        system calls as possible (`os.writev` if available, or a single
+        joined buffer otherwise).
+        Return the number of system calls used.
+    """
+    if not hasattr(os, 'writev'):
+        view = memoryview(b''.join(buffers))
+        calls = 0
+        while True:
+            written = os.write(fd, view)
+            calls += 1
+            if written >= len(view):
+                return calls
+            view = view[written:]
+
+    calls = 0
+    start = 0
+    buffers = list(buffers)
+    while start < len(buffers):
+        written = os.writev(fd, buffers[start:start + IOV_MAX])
+        calls += 1
+        # Skip complete buffers and slice the partially written one.
+        while start < len(buffers) and written >= len(buffers[start]):
+            written -= len(buffers[start])
+            start += 1
+        if written:
+            buffers[start] = memoryview(buffers[start])[written:]
+    return calls
+
+
+def atomic_write(name, data):
+    """ Replace the content of a file at once, so readers never see it
+        partially written. A hidden temporary file is written on the same
+        directory and renamed over the original.
+    """
+    dirname, basename = os.path.split(name)
+    fd, tmp = tempfile.mkstemp(prefix='.' + basename, dir=dirname or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        replace(tmp, name)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class _DirEntry(object):
+    """ Minimal `os.DirEntry` for Python versions without `scandir`.
+    """
+    def __init__(self, dirname, name):
+        self.name = name
+        self.path = os.path.join(dirname, name)
+
+
+def iter_dir(dirname):
+    if scandir is not None:
+        return scandir(dirname)
+    return (_DirEntry(dirname, name) for name in os.listdir(dirname))
+
+
+class DirectoryCleaner(object):
+    """ Remove groups of files not modified for `max_age` seconds.
+
+        A group is the file "<id><extension>" and its variants
+        "<id><variant><extension>". Only the first is checked, then the
+        whole group is removed and `on_delete(id, path)` is called for
+        each file. Variants left without it are removed at the end of
+        the sweep if they are old too.
+
+        Each `step` reads at most `batch` directory entries, continuing
+        the sweep of the previous step, so it can run often on a timer
+        without long pauses. Leftovers of atomic writes (hidden or ".tmp"
+        files) are removed as well.
+    """
+    def __init__(self, dirname, extension, variants=(), max_age=3600,
+                 batch=1000, on_delete=None):
+        self.dirname = dirname
+        self.extension = extension
+        self.variants = [v + extension for v in variants]
+        self.max_age = max_age
+        self.batch = batch
+        self.on_delete = on_delete
+        self.entries = None
+        self.cutoff = None
+        self._reset()
+
+    def _reset(self):
+        self.main = set()
+        self.orphans = set()
+        self.deleted = set()
+
+    def step(self):
+        """ Continue the sweep. Return the set of deleted ids when the
+            sweep finishes, otherwise None.
+        """
+        if self.entries is None:
+            self.entries = iter_dir(self.dirname)
+            self.cutoff = time.time() - self.max_age
+
+        count = 0
+        for entry in itertools.islice(self.entries, self.batch):
+            self.check(entry)
+            count += 1
+        if count == self.batch:
+            return None
+
+        close = getattr(self.entries, 'close', None)
+        if close is not None:
+            close()
+        self.entries = None
+
+        for id in self.orphans - self.main:
+            self.remove(id, self.variants, check=True)
+        deleted = self.deleted
+        self._reset()
+        return deleted
+
+    def sweep(self):
+        while True:
+            deleted = self.step()
+            if deleted is not None:
+                return deleted
+
+    def check(self, entry):
+        name = entry.name
+        if name.startswith('.') or name.endswith('.tmp'):
+            if self.is_old(entry.path):
+                self._remove(entry.path)
+            return
+
+        if not name.endswith(self.extension):
+            return
+        for variant in self.variants:
+            if name.endswith(variant):
+                self.orphans.add(name[:-len(variant)])
+                return
+
+        id = name[:-len(self.extension)]
+        self.main.add(id)
+        if self.is_old(entry.path):
+            # The variants are written together, so they are old too.
+            self.remove(id, [self.extension] + self.variants)
+
+    def is_old(self, path):
+        try:
+            return os.path.getmtime(path) < self.cutoff
+        except OSError:
+            return False
+
+    def remove(self, id, suffixes, check=False):
+        for suffix in suffixes:
+            path = os.path.join(self.dirname, id + suffix)
+            if check and not self.is_old(path):
+                continue  # Missing or updated meanwhile
+            if self._remove(path):
+                self.deleted.add(id)
+                if self.on_delete is not None:
+                    self.on_delete(id, path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
@@ -8,17 +8,21 @@ from ..config import config
 LOG_DIR = config['log']['dir']
 
 
+def log_file(id, mode):
+    """ File name for the error output of a process.
+    """
+    return os.path.join(LOG_DIR, '{0}-{1}'.format(mode, id)) \
+        if config.getboolean('log', 'enable_process_log') \
+        else os.devnull
+
+
 def run_proc(id, cmd, mode):
     """ Open process with error output redirected to file.
         The standart output can be read.
 
         This should be used as a context manager to close the log file.
     """
-    log = os.path.join(LOG_DIR, '{0}-{1}'.format(mode, id)) \
-        if config.getboolean('log', 'enable_process_log') \
-        else os.devnull
-
-    with open(log, 'w') as f:
+    with open(log_file(id, mode), 'w') as f:
         return Popen(
             cmd,
             stdout=PIPE,
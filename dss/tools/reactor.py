@@ -0,0 +1,229 @@
+"""
+    Single thread running timers and watching child processes.
+
+    Usage:
+
+    reactor = Reactor()
+    timer = reactor.call_later(10, function, arg1, arg2)
+    reactor.cancel(timer)
+    reactor.watch(popen_object, callback)  # callback(popen_object)
+
+    All callbacks run on the reactor thread, which is started on the
+    first call.
+
+    On Linux (Python 3.9+) the end of a child process is notified through
+    a pidfd. Otherwise, watched processes are polled every `poll_interval`.
+"""
+from __future__ import absolute_import
+import heapq
+import itertools
+import os
+import select
+import socket
+import traceback
+
+from . import thread
+from .show import Show
+
+show = Show('Reactor')
+
+
+class Timer(object):
+    __slots__ = ('when', 'function', 'args', 'cancelled', 'done')
+
+    def __init__(self, when, function, args):
+        self.when = when
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        self.done = False
+
+
+class Reactor(object):
+    poll_interval = 0.5  # seconds
+    use_pidfd = hasattr(os, 'pidfd_open') and hasattr(select, 'poll')
+
+    def __init__(self, name='Reactor'):
+        self.name = name
+        self.lock = thread.Lock()
+        self.thread = None
+        self.running = False
+        self._timers = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._pidfds = {}  # pidfd -> (process, callback)
+        self._polled = {}  # process -> callback
+        self._wake_in, self._wake_out = socket.socketpair()
+        self._wake_in.setblocking(False)
+        self._poller = select.poll() if self.use_pidfd else None
+        if self._poller is not None:
+            self._poller.register(self._wake_in.fileno(), select.POLLIN)
+
+    def start(self):
+        with self.lock:
+            self._start()
+        return self
+
+    def _start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = thread.Thread(self.run, name=self.name).start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            thread_ = self.thread
+        self._wake()
+        if thread_ is not None:
+            thread_.join()
+
+    @property
+    def in_reactor(self):
+        return thread.threading.current_thread() is self.thread
+
+    def _wake(self):
+        if not self.in_reactor:
+            try:
+                self._wake_out.send(b'x')
+            except socket.error:
+                pass  # Buffer full: it will wake anyway.
+
+    def call_later(self, delay, function, *args):
+        """ Run `function(*args)` after `delay` seconds on the reactor
+            thread. Return a `Timer` that can be cancelled.
+        """
+        timer = Timer(thread.monotonic() + delay, function, args)
+        with self.lock:
+            self._start()
+            heapq.heappush(self._timers, (timer.when, next(self._counter), timer))
+            first = self._timers[0][2] is timer
+        if first:
+            self._wake()
+        return timer
+
+    def call_soon(self, function, *args):
+        return self.call_later(0, function, *args)
+
+    def cancel(self, timer):
+        """ Cancel a timer and keep track of the cancelled ones still on
+            the heap to remove them when they are too many.
+        """
+        if timer is None:
+            return
+        with self.lock:
+            if timer.cancelled or timer.done:
+                timer.cancelled = True
+                return
+            timer.cancelled = True
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled > len(self._timers) // 2:
+                self._timers = [x for x in self._timers if not x[2].cancelled]
+                heapq.heapify(self._timers)
+                self._cancelled = 0
+
+    def watch(self, process, callback):
+        """ Call `callback(process)` on the reactor thread when the
+            process finishes.
+        """
+        pidfd = None
+        if self.use_pidfd:
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except OSError:
+                pass
+
+        with self.lock:
+            self._start()
+            if pidfd is not None:
+                self._pidfds[pidfd] = (process, callback)
+                self._poller.register(pidfd, select.POLLIN)
+            else:
+                self._polled[process] = callback
+        self._wake()
+
+    def _timeout(self):
+        with self.lock:
+            timeout = None
+            if self._timers:
+                timeout = max(self._timers[0][0] - thread.monotonic(), 0)
+            if self._polled:
+                timeout = self.poll_interval if timeout is None \
+                    else min(timeout, self.poll_interval)
+            return timeout
+
+    def _wait(self, timeout):
+        """ Wait for events until timeout and return the finished
+            processes with their callbacks.
+        """
+        finished = []
+        if self._poller is not None:
+            ms = None if timeout is None else int(timeout * 1000) + 1
+            for fd, _ in self._poller.poll(ms):
+                if fd == self._wake_in.fileno():
+                    self._drain()
+                    continue
+                with self.lock:
+                    process, callback = self._pidfds.pop(fd)
+                    self._poller.unregister(fd)
+                os.close(fd)
+                finished.append((process, callback))
+        else:
+            read, _, _ = select.select([self._wake_in], [], [], timeout)
+            if read:
+                self._drain()
+
+        with self.lock:
+            polled = list(self._polled.items())
+        for process, callback in polled:
+            if process.poll() is not None:
+                with self.lock:
+                    self._polled.pop(process, None)
+                finished.append((process, callback))
+        return finished
+
+    def _drain(self):
+        try:
+            while self._wake_in.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def _due_timers(self):
+        now = thread.monotonic()
+        due = []
+        with self.lock:
+            while self._timers and self._timers[0][0] <= now:
+                timer = heapq.heappop(self._timers)[2]
+                timer.done = True
+                if timer.cancelled:
+                    self._cancelled -= 1
+                else:
+                    due.append(timer)
+        return due
+
+    def _call(self, function, *args):
+        try:
+            function(*args)
+        except Exception:
+            show.error(traceback.format_exc())
+
+    def run(self):
+        while self.running:
+            for process, callback in self._wait(self._timeout()):
+                # Reap it. It is already finished.
+                process.wait()
+                self._call(callback, process)
+
+            for timer in self._due_timers():
+                # It may have been cancelled by a previous callback
+                with self.lock:
+                    cancelled = timer.cancelled
+                if not cancelled:
+                    self._call(timer.function, *timer.args)
+
+    def count(self):
+        """ Number of active timers and watched processes.
+        """
+        with self.lock:
+            return (len(self._timers) - self._cancelled,
+                    len(self._pidfds) + len(self._polled))
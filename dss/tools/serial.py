@@ -0,0 +1,60 @@
+"""
+    Run calls in order on a shared thread pool.
+
+    Usage:
+
+    pool = futures.ThreadPoolExecutor(8)
+    serial = SerialExecutor(pool)
+    a = serial.submit(save, 1)
+    b = serial.submit(save, 2)  # Runs after "a", on any thread of the pool
+"""
+from __future__ import absolute_import
+import collections
+
+from concurrent import futures
+
+from . import thread
+
+
+class SerialExecutor(object):
+    """ Calls submitted to it run one at a time, in the order they were
+        submitted, on `executor`. Each call is submitted to `executor`
+        on its own, so a busy serial executor does not keep a thread of
+        the pool from the others.
+    """
+    def __init__(self, executor):
+        self.executor = executor
+        self.lock = thread.Lock()
+        self.queue = collections.deque()
+        self.running = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    def submit(self, fn, *args, **kw):
+        future = futures.Future()
+        with self.lock:
+            self.queue.append((future, fn, args, kw))
+            if self.running:
+                return future
+            self.running = True
+        self.executor.submit(self._run)
+        return future
+
+    def _run(self):
+        with self.lock:
+            future, fn, args, kw = self.queue.popleft()
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kw)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            with self.lock:
+                self.running = bool(self.queue)
+                more = self.running
+            if more:
+                self.executor.submit(self._run)
@@ -1,32 +1,46 @@
 from __future__ import print_function, absolute_import
 
 import sys
-from . import thread
 from . import log
 
 from ..config import config
 
 
+class Console(log.QueueWriter):
+    """ Standard output written in batches, in the order of the calls.
+    """
+    def write(self, records, dropped):
+        text = [text for text, in records]
+        if dropped:
+            text.append('[{0} messages dropped: the output queue was full]\n'
+                        .format(dropped))
+        sys.stdout.write(''.join(text))
+        sys.stdout.flush()
+
+
 class Show(object):
     save = config.getboolean('log', 'save')
     dsslog = config['log']['program_log']
-    print_lock = thread.Lock()
+    console = Console()
 
     def __init__(self, owner, filename=dsslog):
         self.logger = log.Log(owner, filename)
 
     def __call__(self, *args, **kw):
-        """ Print message with lock.and log it.
+        """ Print message and log it. Messages below the log level are
+            ignored. The others are made here, with the state of the
+            arguments at the time of the call, and written on the output
+            and log threads.
         """
         level = kw.pop('level', log.Levels.info)
+        if level.value < log.Log.level:
+            return
 
-        with self.print_lock:
-            print(*args, **kw)
-            sys.stdout.flush()
+        text = log.message(args, kw.get('sep', ' '))
+        self.console.add(text + kw.get('end', '\n'))
 
         if self.save:
-            sep = kw.get('sep', ' ')
-            self.logger.log(sep.join(map(str, args)), level=level)
+            self.logger.log_message(text, level=level)
 
     def __getattr__(self, name):
         level = log.Levels(name)
@@ -13,6 +13,12 @@ if not isinstance(Timer, type):
     # Python 2.x compatibility.
     Timer = threading._Timer
 
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2.x compatibility: timeouts follow the system clock.
+    monotonic = time
+
 
 class MetaLockedObject(type):
     def __init__(cls, what, bases, dict):
@@ -0,0 +1,89 @@
+"""
+    Hashed timer wheel for many timeouts renewed often.
+
+    Usage:
+
+    wheel = TimerWheel(reactor, tick=1, size=128)
+    wheel.schedule(key, 30, callback)  # callback(key) after ~30 seconds
+    wheel.schedule(key, 30, callback)  # Renew: the first one is dropped
+    wheel.cancel(key)
+
+    Scheduling, renewing and cancelling are O(1). The callbacks run on the
+    reactor thread, up to one tick late. While the wheel is empty, it does
+    not tick.
+"""
+from __future__ import absolute_import, division
+import math
+
+from . import thread
+
+
+class TimerWheel(object):
+
+    def __init__(self, reactor, tick=1, size=128):
+        self.reactor = reactor
+        self.tick = tick
+        self.lock = thread.Lock()
+        self.slots = [{} for _ in range(size)]  # key -> [rounds, callback]
+        self.where = {}  # key -> slot index
+        self.position = 0
+        self.timer = None
+        self.next_tick = None
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, delay, callback):
+        """ Call `callback(key)` after `delay` seconds, replacing any
+            previous timeout of `key`.
+        """
+        size = len(self.slots)
+        with self.lock:
+            now = thread.monotonic()
+            if self.timer is None:
+                self.next_tick = now + self.tick
+                self.timer = self.reactor.call_later(self.tick, self._tick)
+
+            # Count from the next tick, so it never expires early.
+            ticks = int(math.ceil((delay - (self.next_tick - now))
+                                  / self.tick)) + 1
+            ticks = max(ticks, 1)
+            index = (self.position + ticks) % size
+            self._remove(key)
+            self.slots[index][key] = [(ticks - 1) // size, callback]
+            self.where[key] = index
+
+    def cancel(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        index = self.where.pop(key, None)
+        if index is not None:
+            del self.slots[index][key]
+
+    def _tick(self):
+        expired = []
+        with self.lock:
+            self.position = (self.position + 1) % len(self.slots)
+            slot = self.slots[self.position]
+            for key, entry in list(slot.items()):
+                if entry[0]:
+                    entry[0] -= 1
+                else:
+                    del slot[key]
+                    del self.where[key]
+                    expired.append((key, entry[1]))
+
+            if self.where:
+                self.next_tick += self.tick
+                self.timer = self.reactor.call_later(
+                    max(self.next_tick - thread.monotonic(), 0), self._tick)
+            else:
+                self.timer = None
+
+        for key, callback in expired:
+            self.reactor.call_soon(callback, key)
@@ -1,5 +1,6 @@
 from __future__ import division
-import time
+import collections
+import random
 import warnings
 
 try:
@@ -8,64 +9,290 @@ try:
 except ImportError:
     from urllib2 import urlopen
 
+from tornado import gen, httpclient, ioloop
+
 from .config import config
 from .providers import Providers
 from .tools import process, thread, noxml
+from .tools.reactor import Reactor
 from .tools.show import Show
-from .stats import StreamStats
+from .tools.wheel import TimerWheel
+from .stats import StreamStats, StatsStore
+from .storage import db
 
 show = Show('Video')
 
+# Watch all FFmpeg processes and run the stream timers on a single thread.
+reactor = Reactor('Video')
+
+# HTTP client leases of all streams.
+_local = config['local']
+_tick = _local.getint('http_client_resolution')
+leases = TimerWheel(reactor, _tick,
+                    _local.getint('http_client_timeout_max') // _tick + 2)
+
 
 class StreamHTTPClient(object):
     """ Emulate the behaviour of a RTMP client when there's an HTTP access
         for a certain Stream. If no other HTTP access is made within the
         timeout period, the `Stream` instance will be decremented.
+
+        The leases of all streams are kept on the `leases` timer wheel.
     """
     def __init__(self, parent):
-        self.lock = thread.Condition()
-        self.timeout = None
         self.parent = parent
-        self._stop()
 
     def wait(self, timeout):
-        self.timeout = timeout
-        if not self._stopped:
-            with self.lock:
-                self._stop(restart=True)
-                self.lock.notify_all()
-        else:
-            self.thread = thread.Thread(self._wait_worker).start()
+        """ Start or renew the lease for `timeout` seconds.
+        """
+        leases.schedule(self, timeout, self._expire)
         return self
 
-    def _wait_worker(self):
+    def _expire(self, key):
+        self.parent.dec(http=True)
+
+    def __bool__(self):
+        return self in leases
+    __nonzero__ = __bool__
+
+
+class Backoff(object):
+    """ Exponential delay with jitter between restarts of a process.
+    """
+    _ffmpeg = config['ffmpeg']
+    initial = _ffmpeg.getint('reload')
+    maximum = _ffmpeg.getint('reload_max')
+    factor = _ffmpeg.getfloat('reload_factor')
+    jitter = _ffmpeg.getfloat('reload_jitter')
+
+    def __init__(self):
+        self.attempts = 0
+
+    def reset(self):
+        self.attempts = 0
+
+    def next(self):
+        try:
+            delay = self.initial * self.factor ** self.attempts
+        except OverflowError:
+            delay = self.maximum
+        if delay < self.maximum:
+            # Not counted past the maximum, so the power doesn't grow.
+            self.attempts += 1
+        else:
+            delay = self.maximum
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class CircuitBreaker(object):
+    """ Restart control for all streams of a provider.
+
+        If most of the streams of a provider died, the source is probably
+        down. Instead of restarting all of them, only one stream (the
+        probe) is allowed to restart until it gets published.
+
+        The breaker does not open before `min_samples` streams (up or
+        dead) are known, so a few deaths while the other streams are
+        still starting are not taken as the source being down.
+    """
+    _ffmpeg = config['ffmpeg']
+    ratio = _ffmpeg.getfloat('breaker_ratio')
+    min_dead = _ffmpeg.getint('breaker_min')
+    min_samples = _ffmpeg.getint('breaker_samples')
+
+    _breakers = {}
+    _breakers_lock = thread.Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = thread.Lock()
+        self.up = set()
+        self.dead = set()
+        self.probe = None
+        self.is_open = False
+
+    @classmethod
+    def select(cls, name):
+        with cls._breakers_lock:
+            breaker = cls._breakers.get(name)
+            if breaker is None:
+                breaker = cls._breakers[name] = cls(name)
+            return breaker
+
+    def died(self, id):
+        with self.lock:
+            self.up.discard(id)
+            self.dead.add(id)
+            if self.probe == id:
+                self.probe = None
+
+            dead = len(self.dead)
+            total = dead + len(self.up)
+            if not self.is_open and dead >= self.min_dead \
+                    and total >= self.min_samples \
+                    and dead >= self.ratio * total:
+                self.is_open = True
+                show.warn('{0} of {1} streams of provider {2!r} died. '
+                          'Probing before restarting them.'.format(
+                              dead, total, self.name))
+
+    def published(self, id):
+        with self.lock:
+            self.dead.discard(id)
+            self.up.add(id)
+            if self.is_open:
+                self.is_open = False
+                self.probe = None
+                show('Provider {0!r} is back.'.format(self.name))
+
+    def stopped(self, id):
         with self.lock:
-            while self._stopped:
-                self._start()
-                self.lock.wait(self.timeout)
-            self._stop()
-            self.parent.dec(http=True)
+            self.dead.discard(id)
+            self.up.discard(id)
+            if self.probe == id:
+                self.probe = None
 
-    def _stop(self, restart=False, data=True):
-        self._stopped = data
-        if not restart:
-            self._stopped_info = data
+    def allow_restart(self, id):
+        with self.lock:
+            if not self.is_open:
+                return True
+            if self.probe is None:
+                self.probe = id
+            return self.probe == id
 
-    def _start(self):
-        self._stop(data=False)
 
-    def __bool__(self):
-        return not self._stopped_info
-    __nonzero__ = __bool__
+class Supervisor(object):
+    """ Decide when a dead stream process should be restarted.
+
+        Each death increases the waiting time exponentially until the
+        stream is published again. If the restart budget is exhausted
+        within the window, the stream is crash looping and waits for
+        the maximum delay.
+    """
+    _ffmpeg = config['ffmpeg']
+    restart_budget = _ffmpeg.getint('restart_budget')
+    restart_window = _ffmpeg.getint('restart_window')
+
+    def __init__(self, stream, provider):
+        self.stream = stream
+        self.backoff = Backoff()
+        self.breaker = CircuitBreaker.select(provider.identifier)
+        self.deaths = collections.deque()
+
+    def died(self):
+        """ Register a death and return the delay before restarting.
+        """
+        now = thread.monotonic()
+        self.deaths.append(now)
+        while self.deaths and self.deaths[0] < now - self.restart_window:
+            self.deaths.popleft()
+
+        self.breaker.died(self.stream.id)
+        delay = self.backoff.next()
+        crash_loop = len(self.deaths) > self.restart_budget
+        if crash_loop:
+            delay = self.backoff.maximum
+        self.stream.stats.timed.restart_scheduled(delay, crash_loop)
+        return delay
+
+    def probe_delay(self):
+        """ Return None if the process can be restarted now. Otherwise,
+            the provider is being probed by another stream and the delay
+            before asking again is returned.
+        """
+        if self.breaker.allow_restart(self.stream.id):
+            return None
+        delay = self.backoff.next()
+        self.stream.stats.timed.restart_scheduled(delay)
+        return delay
+
+    def published(self):
+        self.backoff.reset()
+        self.breaker.published(self.stream.id)
+
+    def stopped(self):
+        self.breaker.stopped(self.stream.id)
+
+
+class Linger(object):
+    """ Idle time before stopping the process of a stream without
+        clients, learned from the gaps between the last client leaving
+        and the next one arriving.
+
+        The linger covers most of the recent gaps (`percentile`), so the
+        viewers coming back find the process running. If they don't
+        come back within `maximum`, or too many processes are already
+        lingering (`budget`), the process is stopped after `minimum`.
+    """
+    _ffmpeg = config['ffmpeg']
+    minimum = _ffmpeg.getint('linger_min')
+    maximum = _ffmpeg.getint('linger_max')
+    percentile = _ffmpeg.getfloat('linger_percentile')
+    budget = _ffmpeg.getint('linger_budget')
+    min_samples = 3
+    margin = 1.25
+
+    lingering = set()
+    _lingering_lock = thread.Lock()
+
+    def __init__(self, id, default):
+        self.id = id
+        self.default = default
+        self.gaps = collections.deque(maxlen=20)
+        self.left = None
+
+    def leave(self):
+        """ The last client left. Return the linger in seconds.
+        """
+        self.left = thread.monotonic()
+        with self._lingering_lock:
+            if len(self.lingering) >= self.budget:
+                return self.minimum
+            self.lingering.add(self.id)
+        return self.delay()
+
+    def arrive(self):
+        """ A client arrived without other clients. Return the gap since
+            the last one left, or None if unknown.
+        """
+        self.done()
+        if self.left is None:
+            return None
+        gap, self.left = thread.monotonic() - self.left, None
+        self.gaps.append(gap)
+        return gap
+
+    def done(self):
+        """ Not lingering anymore.
+        """
+        with self._lingering_lock:
+            self.lingering.discard(self.id)
+
+    def delay(self):
+        if len(self.gaps) < self.min_samples:
+            return self.default
+        gaps = sorted(self.gaps)
+        gap = gaps[min(int(len(gaps) * self.percentile), len(gaps) - 1)]
+        if gap > self.maximum:
+            return self.minimum
+        return min(max(gap * self.margin, self.minimum), self.maximum)
 
 
 class Stream(object):
+    """ FFmpeg process fetching a provider stream while it has clients.
+
+        The process and the stream timers (restart delay and idle stop)
+        are handled by the `reactor` thread.
+    """
     _ffmpeg = config['ffmpeg']
     run_timeout = _ffmpeg.getint('timeout')
-    reload_timeout = _ffmpeg.getint('reload')
+
+    # Function returning extra FFmpeg outputs for periodic snapshots of
+    # the stream, set by the thumbnail downloader.
+    snapshot = None
 
     def __init__(self, id, timeout=run_timeout):
-        self.lock = thread.Lock()
+        self.lock = thread.RLock()
         self.id = id
         provider = Providers.select(id)
         try:
@@ -74,18 +301,22 @@ class Stream(object):
             # The prefix match but the id is not real
             raise KeyError('Invalid id for {0.identifier!r} ({0.name}) provider'.format(provider))
 
+        self.provider = provider
         self.fn = lambda self=self: process.run_proc(
             self.id,
-            provider.make_cmd(self.id),
+            self.make_cmd(),
             'fetch'
         )
         self.cnt = 0
         self._proc_run = False
         self.proc = None
-        self.thread = None
-        self.timeout = timeout
+        self.idle_timer = None
+        self.restart_timer = None
         self.http_client = StreamHTTPClient(self)
-        self.stats = StreamStats()
+        self.stats = StreamStats(WarmPool.half_life)
+        self.linger = Linger(id, timeout)
+        self.warm = False
+        self.supervisor = Supervisor(self, provider)
 
     def __repr__(self):
         pid = self.proc.pid if self.proc else None
@@ -110,18 +341,26 @@ class Stream(object):
 
     def inc(self, k=1, http_wait=None):
         """ Increment user count unless it is a http user (then http_wait
-            must be set). If so, it should wait a period of time on another
-            thread and the clients property will be indirectly incremented.
+            must be set). If so, a lease is started for that period of time
+            and the clients property will be indirectly incremented.
 
             If there is no process running and it should be, a new process
             will be started.
         """
-        if http_wait:
-            self.http_client.wait(http_wait)
-        else:
-            self.cnt += k
-        if not self.proc and not self.proc_run:
-            self.proc_start()
+        with self.lock:
+            if not self.clients:
+                self._arrival()
+            if http_wait:
+                if not self.http_client:
+                    self.stats.viewers.arrival()
+                self.http_client.wait(http_wait)
+            else:
+                self.cnt += k
+                self.stats.viewers.arrival()
+            self._cancel_idle()
+            reconciler.touch(self.id)
+            if not self.proc_run:
+                self.proc_start()
         show(self)
         return self
 
@@ -132,76 +371,493 @@ class Stream(object):
         if not http:
             if self.cnt:
                 self.cnt -= 1
+            reconciler.touch(self.id)
         if not self.clients:
             self.proc_stop()
         show(self)
         return self
 
+    def set_count(self, count):
+        """ Set the RTMP user count to the one reported by the RTMP server.
+        """
+        with self.lock:
+            diff = count - self.cnt
+            if diff < 0:
+                self.cnt = count
+        if diff > 0:
+            self.inc(diff)
+        elif diff < 0 and not self.clients:
+            self.proc_stop()
+        return diff
+
+    def _arrival(self):
+        """ First client after an idle period: the process was kept
+            running for it (hit) or it has to wait the warmup (miss).
+        """
+        gap = self.linger.arrive()
+        if gap is not None:
+            self.stats.linger.inc(not self.proc_run)
+
+    def set_warm(self, value):
+        """ Keep the process running without clients (or not).
+        """
+        with self.lock:
+            self.warm = self.stats.warm = value
+            if value:
+                self._cancel_idle()
+                if not self.proc_run:
+                    self.proc_start()
+            elif not self.clients:
+                self.proc_stop()
+
+    def published(self):
+        """ The RTMP server reported the stream publication.
+        """
+        # Measure the amount of time since process start
+        # to RTMP stream publication.
+        self.stats.timed.warmup()
+        self.supervisor.published()
+
+    @property
+    def has_snapshot(self):
+        return self.snapshot is not None and self.provider.thumbnail_local
+
+    def make_cmd(self):
+        args = self.provider.make_cmd(self.id)
+        if self.has_snapshot:
+            args += Stream.snapshot(self.id)
+        return args
+
     def _proc_msg(self, pid, msg):
         return '{0} - FFmpeg[{1}] {2}'.format(self.id, pid, msg)
 
     def proc_start(self):
-        """ Process starter on another thread.
+        """ Start the process on the reactor thread.
+        """
+        self.proc_run = True
+        reactor.call_soon(self._spawn, 'started')
+
+    def _spawn(self, msg):
+        with self.lock:
+            if not self.proc_run or self.proc is not None:
+                return
+            try:
+                self.proc = self.fn()
+            except OSError as e:
+                show.error(self._proc_msg(None, 'failed to start: {0}'.format(e)))
+                self._schedule_restart(None)
+                return
+            pid = self.proc.pid
+            reactor.watch(self.proc, self._exited)
+            reconciler.touch(self.id)
+        self.stats.timed.started()
+        show(self._proc_msg(pid, msg))
+
+    def _exited(self, proc):
+        """ Called by the reactor when a process finishes.
         """
-        def worker():
-            self.proc_run = True
-            start_msg = 'started'
-            while True:
-                with self.fn() as self.proc:
-                    self.stats.timed.started()
-                    pid = self.proc and self.proc.pid
-                    show(self._proc_msg(pid, start_msg))
-                    self.proc.wait()
-                    self.proc = None
-
-                    if self.proc_run:  # Should be running, but isn't
-                        self.stats.timed.died()
-                        show.warn(self._proc_msg(pid, 'died'))
-                        time.sleep(self.reload_timeout)
-                        if self.proc_run:  # It might have been stopped after waiting
-                            start_msg = 'restarted'
-                            continue
-                    show(self._proc_msg(pid, 'stopped'))
-                    break
-
-        self.thread = thread.Thread(worker).start()
+        # Close the output pipe
+        with proc:
+            pass
+
+        with self.lock:
+            if self.proc is proc:
+                self.proc = None
+                reconciler.touch(self.id)
+            died = self.proc_run and not getattr(proc, 'killed', False)
+            if died:
+                self._schedule_restart(proc.pid)
+        if not died:
+            self._stopped(proc.pid)
+
+    def _schedule_restart(self, pid):
+        # Should be running, but isn't
+        self.stats.timed.died()
+        delay = self.supervisor.died()
+        show.warn(self._proc_msg(pid, 'died (restart in {0:.1f}s)'.format(delay)))
+        self.restart_timer = reactor.call_later(delay, self._restart)
+
+    def _restart(self):
+        with self.lock:
+            self.restart_timer = None
+            if not self.proc_run:
+                return
+            delay = self.supervisor.probe_delay()
+            if delay is not None:
+                self.restart_timer = reactor.call_later(delay, self._restart)
+                return
+        self.stats.timed.restarted()
+        self._spawn('restarted')
+
+    def _stopped(self, pid):
+        self.supervisor.stopped()
+        show(self._proc_msg(pid, 'stopped'))
 
     def _kill(self):
         """ Kill the FFmpeg process. Don't call this function directly,
             otherwise the process may be restarted. Call `proc_stop` instead.
         """
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        proc.killed = True
         try:
-            self.proc.kill()
-            self.proc.wait()
-        except (OSError, AttributeError):
+            proc.kill()
+            proc.wait()
+        except OSError:
             pass
-        finally:
-            self.proc = None
 
-    def proc_stop(self, now=False):
-        if now:
+    def _halt(self):
+        with self.lock:
             self.proc_run = False
+            if self.restart_timer is not None:
+                # Waiting for restart, so there is no process to kill.
+                reactor.cancel(self.restart_timer)
+                self.restart_timer = None
+                self._stopped(None)
             self._kill()
-            return
 
-        if not self.proc_run:
+    def proc_stop(self, now=False):
+        """ Stop the process if there are still no clients after the
+            linger period (see `Linger`), or right away if `now` is set.
+        """
+        with self.lock:
+            if now:
+                self._cancel_idle()
+                self._halt()
+            elif self.proc_run and self.idle_timer is None:
+                delay = self.linger.leave()
+                self.stats.linger_time = delay
+                self.idle_timer = reactor.call_later(delay, self._idle)
+
+    def _cancel_idle(self):
+        reactor.cancel(self.idle_timer)
+        self.idle_timer = None
+        self.linger.done()
+
+    def _idle(self):
+        with self.lock:
+            self.idle_timer = None
+            self.linger.done()
+            if not self.clients and not self.warm:
+                self._halt()
+
+
+class WarmPool(object):
+    """ Keep the processes of the most wanted streams running, so their
+        first viewers don't wait for FFmpeg to start and publish.
+
+        Streams are ranked by the viewer demand (arrivals decaying with
+        `half_life`) times the mean warmup time, which is the waiting
+        saved per viewer. At most `size` streams are kept warm.
+    """
+    _conf = config['warm_pool']
+    size = _conf.getint('size')
+    interval = _conf.getint('interval')
+    half_life = _conf.getint('half_life')
+    min_demand = _conf.getfloat('min_demand')
+
+    warm = set()
+    timer = None
+
+    @classmethod
+    def start(cls):
+        if cls.size > 0:
+            cls.timer = reactor.call_soon(cls.update)
+
+    @classmethod
+    def stop(cls):
+        reactor.cancel(cls.timer)
+        cls.timer = None
+
+    @classmethod
+    def rank(cls, streams):
+        scores = []
+        for stream in streams:
+            demand = stream.stats.viewers.demand()
+            if demand >= cls.min_demand:
+                # Unknown warmup counts as one second.
+                warmup = stream.stats.timed.warmup_mean() or 1
+                scores.append((demand * warmup, stream.id, stream))
+        scores.sort(reverse=True)
+        return [x[2] for x in scores[:cls.size]]
+
+    @classmethod
+    def update(cls):
+        with Video._data_lock:
+            streams = list(Video._data.values())
+        warm = set(cls.rank(streams))
+
+        for stream in cls.warm - warm:
+            stream.set_warm(False)
+        for stream in warm - cls.warm:
+            show('Keeping {0} warm'.format(stream.id))
+            stream.set_warm(True)
+        cls.warm = warm
+        cls.timer = reactor.call_later(cls.interval, cls.update)
+
+
+StreamStat = collections.namedtuple('StreamStat',
+                                    'name nclients publishing bw_in')
+
+
+class StatParser(object):
+    """ Streams of the RTMP application `app` on the nginx-rtmp stat page,
+        taken while the page is received.
+    """
+    paths = ('application', 'name'), ('live', 'stream')
+
+    def __init__(self, app):
+        self.app = app
+        self.parser = noxml.PathParser(self.paths)
+        self.current = None
+        self.found = False
+        self.streams = []
+
+    def feed(self, data):
+        self._add(self.parser.feed(data))
+
+    def close(self):
+        self._add(self.parser.close())
+        if not self.found:
+            raise RuntimeError('No app named %r' % self.app)
+        return self.streams
+
+    def _add(self, elements):
+        for path, element in elements:
+            if path == ('application', 'name'):
+                self.current = (element.text or '').strip()
+                self.found = self.found or self.current == self.app
+            elif self.current == self.app:
+                self.streams.append(StreamStat(
+                    (element.findtext('name') or '').strip(),
+                    int(element.findtext('nclients') or 0),
+                    element.find('publishing') is not None,
+                    int(element.findtext('bw_in') or 0),
+                ))
+
+
+class StatPoller(object):
+    """ Poll the nginx-rtmp stat page every `interval` seconds on the
+        Tornado IOLoop and pass the streams to the `reconciler`.
+    """
+    _http = config['http-server']
+    url = _http['addr'] + _http['stat_url']
+    interval = _http.get_duration('stat_interval')
+    timeout = _http.get_duration('stat_timeout')
+
+    def __init__(self):
+        self.app = config['rtmp-server']['app']
+        self.callback = None
+        self.polling = False
+
+    def start(self):
+        if self.interval > 0:
+            self.callback = ioloop.PeriodicCallback(self.poll,
+                                                    self.interval * 1000)
+            self.callback.start()
+
+    def stop(self):
+        if self.callback is not None:
+            self.callback.stop()
+            self.callback = None
+
+    def fetch(self):
+        """ Blocking fetch of the streams, used before the IOLoop starts.
+        """
+        parser = StatParser(self.app)
+        response = urlopen(self.url, timeout=self.timeout)
+        for data in iter(lambda: response.read(65536), b''):
+            parser.feed(data)
+        return parser.close()
+
+    @gen.coroutine
+    def poll(self):
+        if self.polling:
             return
-        self.proc_run = False
+        self.polling = True
+        parser = StatParser(self.app)
+        try:
+            yield httpclient.AsyncHTTPClient().fetch(
+                self.url, streaming_callback=parser.feed,
+                request_timeout=self.timeout)
+            streams = parser.close()
+        except Exception as e:
+            show.warn('Could not poll the RTMP stats:', repr(e))
+        else:
+            reconciler.update(streams)
+        finally:
+            self.polling = False
 
-        def stop_worker():
-            time.sleep(self.timeout)
-            if not self.clients:
-                self._kill()
+
+class Reconciler(object):
+    """ Make the streams agree with the state of the RTMP server:
+
+        - the RTMP user counts are set to the ones reported by nginx;
+        - processes left running after their stream stopped are killed;
+        - publishers of provider streams that are not running are
+          dropped;
+        - processes not publishing after `publish_timeout` seconds are
+          killed, so they are restarted.
+
+        Only the streams that changed on the stat page since the last
+        update, the streams touched by callbacks or process events and
+        the ones waiting for a confirmation are checked, so the cost
+        depends on the amount of changes instead of the amount of streams.
+
+        Callbacks may be on the way while nginx makes the page, so counts
+        and publishers are only fixed after two updates in a row report
+        the same difference.
+    """
+    _http = config['http-server']
+    drop_url = '{0}{1}/drop/publisher'.format(_http['addr'],
+                                              _http['control_url'])
+    publish_timeout = config['ffmpeg'].get_duration('publish_timeout')
+
+    def __init__(self):
+        self.app = config['rtmp-server']['app']
+        self.lock = thread.Lock()
+        self.snapshot = {}  # Stream id -> (users, publishing)
+        self.synced = False  # Every stream is checked on the first update
+        self.touched = set()
+        self.pending = {}  # Stream id -> (users, orphan publisher)
+        self.waiting = {}  # Stream id -> (pid, time not publishing since)
+        self.invalid = set()
+
+    def touch(self, id):
+        """ The local state of a stream changed.
+        """
+        with self.lock:
+            self.touched.add(id)
+
+    def update(self, streams, confirm=True):
+        """ Reconcile the streams parsed from the stat page. Streams not
+            on the page have no users and no publisher.
+
+            Without `confirm` (at startup), the differences are fixed at
+            once and providers are initialized on the calling thread.
+        """
+        snapshot = {}
+        for stat in streams:
+            snapshot[stat.name] = (max(stat.nclients - stat.publishing, 0),
+                                   stat.publishing)
+        previous, self.snapshot = self.snapshot, snapshot
+
+        changed = set(previous) - set(snapshot)
+        for id, value in snapshot.items():
+            if previous.get(id) != value:
+                changed.add(id)
+        with self.lock:
+            changed |= self.touched
+            self.touched = set()
+        changed.update(self.pending, self.waiting)
+
+        with Video._data_lock:
+            if not self.synced:
+                changed.update(Video._data)
+            known = [(id, Video._data.get(id)) for id in changed]
+        self.synced = True
+
+        pending, self.pending = self.pending, {}
+        now = thread.monotonic()
+        for id, stream in known:
+            users, publishing = snapshot.get(id, (0, False))
+            last = pending.get(id, (None, False))
+            self._users(id, stream, users, not confirm or last[0] == users,
+                        block=not confirm)
+            if stream is not None:
+                self._process(id, stream, publishing, now)
+            if stream is None:
+                orphan = publishing and self.has_provider(id)
             else:
-                self.proc_run = True
+                orphan = publishing and not stream.alive
+            if orphan:
+                if not confirm or last[1]:
+                    self.drop(id)
+                else:
+                    self._pend(id, orphan=True)
+
+    @staticmethod
+    def has_provider(id):
+        """ Streams without a provider (e.g. mobile streams) are published
+            by other processes.
+        """
+        try:
+            Providers.select(id)
+        except KeyError:
+            return False
+        return True
+
+    def _pend(self, id, users=None, orphan=False):
+        old = self.pending.get(id, (None, False))
+        self.pending[id] = (old[0] if users is None else users,
+                            old[1] or orphan)
+
+    def _users(self, id, stream, users, confirmed, block=False):
+        if (stream.cnt if stream else 0) == users:
+            return
+        if not confirmed:
+            self._pend(id, users=users)
+            return
+        if stream is not None:
+            diff = stream.set_count(users)
+            show('Reconciled {0} users: {1:+d}'.format(id, diff))
+        elif id not in self.invalid:
+            if not block and Video.prepare(id) is not None:
+                # Not blocking the IOLoop, try again on the next update.
+                self._pend(id, users=users)
+                return
+            try:
+                Video.start(id, users)
+            except KeyError:
+                self.invalid.add(id)
+                warnings.warn('Invalid stream name: %r' % id)
+
+    def _process(self, id, stream, publishing, now):
+        with stream.lock:
+            proc = stream.proc
+            if proc is not None and not stream.proc_run:
+                show.warn(stream._proc_msg(proc.pid, 'orphan, killed'))
+                stream._kill()
+                proc = None
+
+        if proc is None or publishing:
+            self.waiting.pop(id, None)
+            return
+        pid, since = self.waiting.get(id, (None, None))
+        if pid != proc.pid:
+            self.waiting[id] = (proc.pid, now)
+        elif now - since >= self.publish_timeout:
+            # Not marked as killed, so it is restarted.
+            del self.waiting[id]
+            show.warn(stream._proc_msg(pid, 'not publishing, killed'))
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def drop(self, id):
+        """ Drop the publisher of a stream that is not running.
+        """
+        show.warn('Dropping the orphan publisher of {0}'.format(id))
+        url = '{0}?app={1}&name={2}'.format(self.drop_url, self.app, id)
+        future = httpclient.AsyncHTTPClient().fetch(url, raise_error=False)
+        ioloop.IOLoop.current().add_future(future, self._dropped)
+
+    def _dropped(self, future):
+        if future.exception() is not None:
+            show.warn('Could not drop a publisher:',
+                      repr(future.exception()))
 
-        thread.Thread(stop_worker).start()
+reconciler = Reconciler()
 
 
 class Video(object):
     _data = {}
     _data_lock = thread.Lock()
     run = True
+    stats_store = None
+    stat_poller = StatPoller()
 
     @classmethod
     def start(cls, id, increment=1, http_wait=None):
@@ -212,55 +868,42 @@ class Video(object):
     def stop(cls, id):
         cls.get_stream(id).dec()
 
+    @classmethod
+    def prepare(cls, id):
+        """ Future of the blocking work needed before `get_stream` creates
+            the stream (the provider initialization), or None if there is
+            nothing to wait for.
+        """
+        if id in cls._data:
+            return None
+        try:
+            provider = Providers.select(id)
+        except KeyError:
+            return None
+        return Providers.initialize(provider)
+
     @classmethod
     def get_stream(cls, id):
         with cls._data_lock:
             stream = cls._data.get(id)
             if stream is None:
                 stream = Stream(id)
+                if cls.stats_store is not None:
+                    cls.stats_store.restore(id, stream.stats)
                 cls._data[id] = stream
             return stream
 
-    @classmethod
-    def get_stats(cls):
-        http = config['http-server']
-        addr = http['addr']
-        stat = http['stat_url']
-        data = urlopen(addr + stat).read()
-        return noxml.load(data, ('stream', 'application'))
-
     @classmethod
     def initialize_from_stats(cls):
         try:
-            stats = cls.get_stats()['server']['application']
+            streams = cls.stat_poller.fetch()
         except IOError:
             return
+        reconciler.update(streams, confirm=False)
 
-        app = config['rtmp-server']['app']
-        try:
-            app = next(x['live'] for x in stats if x['name'] == app)
-        except StopIteration:
-            raise RuntimeError('No app named %r' % app)
-
-        # App clients
-        stream_list = app.get('stream')
-        if stream_list is None:
-            return
-
-        for stream in stream_list:
-            # Stream clients
-            nclients = int(stream['nclients'])
-
-            if 'publishing' in stream:
-                nclients -= 1
-
-            if nclients <= 0:
-                continue
-
-            try:
-                cls.start(stream['name'], nclients)
-            except KeyError:
-                warnings.warn('Invalid stream name: %r' % stream['name'])
+    @classmethod
+    def start_stat_poller(cls):
+        cls.stat_poller.start()
 
     @classmethod
     def auto_start(cls):
@@ -272,9 +915,40 @@ class Video(object):
             for id in streams:
                 cls.start(id)
 
+    @classmethod
+    def start_warm_pool(cls):
+        WarmPool.start()
+
+    @classmethod
+    def load_stats(cls):
+        """ Restore the stats saved by the last run and save them
+            periodically.
+        """
+        if not config['stats'].getboolean('save'):
+            return
+
+        def streams():
+            with cls._data_lock:
+                return [(id, s.stats) for id, s in cls._data.items()]
+
+        store = StatsStore(db.stats, streams)
+        try:
+            show('Loaded stats of {0} streams'.format(store.load()))
+        except Exception as e:
+            # Saving now would replace the stats not loaded.
+            show.error('Could not load stream stats:', repr(e))
+            return
+        cls.stats_store = store
+        store.start()
+
     @classmethod
     def terminate_streams(cls):
+        cls.stat_poller.stop()
+        WarmPool.stop()
         with cls._data_lock:
             cls.run = False
             for strm in cls._data.values():
                 strm.proc_stop(now=True)
+        reactor.stop()
+        if cls.stats_store is not None:
+            cls.stats_store.stop()
@@ -8,7 +8,7 @@ from os.path import join, basename, splitext
 from .config import config, dirname
 from .tools.show import Show
 from .loader import load_object
-from .web_handlers import stream_control, stream_stats, info, mobile_stream, view
+from .web_handlers import stream_control, stream_stats, info, mobile_stream, view, thumbnail, metrics
 
 show = Show('Web')
 
@@ -18,11 +18,15 @@ STATIC_PATH = os.path.join(os.path.dirname(dirname), 'www', '')
 
 def build_application():
     controllers = [
+        (r'/control/notify', stream_control.NotifyHandler),
+        (r'/control/batch', stream_control.BatchHandler),
         (r'/control/(.*?)/(' + stream_control.options + r')/?(\d*)',
          stream_control.StreamControlHandler),
         (r'/stats/([^/]*)/?(.*)', stream_stats.StreamStatsHandler),
         (r'/info/(' + info.options + r')/?(.*)', info.InfoHandler),
         (r'/mobile/location', mobile_stream.MobileStreamLocation),
+        (r'/thumb/([^/.]+)\.?(\w+)?', thumbnail.ThumbnailHandler),
+        (r'/metrics', metrics.MetricsHandler),
     ]
     package = 'web_handlers_ext'
 
@@ -1,5 +1,6 @@
 import tornado.web
 from bson import json_util
+from tornado import gen
 
 from .. import providers
 
@@ -9,7 +10,14 @@ options = '|'.join([
 
 
 class InfoHandler(tornado.web.RequestHandler):
+    """ Providers and streams information:
+            /info/provider/[{provider}]
+            /info/stream/{id}
 
+        Providers are initialized on the provider threads.
+    """
+
+    @gen.coroutine
     def get(self, opt, id=None, **kw):
         data = None
 
@@ -23,17 +31,31 @@ class InfoHandler(tornado.web.RequestHandler):
                 ]
             else:
                 try:
-                    data = list(providers_[id].stream_data().values())
+                    provider = providers_[id]
                 except KeyError:
                     self.set_status(404)
                     return
+                yield self.initialize_provider(provider)
+                data = list(provider.stream_data().values())
         elif opt == 'stream':
             if not id:
                 self.set_status(404)
                 return
-            data = providers.Providers.select(id).get_stream_data(id)
+            try:
+                provider = providers.Providers.select(id)
+            except KeyError:
+                self.set_status(404)
+                return
+            yield self.initialize_provider(provider)
+            data = provider.get_stream_data(id)
 
         self.set_header('Content-Type', 'application/json')
         self.finish(json_util.dumps(data))
 
     post = get
+
+    @gen.coroutine
+    def initialize_provider(self, provider):
+        future = providers.Providers.initialize(provider)
+        if future is not None:
+            yield future
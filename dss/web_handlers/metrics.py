@@ -0,0 +1,127 @@
+import tornado.web
+from .. import video
+from ..mobile.handler import MediaHandler
+from ..stats import StreamStats
+from ..thumbnail import Thumbnail
+from ..tools.metrics import Exposition, CONTENT_TYPE, labels
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """ Metrics of the streams, FFmpeg processes, thumbnails and mobile
+        streams in the Prometheus text format:
+            /metrics
+
+        The stats of all streams come from a single snapshot and the
+        histograms are updated as the values are observed.
+    """
+    _labels = {}  # Stream id -> labels, formatted once
+
+    @classmethod
+    def stream_labels(cls, stream):
+        try:
+            return cls._labels[stream.id]
+        except KeyError:
+            value = cls._labels[stream.id] = labels({
+                'id': stream.id, 'provider': stream.provider.identifier
+            })
+            return value
+
+    def get(self):
+        out = Exposition()
+        self.stream_metrics(out)
+        self.thumbnail_metrics(out)
+        self.mobile_metrics(out)
+
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.finish(out.render())
+
+    def stream_metrics(self, out):
+        with video.Video._data_lock:
+            streams = list(video.Video._data.values())
+
+        processes = video.reactor.count()[1]
+        out.add('dss_ffmpeg_processes', 'gauge',
+                'FFmpeg processes being watched', [({}, processes)])
+        out.add('dss_streams', 'gauge', 'Streams known',
+                [({}, len(streams))])
+
+        stream_labels = [self.stream_labels(s) for s in streams]
+        data = StreamStats.table.counters([s.stats.slot for s in streams])
+
+        def family(name, type, help, values):
+            out.add(name, type, help, zip(stream_labels, values))
+
+        family('dss_stream_running', 'gauge',
+               'Whether the FFmpeg process of the stream is running',
+               [bool(s.proc) for s in streams])
+        family('dss_stream_clients', 'gauge', 'Viewers of the stream',
+               [s.clients for s in streams])
+        family('dss_stream_warm', 'gauge',
+               'Whether the stream is kept running by the warm pool',
+               [s.warm for s in streams])
+        family('dss_stream_viewers_total', 'counter',
+               'Viewers that arrived', data['viewers'])
+        family('dss_stream_restarts_total', 'counter',
+               'Restarts after the process died',
+               data['restart_count'])
+        family('dss_stream_crashes_total', 'counter', 'Process deaths',
+               data['death_count'])
+        family('dss_stream_crash_loops_total', 'counter',
+               'Restarts delayed by the restart budget',
+               data['crash_loop_count'])
+        family('dss_stream_up_seconds_total', 'counter',
+               'Time publishing', data['uptime'])
+        family('dss_stream_seconds_total', 'counter',
+               'Time publishing, starting or dead', data['total'])
+        family('dss_stream_thumbnails_total', 'counter',
+               'Thumbnail fetches', data['thumbnail_total'])
+        family('dss_stream_thumbnail_errors_total', 'counter',
+               'Thumbnail fetches that failed',
+               data['thumbnail_count'])
+
+        out.histogram('dss_stream_warmup_seconds',
+                      'Time from the process start to the publication',
+                      StreamStats.table.warmup_histogram)
+
+    def thumbnail_metrics(self, out):
+        out.histogram('dss_thumbnail_fetch_seconds',
+                      'Duration of each thumbnail fetch',
+                      Thumbnail.fetch_time)
+        out.histogram('dss_thumbnail_lag_seconds',
+                      'Delay from the time a thumbnail was due to its fetch',
+                      Thumbnail.lag_time)
+
+        cache = Thumbnail.cache.lru.metric()
+        out.add('dss_thumbnail_cache_bytes', 'gauge',
+                'Size of the thumbnails in memory', [({}, cache['size'])])
+        out.add('dss_thumbnail_cache_hits_total', 'counter',
+                'Thumbnails served from memory', [({}, cache['hits'])])
+        out.add('dss_thumbnail_cache_misses_total', 'counter',
+                'Thumbnails not in memory', [({}, cache['misses'])])
+
+    def mobile_metrics(self, out):
+        total = MediaHandler.global_metric()
+        handlers = [h for h in MediaHandler.handlers() if h._id]
+        metrics = [h.metric() for h in handlers]
+        stream_labels = [labels({'id': m['id']}) for m in metrics]
+
+        out.add('dss_mobile_streams', 'gauge', 'Mobile streams connected',
+                [({}, total['streams'])])
+        out.add('dss_mobile_queued_bytes', 'gauge',
+                'Media of all mobile streams waiting to be consumed',
+                [({}, total['queued'])])
+        out.add('dss_mobile_ingested_bytes_total', 'counter',
+                'Media received from all mobile streams',
+                [({}, total['ingested'])])
+        out.add('dss_mobile_throttled_total', 'counter',
+                'Times a producer waited for the queues to drain',
+                [({}, total['throttled'])])
+        out.add('dss_mobile_dropped_total', 'counter',
+                'Media dropped for crossing a hard limit',
+                [({}, total['dropped'])])
+        out.add('dss_mobile_stream_queued_bytes', 'gauge',
+                'Media of the mobile stream waiting to be consumed',
+                zip(stream_labels, [m['queued'] for m in metrics]))
+        out.add('dss_mobile_stream_ingested_bytes_total', 'counter',
+                'Media received from the mobile stream',
+                zip(stream_labels, [m['ingested'] for m in metrics]))
@@ -1,4 +1,6 @@
+import json
 import tornado.web
+from tornado import gen
 
 from .. import video
 from ..tools.show import show
@@ -6,26 +8,62 @@ from ..tools.show import show
 from ..config import config
 
 
-options = '|'.join([
-    'start', 'stop', 'http', 'publish_start', 'publish_stop',
-])
+actions = ['start', 'stop', 'http', 'publish_start', 'publish_stop']
+options = '|'.join(actions)
 
 
 class StreamControlHandler(tornado.web.RequestHandler):
+    """ Stream control actions:
+            /control/{id}/{action}[/{timeout}]
+
+        The provider of a new stream is initialized on the provider
+        threads before the action, so the IOLoop is not blocked.
+    """
     timeout = config.getint('local', 'http_client_timeout')
     max_timeout = config.getint('local', 'http_client_timeout_max')
     min_timeout = config.getint('local', 'http_client_timeout_min')
 
-    def handle_start(self, id):
+    @gen.coroutine
+    def prepare_streams(self, ids):
+        """ Wait for the streams to be ready to be created. Return the ids
+            whose provider failed to initialize.
+        """
+        waiting = []
+        for id in set(ids):
+            future = video.Video.prepare(id)
+            if future is not None:
+                waiting.append((id, future))
+
+        failed = set()
+        for id, future in waiting:
+            try:
+                yield future
+            except Exception as e:
+                show('Error on provider initialization: %r' % e)
+                failed.add(id)
+        raise gen.Return(failed)
+
+    def handle(self, id, action, arg=None):
+        """ Run `action` on the stream and return the HTTP status code.
+        """
+        try:
+            handle = getattr(self, 'handle_' + action)
+            code = handle(id, arg)
+        except Exception as e:
+            show('Error on request handling: %r' % e)
+            return 500
+        return code or 200
+
+    def handle_start(self, id, arg=None):
         try:
             video.Video.start(id)
         except KeyError:
             return 404
 
-    def handle_http(self, id):
+    def handle_http(self, id, arg=None):
         try:
-            timeout = int(self.path_args[2])
-        except (IndexError, ValueError):
+            timeout = int(arg)
+        except (TypeError, ValueError):
             timeout = self.timeout
 
         timeout = max(timeout, self.min_timeout)
@@ -36,10 +74,13 @@ class StreamControlHandler(tornado.web.RequestHandler):
         except KeyError:
             return 404
 
-    def handle_stop(self, id):
-        video.Video.stop(id)
+    def handle_stop(self, id, arg=None):
+        try:
+            video.Video.stop(id)
+        except KeyError:
+            return 404
 
-    def handle_publish_start(self, id):
+    def handle_publish_start(self, id, arg=None):
         try:
             stream = video.Video.get_stream(id)
         except KeyError:
@@ -48,11 +89,9 @@ class StreamControlHandler(tornado.web.RequestHandler):
             return 403  # Should not be running
 
         #show('Nginx reported {START}:', stream)
-        # Measure the amount of time since process start
-        # to RTMP stream publication.
-        stream.stats.timed.warmup()
+        stream.published()
 
-    def handle_publish_stop(self, id):
+    def handle_publish_stop(self, id, arg=None):
         try:
             stream = video.Video.get_stream(id)
         except KeyError:
@@ -63,17 +102,73 @@ class StreamControlHandler(tornado.web.RequestHandler):
 
         #show('Nginx reported {STOP}:', stream)
 
-    def get(self, id, action, *args, **kw):
-
-        try:
-            handle = getattr(self, 'handle_' + action)
-            code = handle(id)
-        except Exception as e:
-            show('Error on request handling: %r' % e)
-            self.set_status(500)
-        else:
-            self.set_status(code or 200)
-        finally:
-            self.finish()
+    @gen.coroutine
+    def get(self, id, action, arg=None, *args, **kw):
+        failed = yield self.prepare_streams([id])
+        self.set_status(500 if failed else self.handle(id, action, arg))
+        self.finish()
 
     post = get
+
+
+class NotifyHandler(StreamControlHandler):
+    """ Native nginx-rtmp notifications, posted without forking a process
+        for each event:
+            on_play         http://localhost:8000/control/notify;
+            on_play_done    http://localhost:8000/control/notify;
+            on_publish      http://localhost:8000/control/notify;
+            on_publish_done http://localhost:8000/control/notify;
+
+        The response is always successful: nginx rejects the client
+        otherwise, and streams not handled here (like the mobile ones)
+        must still be played and published.
+    """
+    calls = {
+        'play': 'start',
+        'play_done': 'stop',
+        'publish': 'publish_start',
+        'publish_done': 'publish_stop',
+    }
+    SUPPORTED_METHODS = ('POST',)
+    app = config['rtmp-server']['app']
+
+    @gen.coroutine
+    def post(self):
+        action = self.calls.get(self.get_body_argument('call', ''))
+        name = self.get_body_argument('name', '')
+        app = self.get_body_argument('app', self.app)
+        if action and name and app == self.app:
+            failed = yield self.prepare_streams([name])
+            if not failed:
+                self.handle(name, action)
+        self.finish()
+
+
+class BatchHandler(StreamControlHandler):
+    """ Many events on a single request. The body has one event per line,
+        like the control URLs:
+            {id} {action} [{timeout}]
+
+        The response is the list of status codes of the events, in order.
+        Unknown actions have status 400.
+    """
+    SUPPORTED_METHODS = ('POST',)
+
+    @gen.coroutine
+    def post(self):
+        events = [line.split() for line in
+                  self.request.body.decode('utf-8').splitlines()]
+        events = [x for x in events if x]
+        failed = yield self.prepare_streams([x[0] for x in events])
+
+        codes = []
+        for event in events:
+            if len(event) > 3 or len(event) < 2 or event[1] not in actions:
+                codes.append(400)
+            elif event[0] in failed:
+                codes.append(500)
+            else:
+                codes.append(self.handle(*event))
+
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(codes))
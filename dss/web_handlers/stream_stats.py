@@ -1,23 +1,38 @@
 import tornado.web
 import json
+from tornado import gen
 from .. import video
 from .. import providers
+from ..config import parse_duration
+from ..stats import StreamStats
+from ..mobile.handler import MediaHandler
 
 
 class StreamStatsHandler(tornado.web.RequestHandler):
     """ Send stream stats for the user per stream or per provider.
         Usage:
-            /stats/{id}/[{field1}[,{field2}...]]
+            /stats/{id}/[{field1}[,{field2}...]][?window={duration}]
         Examples:
             /stats/C/
             /stats/C123/
             /stats/C123/thumbnail
             /stats/C/thumbnail,video,other_field
+            /stats/C123/?window=1h
 
         The "id" is either the provider identifier (non-digits) or a full
         stream identifier. If just the provider is selected, all its streams
         will be shown.
 
+        Mobile streams ("M" or "M_{id}") show the memory used by the media
+        waiting to be consumed. For "M", the first item has the totals.
+
+        Providers are initialized on the provider threads before the
+        stats of their streams are taken.
+
+        With a window ("5m", "1h", "24h"...), uptime, thumbnail, crash and
+        warmup are the ones of that last period instead of the lifetime of
+        the stream.
+
         The last part of the URI is an optional comma separated list of all
         fields the user wants to receive. If only one stream and one field
         are selected, all information but the exactly item requested will
@@ -30,32 +45,37 @@ class StreamStatsHandler(tornado.web.RequestHandler):
              {"id": "C1", "foo": 9, "bar": 0}]
     """
 
+    @gen.coroutine
     def get(self, id, metric=None, *args, **kw):
-        stream = provider = None
         try:
             use_percentage = int(self.get_argument('percent'))
         except:
             use_percentage = True
 
+        window = self.get_argument('window', None)
         try:
-            stream = video.Video.get_stream(id)
-        except KeyError:
-            try:
-                provider = providers.Providers.select(id)
-            except KeyError:
-                self.set_status(404)
-                return
-
-        if provider:
-            streams = [video.Video.get_stream(s) for s in provider.streams()]
-        else:
-            streams = [stream]
+            if window is not None:
+                window = parse_duration(window)
+        except ValueError:
+            self.set_status(400)
+            return
 
-        data = []
-        for s in streams:
-            content = s.stats.metric(percent=use_percentage)
-            content['id'] = s.id
-            data.append(content)
+        try:
+            prefix = MediaHandler.provider_prefix
+            if id == prefix or id.startswith(prefix + '_'):
+                data, provider = self.mobile_stats(id)
+            else:
+                future = video.Video.prepare(id)
+                if future is not None:
+                    yield future
+                data, provider = self.stream_stats(id, use_percentage, window)
+        except KeyError:
+            self.set_status(404)
+            return
+        except ValueError:
+            # Window longer than the history
+            self.set_status(400)
+            return
 
         original_metric = []
         if metric:
@@ -78,3 +98,36 @@ class StreamStatsHandler(tornado.web.RequestHandler):
         self.finish(json.dumps(data))
 
     post = get
+
+    def stream_stats(self, id, use_percentage, window=None):
+        stream = provider = None
+        try:
+            stream = video.Video.get_stream(id)
+        except KeyError:
+            provider = providers.Providers.select(id)
+
+        if provider:
+            streams = [video.Video.get_stream(s) for s in provider.streams()]
+        else:
+            streams = [stream]
+
+        data = StreamStats.metrics([s.stats for s in streams], use_percentage,
+                                   window)
+        for s, content in zip(streams, data):
+            content['id'] = s.id
+        return data, provider
+
+    def mobile_stats(self, id):
+        """ Memory usage of the mobile streams media queues.
+            The first item of the list has the totals.
+        """
+        handlers = [h for h in MediaHandler.handlers() if h._id]
+        if id == MediaHandler.provider_prefix:
+            data = [MediaHandler.global_metric()]
+            data.extend(h.metric() for h in handlers)
+            return data, True
+
+        for h in handlers:
+            if h.get_stream_name() == id:
+                return [h.metric()], False
+        raise KeyError(id)
@@ -0,0 +1,74 @@
+import datetime
+import email.utils
+import mimetypes
+import os
+import re
+import tornado.web
+from tornado import gen
+
+from ..config import config
+from ..thumbnail import Thumbnail
+
+
+class ThumbnailHandler(tornado.web.RequestHandler):
+    """ Latest thumbnail of a stream, from memory:
+
+            /thumb/C123.jpg
+            /thumb/C123-small.jpg
+
+        Browsers revalidating with the ETag or the modification time get
+        a 304 response while the thumbnail is the same. Thumbnails not
+        cached are read on the cache threads.
+    """
+    _thumb = config['thumbnail']
+
+    # The route matches the encoded path, names are checked once decoded.
+    valid_name = re.compile(r'^[\w-]+\Z')
+
+    @gen.coroutine
+    def get(self, name, ext=None):
+        if ext is not None and ext != self._thumb['format'] \
+                or not self.valid_name.match(name):
+            self.set_status(404)
+            return
+
+        path = os.path.join(
+            self._thumb['dir'], '{0}.{1}'.format(name, self._thumb['format'])
+        )
+        future = Thumbnail.cache.prepare(path)
+        if future is not None:
+            entry = yield future
+        else:
+            entry = Thumbnail.cache.get(path, check=False)
+        if entry is None:
+            self.set_status(404)
+            return
+
+        self._etag = entry.etag
+        self.set_etag_header()
+        self.set_header('Last-Modified',
+                        datetime.datetime.utcfromtimestamp(entry.mtime))
+        self.set_header('Cache-Control', 'no-cache')
+        self.set_header('Content-Type',
+                        mimetypes.guess_type(path)[0] or 'application/octet-stream')
+
+        if self.not_modified(entry):
+            self.set_status(304)
+            return
+        self.finish(entry.data)
+
+    head = get
+
+    def compute_etag(self):
+        return getattr(self, '_etag', None)
+
+    def not_modified(self, entry):
+        if self.request.headers.get('If-None-Match'):
+            return self.check_etag_header()
+
+        since = self.request.headers.get('If-Modified-Since')
+        if since:
+            date = email.utils.parsedate_tz(since)
+            if date is not None:
+                return int(entry.mtime) <= email.utils.mktime_tz(date)
+        return False
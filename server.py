@@ -61,7 +61,8 @@ def shutdown():
 def main():
     load(Providers.load, Providers.finish, desc='Stream Providers')
 
-    load([Video.initialize_from_stats, Video.auto_start],
+    load([Video.load_stats, Video.initialize_from_stats, Video.auto_start,
+          Video.start_warm_pool, Video.start_stat_poller],
          Video.terminate_streams,
          desc='Video Streams',
          enabled='video_start'),
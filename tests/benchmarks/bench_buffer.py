@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Benchmark for the mobile packet framing.
+
+    Compare the old `Buffer.read` strategy (a new `bytearray` extended with
+    sliced copies of the internal buffer) with `Buffer.read_into`, used by
+    `MediaHandler.read_data`, on synthetic `[T|SSSS|D...]` traffic.
+
+    Usage:
+        python tests/benchmarks/bench_buffer.py [PACKETS] [PAYLOAD_SIZE]
+"""
+from __future__ import print_function, division
+import struct
+import sys
+import time
+import tracemalloc
+from os import path
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+from dss.tools import buffer, thread
+
+HEADER_SIZE = 5
+
+
+class MemorySocket(object):
+    """ Socket-like object serving a prebuilt stream like a kernel buffer
+        limited to `chunk` bytes per call.
+    """
+    def __init__(self, content, chunk=64 * 1024):
+        self.content = memoryview(content)
+        self.chunk = chunk
+        self.pos = 0
+
+    def recv_into(self, buff, k):
+        n = min(k, self.chunk, len(self.content) - self.pos)
+        buff[:n] = self.content[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+def build_stream(packets, size):
+    payload = b'\x00' * size
+    packet = struct.pack('!BI', 1, size) + payload
+    return bytearray(packet * packets)
+
+
+@thread.lock_method
+def legacy_read(buff, amount):
+    """ `Buffer.read` as it was before `read_into` """
+    data = bytearray()
+    base = buff.buffer
+    while True:
+        new_data = base.get(amount)
+        data.extend(new_data)
+        amount -= len(new_data)
+        if not amount:
+            break
+        base.set(None, fill_later=True)
+        read = 0
+        try:
+            read = buff.socket.recv_into(base.view(), buff.read_size)
+            if not read:
+                break
+        finally:
+            base.set_fill(read)
+    return data
+
+
+def legacy_read_data(buff):
+    header = legacy_read(buff, HEADER_SIZE)
+    if not header:
+        return None, None
+    size = struct.unpack('!I', header[1:])[0]
+    payload = legacy_read(buff, size)
+    if not payload:
+        return None, None
+    return header[0], payload
+
+
+def read_data(buff, header=bytearray(HEADER_SIZE)):
+    if buff.read_into(header) < HEADER_SIZE:
+        return None, None
+    typ, size = struct.unpack_from('!BI', header)
+    payload = bytearray(size)
+    if buff.read_into(payload) < size:
+        return None, None
+    return typ, payload
+
+
+def run(name, reader, content, packets, size):
+    buff = buffer.Buffer(MemorySocket(content))
+
+    tracemalloc.start()
+    start = time.time()
+    count = 0
+    while True:
+        typ, payload = reader(buff)
+        if payload is None:
+            break
+        count += 1
+        payload = None  # Only one packet alive at a time, as in the queue
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert count == packets, (count, packets)
+    # Throughput under tracemalloc is only good for comparison.
+    print('{0:>9}: {1:10.1f} MB/s  peak memory {2:.2f}x payload'
+          ' ({3} bytes)'.format(
+              name, count * size / elapsed / 2 ** 20, peak / size, peak))
+
+
+def main():
+    packets = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 256 * 1024
+
+    content = build_stream(packets, size)
+    print('{0} packets of {1} bytes'.format(packets, size))
+    run('legacy', legacy_read_data, content, packets, size)
+    run('read_into', read_data, content, packets, size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Load test for the stream control API.
+
+    The control handlers run on a Tornado server in a child process, with
+    a provider whose streams run `sleep` instead of FFmpeg. Play and stop
+    events of STREAMS streams are sent to it as:
+
+        exec    a forked curl per event (nginx `exec_play` and friends)
+        get     a GET /control/{id}/{action} request per event
+        notify  a form POST to /control/notify per event (nginx `on_play`)
+        batch   BATCH events per POST to /control/batch
+
+    and the events handled per second are reported.
+
+    Usage:
+        python tests/benchmarks/bench_control.py [EVENTS] [STREAMS] [BATCH]
+"""
+from __future__ import print_function, division
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+from os import path
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+import tornado.web
+from tornado import gen, httpclient
+from tornado.ioloop import IOLoop
+
+from dss.config import config
+from dss.providers import BaseStreamProvider, Providers
+from dss.video import Video
+from dss.web_handlers import stream_control
+
+PORT = 18500
+URL = 'http://127.0.0.1:{0}/control/'.format(PORT)
+CONCURRENCY = 10
+APP = config['rtmp-server']['app']
+
+
+class BenchProvider(BaseStreamProvider):
+    identifier = 'BENCH'
+    name = 'Benchmark'
+    is_enabled = True
+
+    @classmethod
+    def make_cmd(cls, id):
+        return ['sleep', '3600']
+
+
+def serve(ready):
+    # Keep the stream messages out of the results.
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    Providers._insert(BenchProvider)
+    app = tornado.web.Application([
+        (r'/control/notify', stream_control.NotifyHandler),
+        (r'/control/batch', stream_control.BatchHandler),
+        (r'/control/(.*?)/(' + stream_control.options + r')/?(\d*)',
+         stream_control.StreamControlHandler),
+    ])
+    app.listen(PORT, '127.0.0.1')
+    loop = IOLoop.current()
+    signal.signal(signal.SIGTERM, lambda *args: loop.add_callback_from_signal(
+        loop.stop))
+    ready.set()
+    loop.start()
+    Video.terminate_streams()
+
+
+def make_events(total, streams):
+    events = []
+    for ix in range(total // 2):
+        id = 'BENCH{0}'.format(ix % streams)
+        events.append((id, 'start'))
+        events.append((id, 'stop'))
+    return events
+
+
+def run_exec(events, batch):
+    procs = []
+    for id, action in events:
+        procs.append(subprocess.Popen(
+            ['curl', '-s', '-o', os.devnull, URL + id + '/' + action]))
+        if len(procs) >= CONCURRENCY:
+            procs.pop(0).wait()
+    for proc in procs:
+        proc.wait()
+
+
+def send_all(requests):
+    """ Send the requests from CONCURRENCY connections. """
+    client = httpclient.AsyncHTTPClient(max_clients=CONCURRENCY)
+    requests = iter(requests)
+
+    @gen.coroutine
+    def worker():
+        for request in requests:
+            yield client.fetch(request)
+
+    @gen.coroutine
+    def send():
+        yield [worker() for _ in range(CONCURRENCY)]
+
+    IOLoop.current().run_sync(send)
+
+
+def run_get(events, batch):
+    send_all([URL + id + '/' + action for id, action in events])
+
+
+def run_notify(events, batch):
+    calls = {'start': 'play', 'stop': 'play_done'}
+    send_all([httpclient.HTTPRequest(URL + 'notify', 'POST', body=urlencode({
+        'call': calls[action], 'app': APP, 'name': id, 'addr': '127.0.0.1',
+    })) for id, action in events])
+
+
+def run_batch(events, batch):
+    send_all([httpclient.HTTPRequest(URL + 'batch', 'POST', body='\n'.join(
+        '{0} {1}'.format(*event) for event in events[ix:ix + batch]
+    )) for ix in range(0, len(events), batch)])
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    streams = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    batch = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(ready,))
+    server.start()
+    ready.wait()
+    try:
+        # Start the processes of all streams before measuring.
+        run_batch(make_events(streams * 2, streams), batch)
+
+        for name, fn in [('exec', run_exec), ('get', run_get),
+                         ('notify', run_notify), ('batch', run_batch)]:
+            events = make_events(total, streams)
+            if name == 'exec':
+                # Forking is slow, use less events.
+                events = events[:min(len(events), 2000)]
+            start = time.time()
+            fn(events, batch)
+            elapsed = time.time() - start
+            print('{0:>7}: {1:6} events {2:7.3f}s {3:9.0f} events/s'.format(
+                name, len(events), elapsed, len(events) / elapsed))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
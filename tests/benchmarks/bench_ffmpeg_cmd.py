@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Benchmark for building FFmpeg commands on mass restarts.
+
+    Builds the commands of every stream and its thumbnail fetch, as when
+    all streams are restarted at once. The `legacy` model parses the
+    configuration option strings on every command, as `dss` used to do.
+    The `template` model uses the provider `ffmpeg.Template` made on
+    `Providers.create` and the thumbnail templates.
+
+    Usage:
+        python tests/benchmarks/bench_ffmpeg_cmd.py [STREAMS...]
+"""
+from __future__ import print_function, division
+import os
+import re
+import shlex
+import sys
+import time
+from os import path
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+from dss.providers import BaseStreamProvider
+from dss.tools import ffmpeg
+
+CONF = {
+    'input_opt': '-re -rtsp_transport tcp',
+    'output_opt': '-g 15 -c:v libx264 -b:v 100k -s 320x240 -preset veryfast '
+                  '-profile:v baseline -an -f flv -vf drawtext="fontfile=/usr/'
+                  'share/fonts/truetype/freefont/FreeSans.ttf:box=1:fontsize='
+                  '20:text=%{localtime}"',
+}
+THUMB = {
+    'dir': '/tmp/thumb',
+    'input_opt': '-y',
+    'output_opt': '-an -frames:v 1',
+    'file_opt': '-atomic_writing 1',
+    'resize_opt': '-s {0}',
+    'sizes': 'medium:320x240 small:176x132',
+    'format': 'jpg',
+}
+ROUNDS = 5
+
+Provider = type('Provider', (BaseStreamProvider,), {
+    'identifier': 'B',
+    'in_stream': 'rtsp://camera.example.com/{0}',
+    'conf': CONF,
+})
+Provider.template = Provider.make_template()
+
+
+def legacy_stream(id):
+    """ `BaseStreamProvider.make_cmd` before the templates. """
+    args = [ffmpeg.bin_default] + shlex.split(CONF['input_opt'])
+    args += ['-probesize', ffmpeg.probe, '-i',
+             Provider.in_stream.format(Provider.get_stream(id))]
+    args += shlex.split(CONF['output_opt'])
+    args.append(Provider.out_stream.format(id))
+    return args
+
+
+def legacy_thumbnail(id):
+    """ `Thumbnail.make_cmd` before the templates. """
+    sizes = re.findall(r'(\w+):(\w+)', THUMB['sizes'])
+    names = [''] + ['-' + s[0] for s in sizes]
+    outputs = [
+        os.path.join(THUMB['dir'], '{0}{1}.{2}'.format(id, n, THUMB['format']))
+        for n in names
+    ]
+    resize = [''] + [THUMB['resize_opt'].format(s[1]) for s in sizes]
+    args = [ffmpeg.bin_default] + shlex.split(THUMB['input_opt'])
+    args += ['-probesize', ffmpeg.probe, '-i', Provider.out_stream.format(id)]
+    base = shlex.split(THUMB['output_opt'] + ' -ss 1 ' + THUMB['file_opt'])
+    for out_cmd, out in zip(resize, outputs):
+        args += base + shlex.split(out_cmd)
+        args.append(out)
+    return args
+
+
+def template_model():
+    sizes = re.findall(r'(\w+):(\w+)', THUMB['sizes'])
+    suffixes = [''] + ['-' + s[0] for s in sizes]
+    thumbnail = ffmpeg.Template(
+        THUMB['input_opt'],
+        THUMB['output_opt'] + ' -ss 1 ' + THUMB['file_opt'],
+        [''] + [THUMB['resize_opt'].format(s[1]) for s in sizes],
+    )
+    base = path.join(THUMB['dir'], '')
+    extension = '.' + THUMB['format']
+
+    def thumbnail_cmd(id):
+        return thumbnail(Provider.out_stream.format(id),
+                         *[base + id + s + extension for s in suffixes])
+    return Provider.make_cmd, thumbnail_cmd
+
+
+def run(name, stream_cmd, thumbnail_cmd, streams):
+    ids = [Provider.make_id(x) for x in range(streams)]
+    best = None
+    for _ in range(ROUNDS):
+        start = time.time()
+        for id in ids:
+            stream_cmd(id)
+            thumbnail_cmd(id)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('{0:>5} streams {1:>8}: {2:8.2f} ms  {3:6.1f} us/stream'.format(
+        streams, name, best * 1000, best * 10 ** 6 / streams))
+
+
+def main():
+    assert Provider.make_cmd('B7') == legacy_stream('B7')
+    assert template_model()[1]('B7') == legacy_thumbnail('B7')
+
+    sizes = [int(x) for x in sys.argv[1:]] or [1000]
+    for streams in sizes:
+        run('legacy', legacy_stream, legacy_thumbnail, streams)
+        run('template', *(template_model() + (streams,)))
+
+
+if __name__ == '__main__':
+    main()
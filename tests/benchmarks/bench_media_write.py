@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Benchmark for the mobile media writer threads.
+
+    Synthetic traffic in the shape sent by `scripts/mobile_send.py` (small
+    AAC packets interleaved with bigger H.264 ones) is queued for a writer
+    thread and read from a pipe on another thread, like FFmpeg does.
+    The writer is run with one `os.write` per packet (as `Media.run` used
+    to do) and with the batched `write_all`.
+
+    Usage:
+        python tests/benchmarks/bench_media_write.py [SECONDS] [STREAMS] [SPEED]
+
+    With SPEED set, the packets are queued at SPEED times the real time
+    rate instead of all at once.
+"""
+from __future__ import print_function, division
+import os
+import random
+import sys
+import threading
+import time
+from os import path
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+from dss.tools.os import write_all, IOV_MAX
+
+VIDEO_FPS = 30
+VIDEO_BITRATE = 4 * 10 ** 6  # bits
+AUDIO_PPS = 44100 / 1024  # AAC frames per second
+AUDIO_BITRATE = 128 * 10 ** 3
+
+
+def synthetic_packets(seconds):
+    """ Interleaved (audio, video) packets for some seconds of media.
+        Every second of video has one key frame 10 times bigger.
+    """
+    rnd = random.Random(0)
+    frame = VIDEO_BITRATE // 8 // (VIDEO_FPS + 9)
+    audio = int(AUDIO_BITRATE // 8 // AUDIO_PPS)
+    packets = []
+    for second in range(seconds):
+        events = [(i / VIDEO_FPS, 'video', frame * (10 if i == 0 else 1))
+                  for i in range(VIDEO_FPS)]
+        events += [(i / AUDIO_PPS, 'audio', audio)
+                   for i in range(int(AUDIO_PPS))]
+        for t, kind, size in sorted(events):
+            size = int(size * rnd.uniform(0.8, 1.2))
+            packets.append((second + t, kind, bytearray(size)))
+    return packets
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+
+def per_packet_writer(fd, q, counter):
+    while True:
+        data = q.get()
+        if data is None:
+            break
+        os.write(fd, data)
+        counter.calls += 1
+
+
+def batched_writer(fd, q, counter):
+    while True:
+        data = q.get()
+        if data is None:
+            break
+        batch = [data]
+        finished = False
+        while len(batch) < IOV_MAX:
+            try:
+                data = q.get_nowait()
+            except queue.Empty:
+                break
+            if data is None:
+                finished = True
+                break
+            batch.append(data)
+        counter.calls += write_all(fd, batch)
+        if finished:
+            break
+
+
+def consumer(fd):
+    while os.read(fd, 1024 * 1024):
+        pass
+
+
+def thread_time():
+    try:
+        return time.thread_time()
+    except AttributeError:
+        return time.clock()
+
+
+def run_stream(writer, packets, kind, speed, result):
+    read_fd, write_fd = os.pipe()
+    reader = threading.Thread(target=consumer, args=(read_fd,))
+    reader.start()
+
+    q = queue.Queue()
+    counter = Counter()
+    cpu = []
+
+    def target():
+        start = thread_time()
+        writer(write_fd, q, counter)
+        cpu.append(thread_time() - start)
+
+    t = threading.Thread(target=target)
+    t.start()
+    start = time.time()
+    for when, k, data in packets:
+        if k != kind:
+            continue
+        if speed:
+            delay = start + when / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        q.put(data)
+    q.put(None)
+    t.join()
+    os.close(write_fd)
+    reader.join()
+    os.close(read_fd)
+    result.append((counter.calls, cpu[0]))
+
+
+def run(name, writer, packets, streams, speed):
+    result = []
+    start = time.time()
+    threads = [
+        threading.Thread(target=run_stream, args=(writer, packets, kind, speed, result))
+        for _ in range(streams) for kind in ('audio', 'video')
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    calls = sum(x[0] for x in result) / streams
+    cpu = sum(x[1] for x in result) / streams
+    print('{0:>10}: {1:8.0f} syscalls/stream  {2:7.3f}s writer CPU/stream'
+          '  {3:6.2f}s total'.format(name, calls, cpu, elapsed))
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    streams = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    packets = synthetic_packets(seconds)
+    size = sum(len(x[2]) for x in packets)
+    print('{0} streams with {1} packets ({2:.1f} MB) each'.format(
+        streams, len(packets), size / 2 ** 20))
+    run('per packet', per_packet_writer, packets, streams, speed)
+    run('batched', batched_writer, packets, streams, speed)
+
+
+if __name__ == '__main__':
+    main()
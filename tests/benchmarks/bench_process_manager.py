@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Benchmark for the stream process management.
+
+    For every stream, a child process stands for FFmpeg and an HTTP client
+    lease is active. The `threads` model is the one `dss.video` used to
+    have (a worker thread blocked on `proc.wait()` and another one waiting
+    for the HTTP lease timeout per stream). The `reactor` model watches
+    the processes and the leases from a single `Reactor` thread.
+
+    Thread count and memory of this process are reported after all
+    streams are running, then the children are killed and the time to
+    notice all of them is measured.
+
+    Usage:
+        python tests/benchmarks/bench_process_manager.py [STREAMS...]
+"""
+from __future__ import print_function, division
+import resource
+import subprocess
+import sys
+import threading
+import time
+from os import path
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+from dss.tools import thread
+from dss.tools.reactor import Reactor
+
+CHILD = ['sleep', '3600']
+LEASE = 3600
+
+
+def memory():
+    """ Resident and virtual memory of this process in MB. """
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f)
+        return (int(status['VmRSS'].split()[0]) / 1024,
+                int(status['VmSize'].split()[0]) / 1024)
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 0
+
+
+class Finished(object):
+    def __init__(self, total):
+        self.cond = thread.Condition()
+        self.total = total
+        self.count = 0
+
+    def __call__(self, *args):
+        with self.cond:
+            self.count += 1
+            self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.count >= self.total)
+
+
+def threads_model(procs, finished):
+    lease = thread.Condition()
+
+    def lease_worker():
+        with lease:
+            lease.wait(LEASE)
+
+    workers = []
+    for proc in procs:
+        thread.Thread(lambda p=proc: finished(p.wait())).start()
+        workers.append(thread.Thread(lease_worker).start())
+
+    def stop():
+        with lease:
+            lease.notify_all()
+        for worker in workers:
+            worker.join()
+    return stop
+
+
+def reactor_model(procs, finished):
+    reactor = Reactor('Bench')
+    for proc in procs:
+        reactor.watch(proc, finished)
+        reactor.call_later(LEASE, lambda: None)
+    return reactor.stop
+
+
+def run(name, model, streams):
+    procs = [subprocess.Popen(CHILD) for _ in range(streams)]
+    finished = Finished(streams)
+    base_rss, base_vms = memory()
+    stop = model(procs, finished)
+    time.sleep(0.5)  # Let every thread reach its wait
+
+    threads = threading.active_count()
+    rss, vms = memory()
+
+    start = time.time()
+    for proc in procs:
+        proc.kill()
+    finished.wait()
+    elapsed = time.time() - start
+    stop()
+    for proc in procs:
+        proc.wait()
+
+    print('{0:>5} streams {1:>8}: {2:5} threads  +{3:7.1f} MB RSS'
+          '  +{4:8.1f} MB virtual  {5:6.3f}s to reap'.format(
+              streams, name, threads, rss - base_rss, vms - base_vms, elapsed))
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [1, 100, 1000]
+    for streams in sizes:
+        run('threads', threads_model, streams)
+        run('reactor', reactor_model, streams)
+
+
+if __name__ == '__main__':
+    main()
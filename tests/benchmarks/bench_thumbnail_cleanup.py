@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Benchmark for the removal of old thumbnails.
+
+    A thumbnail directory with FILES files (the full size and two resized
+    thumbnails per stream) is created, with a part of the streams not
+    updated for longer than `delete_after`. It is cleaned up:
+        - legacy: `Thumbnail.delete_old_thumbnails` as it was, checking
+          every stream id with `make_file_names` and `os.path.getmtime`;
+        - sweep: `DirectoryCleaner`, one `scandir` pass in batches,
+          checking only the full size file of each stream.
+
+    Usage:
+        python tests/benchmarks/bench_thumbnail_cleanup.py [FILES] [OLD_RATIO]
+"""
+from __future__ import print_function, division
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+from dss.tools.os import DirectoryCleaner
+
+SIZES = 'medium:320x240 small:176x132'
+FORMAT = 'jpg'
+DELETE_AFTER = 3600
+
+
+def make_file_names(dirname, id):
+    sizes = re.findall(r'(\w+):(\w+)', SIZES)
+    names = [''] + ['-' + s[0] for s in sizes]
+    return [path.join(dirname, '{0}{1}.{2}'.format(id, name, FORMAT))
+            for name in names]
+
+
+def populate(dirname, streams, old_ratio):
+    old = time.time() - 2 * DELETE_AFTER
+    ids = ['C{0}'.format(i) for i in range(streams)]
+    for ix, id in enumerate(ids):
+        for name in make_file_names(dirname, id):
+            with open(name, 'wb') as f:
+                f.write(b'x')
+            if ix < streams * old_ratio:
+                os.utime(name, (old, old))
+    return ids
+
+
+def legacy(dirname, ids):
+    deleted = []
+    for id in ids:
+        names = make_file_names(dirname, id)
+        try:
+            modified_time = os.path.getmtime(names[0])
+        except OSError:
+            continue
+        if time.time() - modified_time > DELETE_AFTER:
+            for name in names:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            deleted.append(id)
+    return deleted
+
+
+def sweep(dirname, ids):
+    variants = ['-' + s[0] for s in re.findall(r'(\w+):(\w+)', SIZES)]
+    return DirectoryCleaner(dirname, '.' + FORMAT, variants, DELETE_AFTER).sweep()
+
+
+def clock():
+    return time.process_time() if hasattr(time, 'process_time') else time.clock()
+
+
+def run_once(function, files, old_ratio):
+    dirname = tempfile.mkdtemp()
+    try:
+        ids = populate(dirname, files // 3, old_ratio)
+        start = time.time()
+        cpu = clock()
+        deleted = function(dirname, ids)
+        cpu = clock() - cpu
+        elapsed = time.time() - start
+        left = len(os.listdir(dirname))
+    finally:
+        shutil.rmtree(dirname)
+    return elapsed, cpu, len(deleted), left
+
+
+def run(name, function, files, old_ratio, repeat=3):
+    elapsed, cpu, deleted, left = min(
+        run_once(function, files, old_ratio) for _ in range(repeat)
+    )
+    print('{0:>7}: {1:7.3f}s  {2:7.3f}s CPU  {3} streams removed, {4} files left'
+          ' (best of {5})'.format(name, elapsed, cpu, deleted, left, repeat))
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    old_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    print('{0} files, {1:.0%} of them old'.format(files, old_ratio))
+    run('legacy', legacy, files, old_ratio)
+    run('sweep', sweep, files, old_ratio)
+
+
+if __name__ == '__main__':
+    main()
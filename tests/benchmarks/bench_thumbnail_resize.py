@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+    Benchmark for the thumbnail resizing.
+
+    A round of thumbnails is made from a synthetic 720p video file in
+    both ways supported by `Thumbnail`:
+        - ffmpeg: one FFmpeg command with an encoder output per size;
+        - pillow: FFmpeg writes one PPM frame to stdout, which is resized
+          and encoded by `dss.tools.image.save_sizes` on a process pool.
+
+    CPU time includes this process, the pool and the FFmpeg children.
+
+    Usage:
+        FFMPEG=/path/to/ffmpeg python tests/benchmarks/bench_thumbnail_resize.py [STREAMS] [WORKERS]
+"""
+from __future__ import print_function, division
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent import futures
+from os import path
+
+here = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.dirname(path.dirname(here)))
+
+from dss.tools import ffmpeg, image
+from dss.config import config
+
+BIN = os.environ.get('FFMPEG', ffmpeg.bin_default)
+thumb = config['thumbnail']
+SIZES = [('medium', '320x240'), ('small', '176x132')]
+
+
+def cpu_time():
+    total = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def make_source(dirname):
+    source = path.join(dirname, 'source.mp4')
+    subprocess.check_call([
+        BIN, '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=1280x720:rate=25',
+        '-t', '5', '-pix_fmt', 'yuv420p', source,
+    ])
+    return source
+
+
+def outputs(dirname, id):
+    return [path.join(dirname, '{0}{1}.jpg'.format(id, name))
+            for name in [''] + ['-' + s[0] for s in SIZES]]
+
+
+def ffmpeg_worker(source, dirname, id):
+    args = ffmpeg.cmd_outputs(
+        thumb['input_opt'], source, thumb['output_opt'] + ' -ss 1',
+        [''] + [thumb['resize_opt'].format(s[1]) for s in SIZES],
+        outputs(dirname, id), bin=BIN,
+    )
+    subprocess.check_call(args, stderr=open(os.devnull, 'w'))
+
+
+def pillow_worker(pool, source, dirname, id):
+    args = ffmpeg.cmd(
+        thumb['input_opt'], source,
+        thumb['output_opt'] + ' -ss 1 ' + thumb['pipe_opt'], '-', bin=BIN,
+    )
+    frame = subprocess.check_output(args, stderr=open(os.devnull, 'w'))
+    pool.submit(image.save_sizes, frame, outputs(dirname, id),
+                [s[1] for s in SIZES]).result()
+
+
+def run(name, worker, streams, workers, finish=None):
+    start_cpu = cpu_time()
+    start = time.time()
+    with futures.ThreadPoolExecutor(workers) as executor:
+        for f in [executor.submit(worker, str(i)) for i in range(streams)]:
+            f.result()
+    if finish is not None:
+        finish()
+    elapsed = time.time() - start
+    cpu = cpu_time() - start_cpu
+    print('{0:>7}: {1:7.3f}s CPU/round  {2:6.1f}ms CPU/stream  {3:6.2f}s wall'
+          .format(name, cpu, cpu / streams * 1000, elapsed))
+
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    dirname = tempfile.mkdtemp()
+    try:
+        source = make_source(dirname)
+        print('{0} streams, {1} workers, sizes: full {2}'.format(
+            streams, workers, ' '.join(s[1] for s in SIZES)))
+        run('ffmpeg', lambda id: ffmpeg_worker(source, dirname, id),
+            streams, workers)
+
+        # The pool is shut down before measuring, so the CPU time of its
+        # processes is counted as children time.
+        pool = futures.ProcessPoolExecutor(workers)
+        run('pillow', lambda id: pillow_worker(pool, source, dirname, id),
+            streams, workers, pool.shutdown)
+    finally:
+        shutil.rmtree(dirname)
+
+
+if __name__ == '__main__':
+    main()
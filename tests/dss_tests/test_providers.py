@@ -0,0 +1,52 @@
+# coding: utf-8
+import threading
+import unittest
+from dss.providers import BaseStreamProvider, Providers
+
+
+class InitializeTest(unittest.TestCase):
+
+    def make_provider(self):
+        test = self
+        building = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        class Provider(BaseStreamProvider):
+            identifier = 'TESTINIT'
+
+            @classmethod
+            def lazy_initialization(cls):
+                calls.append(cls)
+                return {1: {}, 2: {}}
+
+            @classmethod
+            def post_initialization(cls):
+                # Data is set, but the provider is not ready yet.
+                test.assertIsNotNone(cls._stream_data)
+                building.set()
+                release.wait(5)
+                super(Provider, cls).post_initialization()
+
+        return Provider, building, release, calls
+
+    def test_single_flight(self):
+        provider, building, release, calls = self.make_provider()
+        self.assertFalse(provider.initialized())
+
+        first = Providers.initialize(provider)
+        self.assertTrue(building.wait(5))
+        # Half built: callers still wait for the same initialization.
+        self.assertFalse(provider.initialized())
+        self.assertIs(Providers.initialize(provider), first)
+
+        release.set()
+        first.result(5)
+        self.assertTrue(provider.initialized())
+        self.assertEqual(provider._stream_data[1], {'id': 'TESTINIT1'})
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(Providers.initialize(provider))
+
+
+if __name__ == '__main__':
+    unittest.main()
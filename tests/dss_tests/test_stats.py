@@ -0,0 +1,240 @@
+# coding: utf-8
+import threading
+import time
+import unittest
+import pymongo
+from dss.stats import History, Ring, StatsStore, StatsTable, StreamStats
+
+
+class StreamStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = StatsTable(history=[(60, 60)])
+        self.streams = [StreamStats(table=self.table) for _ in range(20)]
+        self.stats = self.streams[3]
+
+    def test_count(self):
+        thumbnail = self.stats.thumbnail
+        for error in (False, False, False, True):
+            thumbnail.inc(error)
+        self.assertEqual(thumbnail.total, 4)
+        self.assertEqual(thumbnail.count, 1)
+        self.assertEqual(thumbnail.result(), .75)
+        self.assertEqual(self.stats.metric()['thumbnail'], 75)
+        self.assertEqual(self.streams[4].metric()['thumbnail'], 0)
+
+    def test_lifetime(self):
+        timed = self.stats.timed
+        timed.started(1000.)
+        timed.warmup(1010.)
+        timed.uptime(90)
+        self.assertEqual(timed.measure, 90)
+        self.assertEqual(timed.total, 100)
+        self.assertEqual(timed.warmup_mean(), 10)
+
+        metric = self.stats.metric()
+        self.assertEqual(metric['uptime'], 90)
+        self.assertEqual(metric['warmup'], 10)
+        self.assertEqual(self.stats.metric(percent=False)['uptime'], .9)
+
+        # A crash and a second start
+        timed.started(2000.)
+        timed.died()
+        self.assertEqual(timed.death_count, 1)
+        timed.downtime(50)
+        timed.warmup(2030.)
+        timed.uptime(20)
+        metric = self.stats.metric()
+        self.assertEqual(metric['crash'], 1)
+        self.assertEqual(metric['warmup'], 20)
+        # Uptime 90 + 20 of 100 + downtime 50 + warmup 30 + 20
+        self.assertEqual(metric['uptime'], 55)
+
+    def test_rows(self):
+        # The rows of one slot give the same metric as the whole table.
+        self.stats.timed.started(1000.)
+        self.stats.timed.warmup(1004.)
+        self.stats.timed.uptime(6)
+        self.stats.viewers.arrival()
+        self.streams[5].thumbnail.inc(True)
+
+        snapshot = self.table.snapshot(slots=[self.stats.slot])
+        self.assertEqual(list(snapshot['positions']), [0])
+        self.assertEqual(len(snapshot['uptime']), 1)
+        self.assertEqual(len(snapshot['warmups']), StatsTable.warmup_size)
+
+        now = time.time()
+        alone = self.table.metrics([self.stats.slot], now=now)
+        every = self.table.metrics([s.slot for s in self.streams], now=now)
+        self.assertEqual(alone[0], every[3])
+        self.assertEqual(alone[0]['viewers'], 1)
+        self.assertEqual(alone[0]['uptime'], 60)
+
+        alone = self.table.metrics([self.stats.slot], now=now, window=600)
+        every = self.table.metrics([s.slot for s in self.streams], now=now,
+                                   window=600)
+        self.assertEqual(alone[0], every[3])
+
+
+class RingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = Ring(10, 3)
+        self.ring.allocate(2)
+
+    def values(self, start, end, position=0):
+        return [b[position] for b in self.ring.window(start, end)]
+
+    def test_split(self):
+        self.ring.add(1, 5, 25)
+        self.assertEqual(sorted(self.ring.numbers), [0, 1, 2])
+        self.assertEqual(self.values(0, 29, 1), [5, 10, 5])
+        self.assertEqual(self.values(0, 29, 0), [0, 0, 0])
+        self.assertEqual(self.values(10, 19, 1), [10])
+
+    def test_rollover(self):
+        self.ring.add(0, 5, 5, 1)
+        self.ring.add(0, 25, 25, 2)
+        # Bucket 3 replaces bucket 0 on the same index.
+        self.ring.add(0, 35, 35, 4)
+        self.assertEqual(self.ring.numbers, [3, None, 2])
+        self.assertEqual(self.values(0, 39), [4, 2])
+        # Late values for a replaced bucket are ignored.
+        self.ring.add(0, 6, 6, 8)
+        self.assertEqual(self.values(0, 39), [4, 2])
+
+    def test_wraparound(self):
+        # A span longer than the ring only keeps its last buckets.
+        self.ring.add(1, 0, 100)
+        self.assertEqual(sorted(self.ring.numbers), [8, 9, 10])
+        self.assertEqual(sum(self.values(0, 100, 1)), 20)
+        self.ring.allocate(2)
+        self.assertEqual([len(b) for b in self.ring.window(0, 100)],
+                         [4, 4, 4])
+
+    def test_precision(self):
+        self.ring.add(0, 1, 1, 2 ** 24)
+        self.ring.add(0, 1, 1, 1)
+        self.assertEqual(self.values(0, 9), [2 ** 24 + 1])
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_window(self):
+        history = History([(60, 2), (10, 3)])
+        history.allocate()
+        history.allocate()
+        self.assertEqual(history.span, 120)
+        history.add(1, 'death_count', 95, 95, 1)
+        history.add(1, 'up', 70, 95)
+
+        # The finest ring covering the window is used.
+        buckets = history.window(70, 99)
+        self.assertEqual(len(buckets), 3)
+        sums = History.sums(buckets)
+        fields = len(History.fields)
+        self.assertEqual(sums[fields + History.index['up']], 25)
+        self.assertEqual(sums[fields + History.index['death_count']], 1)
+
+        rows = history.window(0, 100, slots=[1])
+        self.assertEqual(History.sums(rows), sums[fields:])
+        self.assertRaises(ValueError, history.window, 0, 121)
+
+
+class FakeCollection(object):
+
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.requests = []
+        self.fail = False
+
+    def find(self):
+        return [dict(x) for x in self.documents]
+
+    def bulk_write(self, requests, ordered=True):
+        if self.fail:
+            raise pymongo.errors.AutoReconnect('down')
+        self.requests.append((requests, ordered))
+
+
+class StatsStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = StatsTable(history=[(60, 60)])
+        self.streams = [('C{0}'.format(ix), StreamStats(table=self.table))
+                        for ix in range(3)]
+        self.collection = FakeCollection([{'_id': 'C1', 'viewers': 7}])
+        self.store = StatsStore(self.collection, lambda: self.streams)
+
+    def test_save(self):
+        self.assertEqual(self.store.load(), 1)
+        self.store.restore('C1', self.streams[1][1])
+        self.assertEqual(self.streams[1][1].viewers.count, 7)
+
+        self.assertEqual(self.store.save(), 3)
+        requests, ordered = self.collection.requests[-1]
+        self.assertFalse(ordered)
+        document = self.streams[0][1].export()
+        self.assertEqual(requests[0], pymongo.ReplaceOne(
+            {'_id': 'C0'}, document, upsert=True))
+        self.assertEqual(sorted(document), sorted(
+            StatsTable.saved_columns + ('uptime', 'total', 'warmups')))
+        self.assertEqual(requests[1]._doc['viewers'], 7)
+
+        # Unchanged stats are not written again.
+        self.assertEqual(self.store.save(), 0)
+        self.streams[2][1].viewers.arrival()
+        self.assertEqual(self.store.save(), 1)
+        self.assertEqual(self.collection.requests[-1][0][0]._filter,
+                         {'_id': 'C2'})
+
+    def test_error(self):
+        self.collection.fail = True
+        self.store._save()  # Logged, not raised
+        self.assertRaises(pymongo.errors.PyMongoError, self.store.save)
+        self.assertEqual(self.collection.requests, [])
+
+        # The rows not written are still pending.
+        self.collection.fail = False
+        self.assertEqual(self.store.save(limit=2), 2)
+        self.assertEqual(self.store.save(), 1)
+        self.assertEqual(self.store.save(), 0)
+
+    def test_stop(self):
+        writes = []
+
+        def bulk_write(requests, ordered=True):
+            writes.append(len(requests))
+            if len(writes) == 1:
+                raise pymongo.errors.AutoReconnect('down')
+        self.collection.bulk_write = bulk_write
+        self.store.batch = 2
+        self.store.stop()
+        self.assertEqual(writes, [2, 1])
+        self.assertEqual(len(self.store.changed()), 2)
+
+    def test_stop_running(self):
+        # The final save waits for a periodic one already writing.
+        writing = threading.Event()
+        events = []
+
+        def bulk_write(requests, ordered=True):
+            events.append(('start', len(requests)))
+            if len(events) == 1:
+                writing.set()
+                time.sleep(.2)
+            events.append(('end', len(requests)))
+        self.collection.bulk_write = bulk_write
+        self.store.interval = .01
+        self.store.batch = 2
+        self.store.start()
+        self.assertTrue(writing.wait(5))
+        self.streams[0][1].viewers.arrival()
+        self.store.stop()
+        self.assertFalse(self.store.timer.is_alive())
+        self.assertEqual(events, [('start', 2), ('end', 2),
+                                  ('start', 2), ('end', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,326 @@
+# coding: utf-8
+import unittest
+from dss.providers import BaseStreamProvider, Providers
+from dss.stats import StatsTable, StreamStats
+from dss.tools import thread
+from dss.video import Backoff, CircuitBreaker, Linger, Reconciler, \
+    StreamStat, Supervisor, Video, WarmPool
+
+
+class FakeStream(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.stats = StreamStats(table=StatsTable(history=[(60, 60)]))
+
+
+class WarmStream(FakeStream):
+
+    def __init__(self, id, viewers, warmup):
+        super(WarmStream, self).__init__(id)
+        for _ in range(viewers):
+            self.stats.viewers.arrival()
+        if warmup:
+            self.stats.timed.started(1000.)
+            self.stats.timed.warmup(1000. + warmup)
+        self.warm = False
+
+    def set_warm(self, warm):
+        self.warm = warm
+
+
+class FakeProc(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+
+
+class RunningStream(object):
+
+    def __init__(self, id, proc):
+        self.id = id
+        self.lock = thread.RLock()
+        self.proc = proc
+        self.proc_run = True
+        self.alive = True
+        self.cnt = 0
+
+    def _proc_msg(self, pid, msg):
+        return '{0} {1}: {2}'.format(self.id, pid, msg)
+
+
+class FakeProvider(object):
+    identifier = 'TESTSUP'
+
+
+class BackoffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backoff = Backoff()
+        self.backoff.initial = 10
+        self.backoff.maximum = 100
+        self.backoff.factor = 2
+        self.backoff.jitter = .2
+
+    def test_growth(self):
+        for expected in (10, 20, 40, 80, 100, 100):
+            delay = self.backoff.next()
+            self.assertTrue(expected * .8 <= delay <= expected * 1.2,
+                            (expected, delay))
+        self.backoff.reset()
+        self.assertTrue(8 <= self.backoff.next() <= 12)
+
+    def test_many_attempts(self):
+        self.backoff.factor = 2.
+        for _ in range(2000):
+            delay = self.backoff.next()
+        self.assertTrue(80 <= delay <= 120)
+        self.assertEqual(self.backoff.attempts, 4)
+
+        self.backoff.attempts = 1100
+        self.assertTrue(80 <= self.backoff.next() <= 120)
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = FakeStream('TESTSUP1')
+        self.supervisor = Supervisor(self.stream, FakeProvider)
+        self.supervisor.restart_budget = 3
+        self.supervisor.restart_window = 600
+        self.supervisor.backoff.jitter = 0
+
+    def tearDown(self):
+        self.supervisor.stopped()
+
+    def test_restart_cap(self):
+        backoff = self.supervisor.backoff
+        delays = [self.supervisor.died() for _ in range(3)]
+        self.assertEqual(delays, [backoff.initial * backoff.factor ** x
+                                  for x in range(3)])
+        self.assertEqual(self.stream.stats.metric()['crash_loop'], 0)
+
+        # The budget is exhausted: crash loop, wait for the maximum.
+        self.assertEqual(self.supervisor.died(), backoff.maximum)
+        metric = self.stream.stats.metric()
+        self.assertEqual(metric['crash_loop'], 1)
+        self.assertEqual(metric['backoff'], backoff.maximum)
+
+        # Publishing resets the growth, not the deaths in the window.
+        self.supervisor.published()
+        self.assertEqual(self.supervisor.died(), backoff.maximum)
+
+    def test_window(self):
+        # Deaths older than the window don't count.
+        old = thread.monotonic() - self.supervisor.restart_window - 1
+        self.supervisor.deaths.extend([old] * 3)
+        self.supervisor.died()
+        self.assertEqual(len(self.supervisor.deaths), 1)
+        self.assertEqual(self.stream.stats.metric()['crash_loop'], 0)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('TEST')
+        self.breaker.ratio = .5
+        self.breaker.min_dead = 3
+        self.breaker.min_samples = 6
+
+    def test_min_samples(self):
+        # Deaths before the other streams are known don't open it.
+        for id in range(4):
+            self.breaker.died(id)
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow_restart(0))
+
+        self.breaker.published(4)
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.published(5)
+        self.breaker.died(5)
+        self.assertTrue(self.breaker.is_open)
+
+    def test_ratio(self):
+        for id in range(10):
+            self.breaker.published(id)
+        for id in range(4):
+            self.breaker.died(id)
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.died(4)
+        self.assertTrue(self.breaker.is_open)
+
+        # Only the probe restarts, until a stream is published.
+        self.assertTrue(self.breaker.allow_restart(1))
+        self.assertFalse(self.breaker.allow_restart(2))
+        self.breaker.published(1)
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow_restart(2))
+
+
+class LingerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lingers = []
+
+    def tearDown(self):
+        for linger in self.lingers:
+            linger.done()
+
+    def make(self, id, gaps=()):
+        linger = Linger(id, 30)
+        linger.minimum = 5
+        linger.maximum = 120
+        linger.percentile = .8
+        linger.budget = 2
+        self.lingers.append(linger)
+        for gap in gaps:
+            linger.leave()
+            linger.left = thread.monotonic() - gap
+            linger.arrive()
+        return linger
+
+    def test_default(self):
+        linger = self.make('TESTLINGER1', [10, 20])
+        self.assertEqual(linger.leave(), 30)
+        self.assertIn('TESTLINGER1', Linger.lingering)
+
+    def test_learned(self):
+        linger = self.make('TESTLINGER1', [50, 10, 40, 20, 30])
+        # The 80th percentile gap with a margin.
+        self.assertAlmostEqual(linger.leave(), 62.5, places=2)
+
+        # Short gaps linger at least the minimum.
+        linger = self.make('TESTLINGER2', [1, 1, 1])
+        self.assertAlmostEqual(linger.leave(), 5)
+
+    def test_expiry(self):
+        # Viewers coming back after the maximum: stop after the minimum.
+        linger = self.make('TESTLINGER1', [200, 300, 400])
+        self.assertEqual(linger.leave(), 5)
+        linger = self.make('TESTLINGER2', [100, 100, 100])
+        self.assertEqual(linger.leave(), 120)
+
+    def test_arrive(self):
+        linger = self.make('TESTLINGER1')
+        self.assertIsNone(linger.arrive())
+        linger.leave()
+        self.assertIn('TESTLINGER1', Linger.lingering)
+
+        # A viewer coming back cancels the linger.
+        linger.left -= 7
+        self.assertAlmostEqual(linger.arrive(), 7, places=2)
+        self.assertNotIn('TESTLINGER1', Linger.lingering)
+        self.assertIsNone(linger.left)
+
+    def test_budget(self):
+        lingers = [self.make('TESTLINGER{0}'.format(ix)) for ix in range(3)]
+        self.assertEqual(lingers[0].leave(), 30)
+        self.assertEqual(lingers[1].leave(), 30)
+        # Too many lingering: the third one stops after the minimum.
+        self.assertEqual(lingers[2].leave(), 5)
+        self.assertNotIn('TESTLINGER2', Linger.lingering)
+
+        lingers[0].done()
+        self.assertEqual(lingers[2].leave(), 30)
+
+
+class WarmPoolTest(unittest.TestCase):
+
+    class Pool(WarmPool):
+        size = 2
+        min_demand = 1.5
+        warm = set()
+
+    def setUp(self):
+        self.streams = {
+            'A': WarmStream('A', 2, 10),
+            'B': WarmStream('B', 5, 0),
+            'C': WarmStream('C', 3, 2),
+            'D': WarmStream('D', 1, 100),
+        }
+        self.data = Video._data
+        Video._data = self.streams
+
+    def tearDown(self):
+        self.Pool.stop()
+        Video._data = self.data
+
+    def test_rank(self):
+        # Demand times warmup: A 20, C 6, B 5, D below the minimum demand.
+        ranked = self.Pool.rank(self.streams.values())
+        self.assertEqual([s.id for s in ranked], ['A', 'C'])
+
+    def test_update(self):
+        self.Pool.update()
+        self.assertEqual(sorted(s.id for s in self.Pool.warm), ['A', 'C'])
+        self.assertTrue(self.streams['A'].warm)
+        self.assertFalse(self.streams['B'].warm)
+
+        # C loses its place to B and is evicted.
+        for _ in range(5):
+            self.streams['B'].stats.viewers.arrival()
+        self.Pool.update()
+        self.assertEqual(sorted(s.id for s in self.Pool.warm), ['A', 'B'])
+        self.assertFalse(self.streams['C'].warm)
+        self.assertTrue(self.streams['B'].warm)
+        self.assertIsNotNone(self.Pool.timer)
+
+
+class ReconcilerTest(unittest.TestCase):
+
+    class Provider(BaseStreamProvider):
+        identifier = 'TESTREC'
+
+    def setUp(self):
+        Providers._insert(self.Provider, auto_enable=False)
+        Providers.enable(self.Provider.identifier)
+        self.data = Video._data
+        Video._data = {}
+        self.reconciler = Reconciler()
+        self.dropped = []
+        self.reconciler.drop = self.dropped.append
+
+    def tearDown(self):
+        Video._data = self.data
+        Providers.disable(self.Provider.identifier)
+        del Providers.all()[self.Provider.identifier]
+
+    def test_orphan_publisher(self):
+        streams = [StreamStat('TESTREC1', 1, True, 0),
+                   StreamStat('M_1', 1, True, 0)]
+        self.reconciler.update(streams)
+        # Not dropped before a second update confirms it.
+        self.assertEqual(self.dropped, [])
+        self.reconciler.update(streams)
+        self.assertEqual(self.dropped, ['TESTREC1'])
+
+        # Publishers of streams without a provider are left alone.
+        self.reconciler.update(streams)
+        self.reconciler.update(streams, confirm=False)
+        self.assertNotIn('M_1', self.dropped)
+
+    def test_publish_timeout(self):
+        proc = FakeProc(10)
+        Video._data['TESTREC1'] = RunningStream('TESTREC1', proc)
+        self.reconciler.update([])
+        pid, since = self.reconciler.waiting['TESTREC1']
+        self.assertEqual(pid, 10)
+
+        # Still starting.
+        timeout = self.reconciler.publish_timeout
+        self.reconciler.waiting['TESTREC1'] = (10, since - timeout + 5)
+        self.reconciler.update([])
+        self.assertFalse(proc.killed)
+
+        self.reconciler.waiting['TESTREC1'] = (10, since - timeout)
+        self.reconciler.update([])
+        self.assertTrue(proc.killed)
+        self.assertNotIn('TESTREC1', self.reconciler.waiting)
+
+
+if __name__ == '__main__':
+    unittest.main()
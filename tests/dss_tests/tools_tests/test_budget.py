@@ -0,0 +1,47 @@
+# coding: utf-8
+import unittest
+from dss.tools import thread
+from dss.tools.budget import ByteBudget, BudgetExceeded
+
+
+class ByteBudgetTest(unittest.TestCase):
+
+    def test_limits(self):
+        total = ByteBudget(15, 25, name='total')
+        a = ByteBudget(5, 10, parent=total)
+        b = ByteBudget(5, 20, parent=total)
+
+        a.add(8)
+        self.assertTrue(a.over_soft_limit)
+        self.assertFalse(b.over_soft_limit)
+        self.assertRaises(BudgetExceeded, a.add, 3)  # Stream hard limit
+        self.assertEqual(a.used, 8)
+        self.assertEqual(a.dropped, 1)
+
+        b.add(16)
+        self.assertTrue(b.over_soft_limit)  # Global soft limit
+        self.assertRaises(BudgetExceeded, b.add, 2)  # Global hard limit
+        self.assertEqual(total.used, 24)
+        self.assertEqual(total.dropped, 2)
+
+        b.remove(10)
+        a.close()
+        self.assertEqual(total.used, 6)
+        self.assertEqual(total.peak, 24)
+        self.assertEqual(total.total, 24)
+        self.assertFalse(a.over_soft_limit)
+
+    def test_wait(self):
+        total = ByteBudget(100, 100)
+        budget = ByteBudget(5, 20, parent=total)
+
+        self.assertTrue(budget.wait(0))
+        budget.add(10)
+        self.assertFalse(budget.wait(0.01))
+
+        timer = thread.Timer(0.01, budget.remove, args=(6,))
+        timer.start()
+        self.assertTrue(budget.wait(5))
+        timer.join()
+        self.assertEqual(budget.throttled, 2)
+        self.assertEqual(total.throttled, 2)
@@ -22,6 +22,20 @@ class DummySocket(object):
         return self.message * n
 
 
+class StreamSocket(object):
+    """ Socket returning a fixed content in random sized chunks.
+    """
+    def __init__(self, content):
+        self.content = content
+        self.pos = 0
+
+    def recv_into(self, buff, k):
+        n = min(k, random.randrange(1, 20), len(self.content) - self.pos)
+        buff[:n] = self.content[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
 class BufferTest(unittest.TestCase):
     def test_buffer_read(self):
         # Simple read
@@ -53,5 +67,22 @@ class BufferTest(unittest.TestCase):
         self.assertNotEqual(len(data), to_read)
         self.assertRaises(buffer.SocketClosedError, lambda: buff.read(to_read, True))
 
+    def test_buffer_read_into(self):
+        content = bytes(bytearray(range(256))) * 4
+        buff = buffer.Buffer(StreamSocket(content), read_size=16)
 
+        # Small reads go through the internal buffer and large ones
+        # are received directly on the destination.
+        pos = 0
+        for size in [5, 3, 100, 1, 16, 200, 7]:
+            data = bytearray(size)
+            self.assertEqual(buff.read_into(data), size)
+            self.assertEqual(data, content[pos:pos + size])
+            pos += size
 
+        # Socket closing before the end
+        data = bytearray(len(content))
+        self.assertEqual(buff.read_into(data), len(content) - pos)
+        self.assertEqual(data[:len(content) - pos], content[pos:])
+        self.assertRaises(buffer.SocketClosedError,
+                          lambda: buff.read_into(data, True))
@@ -0,0 +1,95 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent import futures
+from dss.tools.cache import LRUCache, FileCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 4)
+        self.assertEqual(cache.get('a'), 'A')  # "b" is now the oldest
+        cache.put('c', 'C', 4)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.size, 8)
+
+        cache.put('big', 'X', 11)
+        self.assertNotIn('big', cache)
+        cache.put('a', 'A2', 1)
+        self.assertEqual(cache.size, 5)
+        self.assertEqual(cache.metric()['evictions'], 1)
+
+
+class FileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, 'a.jpg')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data, mtime):
+        with open(self.name, 'wb') as f:
+            f.write(data)
+        os.utime(self.name, (mtime, mtime))
+
+    def test_revalidate(self):
+        cache = FileCache(100, revalidate=0)
+        self.assertIsNone(cache.get(self.name))
+
+        self.write(b'first', 1000)
+        entry = cache.get(self.name)
+        self.assertEqual(entry.data, b'first')
+        self.assertIs(cache.get(self.name), entry)
+
+        self.write(b'second', 2000)
+        second = cache.get(self.name)
+        self.assertEqual(second.data, b'second')
+        self.assertNotEqual(second.etag, entry.etag)
+
+        os.remove(self.name)
+        self.assertIsNone(cache.get(self.name))
+
+    def test_refresh(self):
+        cache = FileCache(100)
+        self.write(b'data', 1000)
+        cache.refresh(self.name)
+        self.assertNotIn(self.name, cache.lru)  # Not requested yet
+        cache.get(self.name)
+        cache.refresh(self.name, b'new')
+        self.assertEqual(cache.get(self.name).data, b'new')
+
+    def test_missing(self):
+        cache = FileCache(100, revalidate=60)
+        self.assertIsNone(cache.get(self.name))
+        self.assertTrue(cache.fresh(self.name))
+        # Not found is remembered until revalidated.
+        self.write(b'data', 1000)
+        self.assertIsNone(cache.get(self.name))
+        cache.missing.put(self.name, 0, 1)
+        self.assertEqual(cache.get(self.name).data, b'data')
+
+        # A written file is found at once.
+        cache.pop(self.name)
+        os.remove(self.name)
+        self.assertIsNone(cache.get(self.name))
+        cache.refresh(self.name)
+        self.assertFalse(cache.fresh(self.name))
+
+    def test_prepare(self):
+        executor = futures.ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+        cache = FileCache(100, revalidate=60, executor=executor)
+        self.write(b'data', 1000)
+        self.assertIsNone(cache.get(self.name, check=False))
+        future = cache.prepare(self.name)
+        self.assertEqual(future.result(5).data, b'data')
+        self.assertIsNone(cache.prepare(self.name))
+        self.assertEqual(cache.get(self.name, check=False).data, b'data')
@@ -0,0 +1,30 @@
+# coding: utf-8
+import unittest
+from dss.tools import ffmpeg
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_single_output(self):
+        template = ffmpeg.Template('-re -loop 1', '-an -vf "drawtext=text=a b" -f flv')
+        self.assertEqual(
+            template('input', 'output'),
+            ffmpeg.cmd('-re -loop 1', 'input',
+                       '-an -vf "drawtext=text=a b" -f flv', 'output')
+        )
+        # Commands don't share the cached lists.
+        template('input', 'output').append('x')
+        self.assertEqual(template('a', 'b')[-1], 'b')
+
+    def test_multiple_outputs(self):
+        template = ffmpeg.Template('-y', '-an', ['', '-s 320x240'])
+        self.assertEqual(
+            template('input', 'big.jpg', 'small.jpg'),
+            ffmpeg.cmd_outputs('-y', 'input', '-an', ['', '-s 320x240'],
+                               ['big.jpg', 'small.jpg'])
+        )
+        self.assertEqual(
+            ffmpeg.Template(None, '-an', ['', '-s 320x240']).outputs('a', 'b'),
+            ['-an', 'a', '-an', '-s', '320x240', 'b']
+        )
+        self.assertRaises(ValueError, template, 'input', 'big.jpg')
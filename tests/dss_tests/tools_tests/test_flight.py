@@ -0,0 +1,52 @@
+# coding: utf-8
+import threading
+import unittest
+from concurrent import futures
+from dss.tools.flight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = futures.ThreadPoolExecutor(2)
+        self.flight = SingleFlight(self.executor)
+        self.release = threading.Event()
+        self.calls = []
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def load(self, key):
+        self.calls.append(key)
+        self.release.wait(5)
+        return key.upper()
+
+    def test_shared(self):
+        a = self.flight.run('a', self.load, 'a')
+        b = self.flight.run('a', self.load, 'a')
+        other = self.flight.run('b', self.load, 'b')
+        self.assertIs(a, b)
+        self.assertIsNot(a, other)
+        self.assertEqual(len(self.flight), 2)
+
+        self.release.set()
+        self.assertEqual(a.result(5), 'A')
+        self.assertEqual(other.result(5), 'B')
+        self.assertEqual(sorted(self.calls), ['a', 'b'])
+        self.assertEqual(len(self.flight), 0)
+
+        # Finished calls run again.
+        self.assertEqual(self.flight.run('a', self.load, 'a').result(5), 'A')
+        self.assertEqual(len(self.calls), 3)
+
+    def test_error(self):
+        def fail():
+            raise ValueError('failed')
+        future = self.flight.run('x', fail)
+        self.assertRaises(ValueError, future.result, 5)
+        self.assertEqual(len(self.flight), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
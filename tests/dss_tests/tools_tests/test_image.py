@@ -0,0 +1,31 @@
+# coding: utf-8
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from dss.tools import image
+
+
+@unittest.skipIf(image.Image is None, 'Pillow is not installed')
+class SaveSizesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_sizes(self):
+        frame = io.BytesIO()
+        image.Image.new('RGB', (640, 480), 'red').save(frame, format='PPM')
+        outputs = [os.path.join(self.dir, name)
+                   for name in ('a.jpg', 'a-medium.jpg', 'a-small.png')]
+
+        image.save_sizes(frame.getvalue(), outputs, ['320x240', '176x132'])
+
+        sizes = [image.Image.open(name).size for name in outputs]
+        self.assertEqual(sizes, [(640, 480), (320, 240), (176, 132)])
+        self.assertEqual(image.Image.open(outputs[2]).format, 'PNG')
+        # No temporary files left
+        self.assertEqual(len(os.listdir(self.dir)), 3)
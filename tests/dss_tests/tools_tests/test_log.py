@@ -0,0 +1,102 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from dss.tools import log
+
+
+class WriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.writer = log.Writer(os.path.join(self.dir, 'test.log'))
+
+    def tearDown(self):
+        self.writer.stop()
+        shutil.rmtree(self.dir)
+
+    def read(self, name='test.log'):
+        with open(os.path.join(self.dir, name)) as f:
+            return f.read().splitlines()
+
+    def test_write(self):
+        self.writer.add(time.time(), 'Test', log.Levels.info,
+                        log.message(('a', 1), '-'))
+        self.writer.add(time.time(), 'Test', log.Levels.warn, 'b')
+        self.writer.stop()
+        lines = self.read()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith('[Test] info: a-1'))
+        self.assertTrue(lines[1].endswith('[Test] warn: b'))
+
+    def test_rotate_and_drop(self):
+        self.writer.max_size = 1
+        self.writer.backups = 2
+        for message in 'abcd':
+            self.writer.add(time.time(), None, log.Levels.info, message)
+            while self.writer.written < 'abcd'.index(message) + 1:
+                time.sleep(0.001)
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['test.log', 'test.log.1', 'test.log.2'])
+        self.assertTrue(self.read()[0].endswith('d'))
+        self.assertTrue(self.read('test.log.2')[0].endswith('b'))
+
+        # Full queue: messages are dropped and counted on the log.
+        writer = log.Writer(os.path.join(self.dir, 'drop.log'))
+        writer.queue.maxsize = 2
+        written = threading.Event()
+        write = writer.write
+
+        def slow_write(records, dropped):
+            written.wait(5)
+            write(records, dropped)
+        writer.write = slow_write
+
+        for _ in range(10):
+            writer.add(time.time(), None, log.Levels.info, 'x')
+        self.assertTrue(writer.dropped > 0)
+        written.set()
+        writer.stop()
+        self.assertIn('messages dropped', self.read('drop.log')[-1])
+
+    def test_message_at_call_time(self):
+        class Broken(object):
+            def __str__(self):
+                raise ValueError('broken')
+
+        state = ['before']
+        logger = log.Log('Test', 'unused.log')
+        logger.writer = self.writer
+        logger.log_args((state,))
+        state[0] = 'after'
+        logger.log_args(('x', Broken()))
+        self.writer.stop()
+        lines = self.read()
+        self.assertTrue(lines[0].endswith("['before']"))
+        self.assertIn('Broken not printable', lines[1])
+
+    def test_format_error(self):
+        # A bad record doesn't lose the others of the batch.
+        self.writer.add(time.time(), 'Test', 'no level', 'a')
+        self.writer.add(time.time(), 'Test', log.Levels.info, 'b')
+        self.writer.stop()
+        lines = self.read()
+        self.assertIn('Could not format a message', lines[0])
+        self.assertTrue(lines[1].endswith('[Test] info: b'))
+
+    def test_rotate_error(self):
+        self.writer.max_size = 1
+        self.writer.backups = 1
+        self.writer.add(time.time(), None, log.Levels.info, 'a')
+        while self.writer.written < 1:
+            time.sleep(0.001)
+        os.mkdir(os.path.join(self.dir, 'test.log.1'))  # Can't rename
+        self.writer.add(time.time(), None, log.Levels.info, 'b')
+        self.writer.add(time.time(), None, log.Levels.info, 'c')
+        self.writer.stop()
+        lines = self.read()
+        self.assertTrue(lines[-2].endswith('b'))
+        self.assertTrue(lines[-1].endswith('c'))
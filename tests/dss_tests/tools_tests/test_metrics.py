@@ -0,0 +1,34 @@
+# coding: utf-8
+import unittest
+from dss.tools.metrics import Exposition, Histogram
+
+
+class ExpositionTest(unittest.TestCase):
+
+    def test_render(self):
+        histogram = Histogram([1, 5])
+        for value in [0.5, 1, 3, 10]:
+            histogram.observe(value)
+
+        out = Exposition()
+        out.add('dss_streams', 'gauge', 'Streams', [({}, 2)])
+        out.add('dss_clients', 'gauge', 'Clients',
+                [({'id': 'C1'}, 3), ({'id': 'a"b'}, True)])
+        out.histogram('dss_warmup_seconds', 'Warmup', histogram)
+
+        self.assertEqual(out.render().splitlines(), [
+            '# HELP dss_streams Streams',
+            '# TYPE dss_streams gauge',
+            'dss_streams 2',
+            '# HELP dss_clients Clients',
+            '# TYPE dss_clients gauge',
+            'dss_clients{id="C1"} 3',
+            'dss_clients{id="a\\"b"} 1',
+            '# HELP dss_warmup_seconds Warmup',
+            '# TYPE dss_warmup_seconds histogram',
+            'dss_warmup_seconds_bucket{le="1.0"} 2',
+            'dss_warmup_seconds_bucket{le="5.0"} 3',
+            'dss_warmup_seconds_bucket{le="+Inf"} 4',
+            'dss_warmup_seconds_sum 14.5',
+            'dss_warmup_seconds_count 4',
+        ])
@@ -0,0 +1,58 @@
+# coding: utf-8
+import unittest
+from dss.tools.noxml import PathParser
+
+STAT = b'''<?xml version="1.0" encoding="utf-8" ?>
+<rtmp><server>
+<application><name>other</name><live>
+<stream><name>x</name><nclients>9</nclients></stream>
+</live></application>
+<application><name>dss</name><live>
+<stream><name>cam1</name><bw_in>1024</bw_in>
+<client><id>1</id></client><client><id>2</id></client>
+<nclients>2</nclients><publishing/><active/></stream>
+<stream><name>cam2</name><nclients>1</nclients></stream>
+</live></application>
+</server></rtmp>
+'''
+
+
+class PathParserTest(unittest.TestCase):
+
+    def parse(self, chunk_size):
+        parser = PathParser([('application', 'name'), ('live', 'stream')])
+        found = []
+
+        def take(elements):
+            for path, element in elements:
+                found.append((path[-1], element.findtext('name') or
+                              element.text, element.findtext('nclients')))
+
+        for ix in range(0, len(STAT), chunk_size):
+            take(parser.feed(STAT[ix:ix + chunk_size]))
+        take(parser.close())
+        return found
+
+    def test_chunks(self):
+        expected = [
+            ('name', 'other', None),
+            ('stream', 'x', '9'),
+            ('name', 'dss', None),
+            ('stream', 'cam1', '2'),
+            ('stream', 'cam2', '1'),
+        ]
+        self.assertEqual(self.parse(len(STAT)), expected)
+        self.assertEqual(self.parse(7), expected)
+
+    def test_clear(self):
+        parser = PathParser([('live', 'stream')])
+        elements = [e for _, e in parser.feed(STAT)] + \
+            [e for _, e in parser.close()]
+        self.assertEqual(len(elements), 3)
+        # Only the last element taken keeps its children.
+        self.assertEqual(len(elements[1]), 0)
+        self.assertEqual(elements[2].findtext('name'), 'cam2')
+
+
+if __name__ == '__main__':
+    unittest.main()
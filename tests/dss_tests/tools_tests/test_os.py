@@ -0,0 +1,79 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from dss.tools import os as dss_os
+
+
+class WriteAllTest(unittest.TestCase):
+
+    def setUp(self):
+        self.read, self.write = os.pipe()
+
+    def tearDown(self):
+        os.close(self.read)
+        os.close(self.write)
+
+    def test_write_all(self):
+        buffers = [b'abc', bytearray(b'de'), b'', b'f' * 100]
+        calls = dss_os.write_all(self.write, buffers)
+        self.assertEqual(calls, 1)
+        self.assertEqual(os.read(self.read, 1000), b'abcde' + b'f' * 100)
+
+    def test_many_buffers(self):
+        count = dss_os.IOV_MAX * 2 + 1
+        calls = dss_os.write_all(self.write, [b'x'] * count)
+        self.assertEqual(os.read(self.read, count + 1), b'x' * count)
+        if hasattr(os, 'writev'):
+            self.assertEqual(calls, 3)
+
+    @unittest.skipUnless(hasattr(os, 'writev'), 'os.writev not available')
+    def test_partial_write(self):
+        writev = os.writev
+
+        def short_writev(fd, buffers):
+            # Write at most 3 bytes per call
+            data = b''.join(bytes(b) for b in buffers)[:3]
+            return writev(fd, [data])
+
+        os.writev = short_writev
+        try:
+            calls = dss_os.write_all(self.write, [b'ab', b'cdef', b'g'])
+        finally:
+            os.writev = writev
+        self.assertEqual(calls, 3)
+        self.assertEqual(os.read(self.read, 100), b'abcdefg')
+
+
+class DirectoryCleanerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def touch(self, name, old=False):
+        name = os.path.join(self.dir, name)
+        open(name, 'w').close()
+        if old:
+            os.utime(name, (1000, 1000))
+
+    def test_sweep(self):
+        for name in ['a.jpg', 'a-small.jpg', 'b-small.jpg', '.a.jpg123',
+                     'c.jpg.tmp', 'other.txt']:
+            self.touch(name, old=True)
+        for name in ['c.jpg', 'c-small.jpg', 'd-small.jpg', '.d.jpg456']:
+            self.touch(name)
+
+        removed = []
+        cleaner = dss_os.DirectoryCleaner(
+            self.dir, '.jpg', ['-small'], max_age=60, batch=2,
+            on_delete=lambda id, path: removed.append(os.path.basename(path))
+        )
+        self.assertIsNone(cleaner.step())
+        self.assertEqual(cleaner.sweep(), set(['a', 'b']))
+        self.assertEqual(sorted(removed), ['a-small.jpg', 'a.jpg', 'b-small.jpg'])
+        self.assertEqual(sorted(os.listdir(self.dir)), [
+            '.d.jpg456', 'c-small.jpg', 'c.jpg', 'd-small.jpg', 'other.txt'])
@@ -0,0 +1,51 @@
+# coding: utf-8
+import subprocess
+import sys
+import unittest
+from dss.tools import thread
+from dss.tools.reactor import Reactor
+
+
+class ReactorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor('Test')
+        self.cond = thread.Condition()
+        self.calls = []
+
+    def tearDown(self):
+        self.reactor.stop()
+
+    def call(self, value):
+        with self.cond:
+            self.calls.append(value)
+            self.cond.notify_all()
+
+    def wait_calls(self, amount):
+        with self.cond:
+            return self.cond.wait_for(lambda: len(self.calls) >= amount, 5)
+
+    def test_timers(self):
+        self.reactor.call_later(0.03, self.call, 3)
+        cancelled = self.reactor.call_later(0.02, self.call, 'cancelled')
+        self.reactor.call_later(0.01, self.call, 1)
+        self.reactor.call_soon(self.call, 0)
+        self.reactor.cancel(cancelled)
+
+        self.assertTrue(self.wait_calls(3))
+        self.assertEqual(self.calls, [0, 1, 3])
+        self.assertEqual(self.reactor.count(), (0, 0))
+
+    def test_watch(self):
+        proc = subprocess.Popen([sys.executable, '-c', 'exit(3)'])
+        self.reactor.watch(proc, lambda p: self.call(p.returncode))
+        self.assertTrue(self.wait_calls(1))
+        self.assertEqual(self.calls, [3])
+
+        # Without pidfd, processes are polled.
+        self.reactor.use_pidfd = False
+        self.reactor.poll_interval = 0.01
+        proc = subprocess.Popen([sys.executable, '-c', 'exit(4)'])
+        self.reactor.watch(proc, lambda p: self.call(p.returncode))
+        self.assertTrue(self.wait_calls(2))
+        self.assertEqual(self.calls, [3, 4])
@@ -0,0 +1,55 @@
+# coding: utf-8
+import threading
+import unittest
+from concurrent import futures
+from dss.tools.serial import SerialExecutor
+
+
+class SerialExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = futures.ThreadPoolExecutor(2)
+        self.release = threading.Event()
+        self.calls = []
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def call(self, value, wait=False):
+        if wait:
+            self.release.wait(5)
+        self.calls.append(value)
+        return value
+
+    def test_order(self):
+        serial = SerialExecutor(self.executor)
+        results = [serial.submit(self.call, ix, wait=ix == 0)
+                   for ix in range(20)]
+        self.release.set()
+        self.assertEqual([f.result(5) for f in results], list(range(20)))
+        self.assertEqual(self.calls, list(range(20)))
+
+    def test_independent(self):
+        # A blocked serial executor doesn't hold the others.
+        slow = SerialExecutor(self.executor)
+        fast = SerialExecutor(self.executor)
+        blocked = slow.submit(self.call, 'slow', wait=True)
+        slow.submit(self.call, 'after')
+        self.assertEqual(fast.submit(self.call, 'fast').result(5), 'fast')
+        self.assertFalse(blocked.done())
+        self.release.set()
+        self.assertEqual(blocked.result(5), 'slow')
+
+    def test_error(self):
+        serial = SerialExecutor(self.executor)
+
+        def fail():
+            raise ValueError('failed')
+        future = serial.submit(fail)
+        self.assertRaises(ValueError, future.result, 5)
+        self.assertEqual(serial.submit(self.call, 1).result(5), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# coding: utf-8
+import time
+import unittest
+from dss.tools import thread
+from dss.tools.reactor import Reactor
+from dss.tools.wheel import TimerWheel
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor('Test')
+        self.cond = thread.Condition()
+        self.expired = []
+
+    def tearDown(self):
+        self.reactor.stop()
+
+    def expire(self, key):
+        with self.cond:
+            self.expired.append((key, time.time()))
+            self.cond.notify_all()
+
+    def test_schedule(self):
+        wheel = TimerWheel(self.reactor, tick=0.01, size=4)
+        start = time.time()
+        wheel.schedule('a', 0.02, self.expire)
+        wheel.schedule('b', 0.02, self.expire)
+        wheel.schedule('c', 0.1, self.expire)  # More than one round
+        wheel.schedule('b', 0.05, self.expire)  # Renew
+        wheel.schedule('d', 0.01, self.expire)
+        wheel.cancel('d')
+        self.assertEqual(len(wheel), 3)
+        self.assertIn('b', wheel)
+
+        with self.cond:
+            self.assertTrue(self.cond.wait_for(lambda: len(self.expired) == 3, 5))
+        self.assertEqual([x[0] for x in self.expired], ['a', 'b', 'c'])
+        for (key, when), delay in zip(self.expired, [0.02, 0.05, 0.1]):
+            self.assertGreaterEqual(when - start, delay)
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.timer)  # Stopped ticking
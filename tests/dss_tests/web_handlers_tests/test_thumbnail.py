@@ -0,0 +1,65 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+from dss.thumbnail import Thumbnail
+from dss.web_handlers.thumbnail import ThumbnailHandler
+
+
+class ThumbnailHandlerTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.thumb_dir = os.path.join(self.dir, 'thumb')
+        os.mkdir(self.thumb_dir)
+        super(ThumbnailHandlerTest, self).setUp()
+
+    def tearDown(self):
+        super(ThumbnailHandlerTest, self).tearDown()
+        shutil.rmtree(self.dir)
+
+    def get_app(self):
+        class Handler(ThumbnailHandler):
+            _thumb = {'dir': self.thumb_dir, 'format': 'jpg'}
+        return tornado.web.Application([
+            (r'/thumb/([^/.]+)\.?(\w+)?', Handler),
+        ])
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.addCleanup(Thumbnail.cache.pop, path)
+        return path
+
+    def test_get(self):
+        self.write('thumb/C1.jpg', b'image')
+        response = self.fetch('/thumb/C1.jpg')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'image')
+        self.assertEqual(response.headers['Content-Type'], 'image/jpeg')
+
+        response = self.fetch('/thumb/C1.jpg', headers={
+            'If-None-Match': response.headers['Etag']})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(self.fetch('/thumb/C1.png').code, 404)
+
+    def test_traversal(self):
+        # The route matches before "%2E%2E%2F" is decoded to "../".
+        self.write('secret.jpg', b'secret')
+        for url in ('/thumb/%2E%2E%2Fsecret.jpg', '/thumb/%2E%2E%2Fsecret',
+                    '/thumb/C1%0A.jpg'):
+            self.assertEqual(self.fetch(url).code, 404, url)
+
+    def test_missing(self):
+        path = os.path.join(self.thumb_dir, 'C2.jpg')
+        self.addCleanup(Thumbnail.cache.pop, path)
+        self.assertEqual(self.fetch('/thumb/C2.jpg').code, 404)
+        self.assertTrue(Thumbnail.cache.fresh(path))
+
+        # Written by the thumbnail pipeline.
+        self.write('thumb/C2.jpg', b'image')
+        Thumbnail.cache.refresh(path)
+        self.assertEqual(self.fetch('/thumb/C2.jpg').body, b'image')